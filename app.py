@@ -1,6 +1,8 @@
 from chotu_assistant import get_assistant
+import invoice_printer
 from invoice_printer import (
     generate_invoice_pdf,
+    invoice_render_key,
     print_invoice_directly,
     get_available_printers
 )
@@ -8,15 +10,43 @@ import os
 from datetime import datetime as dt, timedelta
 from flask import (
     Flask, render_template, request, redirect, url_for, flash,
-    send_file, jsonify, session, make_response
+    send_file, jsonify, session, Response, stream_with_context, abort
 )
 from flask_sqlalchemy import SQLAlchemy
+from migrations import run_migrations
+import db_profile
+import query_monitor
+import metrics
+import slow_queries
+from settings_cache import SettingsCache
+from data_version import DataVersion
+from page_cache import PageCache
+from pdf_cache import PdfCache, file_digest
+import pdf_jobs
+import importer
+import search as fts
+import matcher
+import paging
+import archive
+from money import to_paise, from_paise, format_rupees, rupee_property
+from dates import (
+    parse_date, month_bounds, format_date, financial_year, financial_year_bounds
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import aliased, contains_eager, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.security import generate_password_hash, check_password_hash
 import io
 import csv
 import tempfile
+from contextlib import closing
 import shutil
+import sqlite3
+import json
+import time
+import click
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -26,27 +56,66 @@ load_dotenv(override=True)  # Force reload even if already loaded
 
 app = Flask(__name__)
 app.secret_key = "zankar-vision-2025"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///data.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
+    "DATABASE_URL", "sqlite:///data.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db = SQLAlchemy(app)
 
-INVOICE_DIR = os.path.join(os.path.dirname(__file__), "invoices")
+# WAL, busy_timeout, cache and mmap PRAGMAs on every new connection
+with app.app_context():
+    db_profile.install(db.engine)
+    # Reports and exports read from their own read-only snapshot pool
+    report_engine = db_profile.snapshot_engine(db.engine)
+    # Query count, DB time and N+1 repeats for every request
+    query_monitor.install(app, db.engine, report_engine)
+    # Request latency and DB time per endpoint, served at /metrics
+    metrics.install(app)
+
+INVOICE_DIR = os.getenv(
+    "INVOICE_DIR", os.path.join(os.path.dirname(__file__), "invoices"))
 os.makedirs(INVOICE_DIR, exist_ok=True)
+# Print from the folder PDFs are written to
+invoice_printer.printer.invoice_dir = INVOICE_DIR
+# Every render by content hash; invoices/<number>.pdf links to the current one
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR") or INVOICE_DIR.rstrip(os.sep) + "-cache"
+pdf_cache = PdfCache(PDF_CACHE_DIR)
+# Threads rendering and auto-printing saved bills; 0 leaves jobs queued
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", pdf_jobs.WORKERS))
+
+# Closed financial years are archived to files next to the database
+with app.app_context():
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or os.path.join(
+        os.path.dirname(db.engine.url.database), "archive")
+    # Replaced on every settings write so other processes reload theirs
+    SETTINGS_STAMP = db.engine.url.database + ".settings-stamp"
+    DATA_STAMP = db.engine.url.database + ".data-stamp"
 
 # ---------- MODELS ----------
 
 
 class Customer(db.Model):
+    __table_args__ = (
+        # khata_book: outstanding_balance > 0 ORDER BY outstanding_balance
+        db.Index('ix_customer_outstanding_paise', 'outstanding_balance_paise'),
+        # Name-ordered listings (history dropdown, khata sort)
+        db.Index('ix_customer_name', 'name'),
+        # khata_book: money expected in a month (covers the SUM)
+        db.Index('ix_customer_expected_payment',
+                 'expected_next_payment_date', 'outstanding_balance_paise'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(50), unique=True)
     email = db.Column(db.String(120), unique=True)
     address = db.Column(db.Text)
     gstin = db.Column(db.String(20))
-    outstanding_balance = db.Column(db.Float, default=0.0)
+    outstanding_balance_paise = db.Column(db.Integer, default=0)
+    outstanding_balance = rupee_property('outstanding_balance_paise')
     credit_limit = db.Column(db.Float, default=0.0)
-    last_payment_date = db.Column(db.String(20))
-    expected_next_payment_date = db.Column(db.String(20))
+    last_payment_date = db.Column(db.Date)
+    expected_next_payment_date = db.Column(db.Date)
+    created_on = db.Column(db.Date, default=lambda: dt.now().date())
 
     def to_dict(self):
         return {
@@ -58,8 +127,9 @@ class Customer(db.Model):
             'gstin': self.gstin,
             'outstanding_balance': self.outstanding_balance,
             'credit_limit': self.credit_limit,
-            'last_payment_date': self.last_payment_date,
-            'expected_next_payment_date': self.expected_next_payment_date
+            'last_payment_date': format_date(self.last_payment_date),
+            'expected_next_payment_date': format_date(
+                self.expected_next_payment_date)
         }
 
 
@@ -85,26 +155,61 @@ class Product(db.Model):
 
 
 class Invoice(db.Model):
+    __table_args__ = (
+        # Per-customer lookups; covers COUNT/SUM(total) and date span
+        db.Index('ix_invoice_customer_date_total_paise',
+                 'customer_id', 'invoice_date', 'total_paise'),
+        # invoice_history date ranges and (date, id) ordering
+        db.Index('ix_invoice_date_id', 'invoice_date', 'id'),
+        # invoice_history amount filters and sorting
+        db.Index('ix_invoice_total_paise', 'total_paise'),
+        # Ids of archived bills are never handed out again (archive.py)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(50), unique=True)
     customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"))
-    invoice_date = db.Column(db.String(20))
-    due_date = db.Column(db.String(20))
+    invoice_date = db.Column(db.Date)
+    due_date = db.Column(db.Date)
     terms = db.Column(db.String(50))
     salesperson = db.Column(db.String(120))
     notes = db.Column(db.Text)
     discount_type = db.Column(db.String(120))
-    discount_amount = db.Column(db.Float, default=0.0)
-    total = db.Column(db.Float)
+    discount_amount_paise = db.Column(db.Integer, default=0)
+    total_paise = db.Column(db.Integer, default=0)
     payment_status = db.Column(db.String(50),
                                default='unpaid')  # 'unpaid', 'partial', 'paid'
-    total_paid = db.Column(db.Float, default=0.0)
+    total_paid_paise = db.Column(db.Integer, default=0)
     customer = db.relationship("Customer", backref="invoices")
 
+    discount_amount = rupee_property('discount_amount_paise')
+    total = rupee_property('total_paise')
+    total_paid = rupee_property('total_paid_paise')
+
+    @hybrid_property
+    def remaining_paise(self):
+        """Unpaid amount in paise (total - total_paid)"""
+        return (self.total_paise or 0) - (self.total_paid_paise or 0)
+
+    @remaining_paise.expression
+    def remaining_paise(cls):
+        return cls.total_paise - cls.total_paid_paise
+
     @property
     def remaining_balance(self):
         """Calculate remaining balance (total - total_paid)"""
-        return self.total - (self.total_paid or 0)
+        return from_paise(self.remaining_paise)
+
+    def update_payment_status(self):
+        """Derive payment_status from the exact paise totals"""
+        paid = self.total_paid_paise or 0
+        if paid <= 0:
+            self.payment_status = 'unpaid'
+        elif paid >= (self.total_paise or 0):
+            self.payment_status = 'paid'
+        else:
+            self.payment_status = 'partial'
 
     def to_dict(self):
         return {
@@ -112,8 +217,8 @@ class Invoice(db.Model):
             'number': self.number,
             'customer_id': self.customer_id,
             'customer_name': self.customer.name if self.customer else None,
-            'invoice_date': self.invoice_date,
-            'due_date': self.due_date,
+            'invoice_date': format_date(self.invoice_date),
+            'due_date': format_date(self.due_date),
             'terms': self.terms,
             'salesperson': self.salesperson,
             'notes': self.notes,
@@ -122,11 +227,16 @@ class Invoice(db.Model):
             'total': self.total,
             'payment_status': self.payment_status,
             'total_paid': self.total_paid,
-            'remaining_balance': self.total - self.total_paid
+            'remaining_balance': self.remaining_balance
         }
 
 
 class InvoiceItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_invoice_item_invoice_id', 'invoice_id'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey("invoice.id"))
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
@@ -134,7 +244,8 @@ class InvoiceItem(db.Model):
     price = db.Column(db.Float)
     discount_amount = db.Column(db.Float, default=0.0)
     tax = db.Column(db.Float, default=0.0)
-    line_total = db.Column(db.Float)
+    line_total_paise = db.Column(db.Integer)
+    line_total = rupee_property('line_total_paise')
     description = db.Column(db.Text)  # Add description field
     product = db.relationship("Product")
     invoice = db.relationship("Invoice", backref="invoice_items")
@@ -155,10 +266,17 @@ class InvoiceItem(db.Model):
 
 
 class Payment(db.Model):
+    __table_args__ = (
+        # Payments of an invoice, newest first (khata, invoice payments)
+        db.Index('ix_payment_invoice_date', 'invoice_id', 'payment_date'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey("invoice.id"))
-    amount = db.Column(db.Float)
-    payment_date = db.Column(db.String(20))
+    amount_paise = db.Column(db.Integer)
+    amount = rupee_property('amount_paise')
+    payment_date = db.Column(db.Date)
     # 'cash', 'card', 'bank_transfer', 'cheque'
     payment_method = db.Column(db.String(50))
     reference_number = db.Column(db.String(100))
@@ -171,7 +289,7 @@ class Payment(db.Model):
             'id': self.id,
             'invoice_id': self.invoice_id,
             'amount': self.amount,
-            'payment_date': self.payment_date,
+            'payment_date': format_date(self.payment_date),
             'payment_method': self.payment_method,
             'reference_number': self.reference_number,
             'notes': self.notes,
@@ -179,6 +297,391 @@ class Payment(db.Model):
         }
 
 
+def invoice_document_options():
+    """Loader options for showing or printing a whole invoice: the customer
+    is joined in and the items come with their products in one more
+    SELECT, so the query count does not grow with the number of items"""
+    return (joinedload(Invoice.customer),
+            selectinload(Invoice.invoice_items).joinedload(InvoiceItem.product))
+
+
+def load_invoice_document(invoice_id):
+    """Invoice with everything its page or PDF reads already loaded.
+
+    populate_existing refreshes an instance the session already holds (the
+    bill just saved, say) and applies the options to it as well.
+    """
+    return (db.session.query(Invoice)
+            .options(*invoice_document_options())
+            .populate_existing()
+            .filter(Invoice.id == invoice_id)
+            .one())
+
+
+class CustomerStats(db.Model):
+    """Lifetime purchase aggregates per customer.
+
+    Updated in the same transaction as every invoice write, so the
+    customers page and export read one row per customer instead of
+    loading each customer's invoices.
+    """
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"),
+                            primary_key=True)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    total_spent_paise = db.Column(db.Integer, nullable=False, default=0)
+    first_purchase = db.Column(db.Date)
+    last_purchase = db.Column(db.Date)
+    customer = db.relationship(
+        "Customer",
+        backref=db.backref("stats", uselist=False,
+                           cascade="all, delete-orphan"))
+
+    total_spent = rupee_property('total_spent_paise')
+
+    @property
+    def avg_order_value(self):
+        if not self.invoice_count:
+            return 0
+        return from_paise(self.total_spent_paise) / self.invoice_count
+
+    @classmethod
+    def record_invoice(cls, customer_id, total_paise, invoice_date=None):
+        """Count a new invoice for a customer (UPSERT, no read needed)"""
+        if not customer_id:
+            return
+        table = cls.__table__
+        stmt = sqlite_insert(table).values(
+            customer_id=customer_id,
+            invoice_count=1,
+            total_spent_paise=total_paise or 0,
+            first_purchase=invoice_date,
+            last_purchase=invoice_date)
+        new = stmt.excluded
+        # SQLite's scalar min()/max() return NULL if either side is NULL
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.customer_id],
+            set_={
+                'invoice_count': table.c.invoice_count + 1,
+                'total_spent_paise': (
+                    table.c.total_spent_paise + new.total_spent_paise),
+                'first_purchase': db.func.coalesce(
+                    db.func.min(table.c.first_purchase, new.first_purchase),
+                    table.c.first_purchase, new.first_purchase),
+                'last_purchase': db.func.coalesce(
+                    db.func.max(table.c.last_purchase, new.last_purchase),
+                    table.c.last_purchase, new.last_purchase),
+            })
+        db.session.execute(stmt)
+
+    @classmethod
+    def record_total_change(cls, customer_id, delta_paise):
+        """Apply a change to an existing invoice's total"""
+        if not customer_id or not delta_paise:
+            return
+        table = cls.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.customer_id == customer_id)
+            .values(total_spent_paise=table.c.total_spent_paise + delta_paise))
+
+    @classmethod
+    def refresh(cls, customer_id):
+        """Recompute one customer's row from invoices (after deletes).
+
+        A single aggregate over ix_invoice_customer_date_total_paise
+        (and the same index in each archived year).
+        """
+        if not customer_id:
+            return
+        db.session.flush()
+        invoice = with_archives(Invoice, ArchivedYear.query.all())
+        count, total, first, last = db.session.query(
+            db.func.count(invoice.id),
+            db.func.coalesce(db.func.sum(invoice.total_paise), 0),
+            db.func.min(invoice.invoice_date),
+            db.func.max(invoice.invoice_date)
+        ).filter(invoice.customer_id == customer_id).one()
+        table = cls.__table__
+        stmt = sqlite_insert(table).values(
+            customer_id=customer_id, invoice_count=count,
+            total_spent_paise=total, first_purchase=first, last_purchase=last)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.customer_id],
+            set_={name: stmt.excluded[name] for name in (
+                'invoice_count', 'total_spent_paise',
+                'first_purchase', 'last_purchase')})
+        db.session.execute(stmt)
+
+
+class LedgerEntry(db.Model):
+    """Append-only khata line: a debit (bill) or credit (payment).
+
+    Rows are never updated or deleted; corrections are new entries. Each
+    row stores the customer's balance after it, and
+    Customer.outstanding_balance_paise always equals the latest one, so
+    the current balance is a column read. Statements go by entry_date, so
+    a back-dated bill or payment lands in the period it belongs to and
+    their balances are sums over an index range.
+    """
+    __table_args__ = (
+        # Statements: entries of a customer in date order / date range
+        db.Index('ix_ledger_customer_entry', 'customer_id', 'entry_date', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"),
+                            nullable=False)
+    # Day the entry was written; never decreases with id
+    posted_on = db.Column(db.Date, nullable=False)
+    # Business date (bill or payment date, else the day written) that
+    # statements and the daily summary go by
+    entry_date = db.Column(db.Date)
+    # 'invoice', 'invoice_adjustment', 'invoice_void', 'payment',
+    # 'payment_reversal', 'advance', 'opening'
+    kind = db.Column(db.String(30), nullable=False)
+    debit_paise = db.Column(db.Integer, nullable=False, default=0)
+    credit_paise = db.Column(db.Integer, nullable=False, default=0)
+    balance_paise = db.Column(db.Integer, nullable=False)
+    # Plain ids (no FK) so entries outlive deleted invoices and payments
+    invoice_id = db.Column(db.Integer)
+    payment_id = db.Column(db.Integer)
+    memo = db.Column(db.String(200))
+
+    debit = rupee_property('debit_paise')
+    credit = rupee_property('credit_paise')
+    balance = rupee_property('balance_paise')
+
+    @classmethod
+    def post(cls, customer_id, kind, debit_paise=0, credit_paise=0,
+             entry_date=None, invoice_id=None, payment_id=None, memo=None):
+        """Append an entry and move the customer's cached balance.
+
+        The balance UPDATE takes SQLite's write lock before the new running
+        balance is read back, so concurrent posts cannot interleave.
+        """
+        if not customer_id or (not debit_paise and not credit_paise):
+            return None
+        balance = db.session.execute(
+            db.update(Customer)
+            .where(Customer.id == customer_id)
+            .values(outstanding_balance_paise=(
+                db.func.coalesce(Customer.outstanding_balance_paise, 0)
+                + (debit_paise or 0) - (credit_paise or 0)))
+            .returning(Customer.outstanding_balance_paise)
+            .execution_options(synchronize_session='fetch')
+        ).scalar()
+        if balance is None:
+            return None
+        entry_date = entry_date or dt.now().date()
+        DailySummary.bump(entry_date, outstanding_change_paise=(
+            (debit_paise or 0) - (credit_paise or 0)))
+        entry = cls(
+            customer_id=customer_id,
+            posted_on=dt.now().date(),
+            entry_date=entry_date,
+            kind=kind,
+            debit_paise=debit_paise or 0,
+            credit_paise=credit_paise or 0,
+            balance_paise=balance,
+            invoice_id=invoice_id,
+            payment_id=payment_id,
+            memo=memo)
+        db.session.add(entry)
+        return entry
+
+    @classmethod
+    def post_invoice_change(cls, invoice, delta_paise, kind='invoice_adjustment'):
+        """Debit (or credit) a change in an invoice's total"""
+        if delta_paise > 0:
+            return cls.post(invoice.customer_id, kind, debit_paise=delta_paise,
+                            entry_date=invoice.invoice_date,
+                            invoice_id=invoice.id, memo=f"Invoice {invoice.number}")
+        return cls.post(invoice.customer_id, kind, credit_paise=-delta_paise,
+                        entry_date=invoice.invoice_date,
+                        invoice_id=invoice.id, memo=f"Invoice {invoice.number}")
+
+    @classmethod
+    def post_payment(cls, payment, customer_id, reversal=False):
+        """Credit a received payment, or debit it back when deleted"""
+        memo = f"Payment ({payment.payment_method or 'cash'})"
+        if payment.invoice is not None:
+            memo += f" for {payment.invoice.number}"
+        if reversal:
+            return cls.post(customer_id, 'payment_reversal',
+                            debit_paise=payment.amount_paise,
+                            entry_date=payment.payment_date,
+                            invoice_id=payment.invoice_id,
+                            payment_id=payment.id, memo=memo + " deleted")
+        return cls.post(customer_id, 'payment',
+                        credit_paise=payment.amount_paise,
+                        entry_date=payment.payment_date,
+                        invoice_id=payment.invoice_id,
+                        payment_id=payment.id, memo=memo)
+
+    @classmethod
+    def balance_before(cls, customer_id, on_date):
+        """Balance of the entries dated before on_date, however late they
+        were written"""
+        return db.session.query(
+            db.func.coalesce(db.func.sum(cls.debit_paise - cls.credit_paise), 0)
+        ).filter(
+            cls.customer_id == customer_id,
+            cls.entry_date < on_date
+        ).scalar()
+
+    @classmethod
+    def statement(cls, customer_id, date_from=None, date_to=None):
+        """Entries dated in [date_from, date_to] as (entry, balance) pairs,
+        with opening/closing balances"""
+        query = cls.query.filter(cls.customer_id == customer_id)
+        opening = 0
+        if date_from:
+            opening = cls.balance_before(customer_id, date_from)
+            query = query.filter(cls.entry_date >= date_from)
+        if date_to:
+            query = query.filter(cls.entry_date <= date_to)
+        balance = opening
+        lines = []
+        for entry in query.order_by(cls.entry_date, cls.id):
+            balance += entry.debit_paise - entry.credit_paise
+            lines.append((entry, balance))
+        return opening, lines, balance
+
+
+# Payment methods with their own summary column; anything else is 'other'
+PAYMENT_METHODS = ('cash', 'card', 'upi', 'bank_transfer', 'cheque')
+
+
+class DailySummary(db.Model):
+    """Business totals per day, plus one lifetime row.
+
+    period is an ISO day ('2025-10-17') or 'all'. Rows are bumped with an
+    UPSERT in the same transaction as the invoice, payment or customer
+    write, so dashboard figures are primary-key lookups. Run
+    `flask rebuild-summary` to recompute everything from the base tables.
+    """
+    ALL = 'all'
+
+    period = db.Column(db.String(10), primary_key=True)
+    bill_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue_paise = db.Column(db.Integer, nullable=False, default=0)
+    discount_paise = db.Column(db.Integer, nullable=False, default=0)
+    payments_paise = db.Column(db.Integer, nullable=False, default=0)
+    cash_paise = db.Column(db.Integer, nullable=False, default=0)
+    card_paise = db.Column(db.Integer, nullable=False, default=0)
+    upi_paise = db.Column(db.Integer, nullable=False, default=0)
+    bank_transfer_paise = db.Column(db.Integer, nullable=False, default=0)
+    cheque_paise = db.Column(db.Integer, nullable=False, default=0)
+    other_paise = db.Column(db.Integer, nullable=False, default=0)
+    new_customers = db.Column(db.Integer, nullable=False, default=0)
+    # Net khata movement; on the 'all' row, total outstanding
+    outstanding_change_paise = db.Column(db.Integer, nullable=False,
+                                         default=0)
+
+    revenue = rupee_property('revenue_paise')
+    discount = rupee_property('discount_paise')
+    payments = rupee_property('payments_paise')
+    outstanding_change = rupee_property('outstanding_change_paise')
+
+    COUNTERS = ('bill_count', 'revenue_paise', 'discount_paise',
+                'payments_paise') + tuple(
+        f"{method}_paise" for method in PAYMENT_METHODS) + (
+        'other_paise', 'new_customers', 'outstanding_change_paise')
+
+    @classmethod
+    def bump(cls, on_date, **deltas):
+        """Add deltas to the day's row (if dated) and the lifetime row"""
+        deltas = {name: value for name, value in deltas.items() if value}
+        if not deltas:
+            return
+        periods = [cls.ALL]
+        if on_date:
+            periods.append(on_date.isoformat())
+        table = cls.__table__
+        stmt = sqlite_insert(table).values(
+            [dict(deltas, period=period) for period in periods])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.period],
+            set_={name: table.c[name] + stmt.excluded[name]
+                  for name in deltas})
+        db.session.execute(stmt)
+
+    @classmethod
+    def record_bill(cls, on_date, total_paise, discount_paise=0, bills=1):
+        cls.bump(on_date, bill_count=bills, revenue_paise=total_paise,
+                 discount_paise=discount_paise)
+
+    @classmethod
+    def record_payment(cls, on_date, amount_paise, method):
+        """Count money received (negative amount for a deleted payment)"""
+        method_column = (f"{method}_paise" if method in PAYMENT_METHODS
+                         else 'other_paise')
+        cls.bump(on_date, payments_paise=amount_paise,
+                 **{method_column: amount_paise})
+
+    @classmethod
+    def for_period(cls, period):
+        """Row for a day (date or ISO string) or ALL; zeros when missing"""
+        if not isinstance(period, str):
+            period = period.isoformat()
+        row = db.session.get(cls, period)
+        if row is None:
+            row = cls(period=period, **{name: 0 for name in cls.COUNTERS})
+        return row
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every row from invoices (archived years included),
+        payments, customers and ledger"""
+        rows = {}
+
+        def add(period, **values):
+            row = rows.setdefault(
+                period, dict({name: 0 for name in cls.COUNTERS}, period=period))
+            for name, value in values.items():
+                row[name] += value or 0
+
+        years = ArchivedYear.query.all()
+        invoice = with_archives(Invoice, years)
+        payment = with_archives(Payment, years)
+
+        for on, bills, revenue, discount in db.session.query(
+                invoice.invoice_date, db.func.count(invoice.id),
+                db.func.sum(invoice.total_paise),
+                db.func.sum(invoice.discount_amount_paise)
+        ).group_by(invoice.invoice_date):
+            for period in ([cls.ALL, on.isoformat()] if on else [cls.ALL]):
+                add(period, bill_count=bills, revenue_paise=revenue,
+                    discount_paise=discount)
+
+        for on, method, amount in db.session.query(
+                payment.payment_date, payment.payment_method,
+                db.func.sum(payment.amount_paise)
+        ).group_by(payment.payment_date, payment.payment_method):
+            method_column = (f"{method}_paise" if method in PAYMENT_METHODS
+                             else 'other_paise')
+            for period in ([cls.ALL, on.isoformat()] if on else [cls.ALL]):
+                add(period, payments_paise=amount, **{method_column: amount})
+
+        for on, count in db.session.query(
+                Customer.created_on, db.func.count(Customer.id)
+        ).group_by(Customer.created_on):
+            for period in ([cls.ALL, on.isoformat()] if on else [cls.ALL]):
+                add(period, new_customers=count)
+
+        for on, change in db.session.query(
+                LedgerEntry.entry_date,
+                db.func.sum(LedgerEntry.debit_paise - LedgerEntry.credit_paise)
+        ).group_by(LedgerEntry.entry_date):
+            add(on.isoformat(), outstanding_change_paise=change)
+        # Lifetime outstanding is what the customers owe right now
+        add(cls.ALL, outstanding_change_paise=db.session.query(
+            db.func.sum(Customer.outstanding_balance_paise)).scalar())
+
+        db.session.execute(cls.__table__.delete())
+        db.session.execute(cls.__table__.insert(), list(rows.values()))
+
+
 with app.app_context():
     db.create_all()
 
@@ -214,8 +717,8 @@ class AppSetting(db.Model):
 
     @staticmethod
     def get(key: str, default=None):
-        rec = AppSetting.query.filter_by(key=key).first()
-        return rec.value if rec else default
+        # Served from memory; reloaded after any write to this table
+        return app_settings.get(key, default)
 
     @staticmethod
     def set(key: str, value: str):
@@ -228,6 +731,12 @@ class AppSetting(db.Model):
         db.session.commit()
 
 
+app_settings = SettingsCache(
+    lambda: db.session.query(AppSetting.key, AppSetting.value).all(),
+    SETTINGS_STAMP)
+app_settings.watch(AppSetting)
+
+
 with app.app_context():
     db.create_all()
     # Set sensible defaults if not present
@@ -244,59 +753,355 @@ with app.app_context():
     if AppSetting.get('COMPANY_GSTIN') is None:
         AppSetting.set('COMPANY_GSTIN', '24AIRPB9566H1ZV')
 
+
+class InvoiceSequence(db.Model):
+    """Counter row per invoice-number series (e.g. 'INV' or 'INV-2025-26')"""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(40), unique=True, nullable=False)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def financial_year(on_date=None):
+        """Indian financial year label (April-March) for a date, e.g. '2025-26'"""
+        return financial_year(on_date or dt.now().date())
+
+    @staticmethod
+    def series_prefix(on_date=None):
+        """Number prefix for the active series, honouring INVOICE_FY_PREFIX"""
+        fy_prefix = (
+            (AppSetting.get('INVOICE_FY_PREFIX', 'false') or 'false')
+            .lower() == 'true'
+        )
+        if fy_prefix:
+            return f"INV-{InvoiceSequence.financial_year(on_date)}-"
+        return "INV-"
+
+    @staticmethod
+    def _seed_value(prefix):
+        """Highest number already issued in a series (one-off, on first use)"""
+        suffix = db.func.substr(Invoice.number, len(prefix) + 1)
+        highest = db.session.query(
+            db.func.max(db.cast(suffix, db.Integer))
+        ).filter(
+            Invoice.number.like(f"{prefix}%"),
+            # Only purely numeric suffixes belong to this series
+            db.not_(suffix.op('GLOB')('*[^0-9]*')),
+            suffix != ''
+        ).scalar()
+        return highest or 0
+
+    @staticmethod
+    def next_number(on_date=None):
+        """Reserve the next invoice number in the caller's transaction.
+
+        The UPDATE takes SQLite's write lock, so concurrent saves serialize
+        on this row until the invoice itself commits (or rolls back and
+        releases the number).
+        """
+        prefix = InvoiceSequence.series_prefix(on_date)
+        table = InvoiceSequence.__table__
+        value = db.session.execute(
+            table.update()
+            .where(table.c.key == prefix)
+            .values(last_value=table.c.last_value + 1)
+            .returning(table.c.last_value)
+        ).scalar()
+        if value is None:
+            seed = InvoiceSequence._seed_value(prefix) + 1
+            stmt = sqlite_insert(table).values(key=prefix, last_value=seed)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={'last_value': table.c.last_value + 1}
+            ).returning(table.c.last_value)
+            value = db.session.execute(stmt).scalar()
+        return f"{prefix}{str(value).zfill(6)}"
+
+
+class ArchivedYear(db.Model):
+    """A closed financial year whose settled invoices live in their own file.
+
+    See archive.py. Rows are only added by `flask archive-year <label>`.
+    """
+    label = db.Column(db.String(7), primary_key=True)  # e.g. '2023-24'
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)  # first day after the year
+    file_name = db.Column(db.String(120), nullable=False)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_on = db.Column(db.Date)
+
+    @property
+    def path(self):
+        return os.path.join(ARCHIVE_DIR, self.file_name)
+
+    @property
+    def schema(self):
+        return archive.schema_name(self.label)
+
+    @classmethod
+    def overlapping(cls, date_from=None, date_to=None, session=None):
+        """Archived years with any day in [date_from, date_to] (open ends)"""
+        query = (session or db.session).query(cls)
+        if date_from:
+            query = query.filter(cls.end_date > date_from)
+        if date_to:
+            query = query.filter(cls.start_date <= date_to)
+        return query.order_by(cls.start_date).all()
+
+    @classmethod
+    def archive(cls, label):
+        """Move a closed year's settled invoices to its archive (caller commits)"""
+        start, end = financial_year_bounds(label)
+        if end > dt.now().date():
+            raise ValueError(f"Financial year {label} has not closed yet")
+        year = db.session.get(cls, label)
+        if year is None:
+            year = cls(label=label, start_date=start, end_date=end,
+                       file_name=archive.file_name(label), invoice_count=0)
+            db.session.add(year)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        db.session.flush()
+        moved = archive.move_year(
+            db.session.connection(), label, year.path, start, end)
+        year.invoice_count += moved['invoice']
+        year.archived_on = dt.now().date()
+        return moved
+
+
+class PdfJob(db.Model):
+    """Background render, or render and print, of one invoice's PDF.
+
+    See pdf_jobs.py. The invoices list shows each bill's newest job of
+    each kind.
+    """
+    __table_args__ = (
+        db.Index('ix_pdf_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_pdf_job_invoice_id', 'invoice_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey("invoice.id"),
+                           nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'render' or 'print'
+    printer = db.Column(db.String(255))
+    status = db.Column(db.String(10), nullable=False,
+                       default=pdf_jobs.QUEUED)  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'invoice_id': self.invoice_id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.last_error,
+            'finished_at': self.finished_at.isoformat(timespec='seconds')
+            if self.finished_at else None
+        }
+
+
+def with_archives(model, years, session=None, where=None):
+    """model itself, or an alias reading its rows from the main file and
+    the archives of years (ATTACHed to the session's connection). where is
+    passed on to archive.union_all_years; without years the caller applies
+    it to the main table itself."""
+    if not years:
+        return model
+    schemas = archive.attach((session or db.session).connection(),
+                             [(year.label, year.path) for year in years])
+    return aliased(model, archive.union_all_years(
+        model.__table__, schemas, where))
+
+
+def load_invoice_items(invoices, years, session=None):
+    """Fill invoice_items for invoices, archived ones included, in one pass"""
+    session = session or db.session
+    item = with_archives(InvoiceItem, years, session)
+    ids = [invoice.id for invoice in invoices]
+    by_invoice = {}
+    # Stay well under SQLite's bound-parameter limit
+    for chunk in range(0, len(ids), 500):
+        for row in session.query(item).filter(
+                item.invoice_id.in_(ids[chunk:chunk + 500])):
+            by_invoice.setdefault(row.invoice_id, []).append(row)
+    for invoice in invoices:
+        set_committed_value(invoice, 'invoice_items',
+                            by_invoice.get(invoice.id, []))
+
+
+def find_invoice(*, payments=False, **by):
+    """Invoice matching filter_by(**by) with its customer and items (and
+    payments) loaded, or None. A bill not in the main file is looked up in
+    the archives, so links to archived bills keep working."""
+    options = invoice_document_options()
+    if payments:
+        options += (selectinload(Invoice.payments),)
+    invoice = Invoice.query.options(*options).filter_by(**by).first()
+    years = ArchivedYear.overlapping()
+    if invoice is not None or not years:
+        return invoice
+    archived = with_archives(Invoice, years)
+    invoice = db.session.query(archived).options(
+        joinedload(archived.customer)).filter_by(**by).first()
+    if invoice is None:
+        return None
+    load_invoice_items([invoice], years)
+    if payments:
+        payment = with_archives(Payment, years)
+        set_committed_value(invoice, 'payments', db.session.query(payment)
+                            .filter(payment.invoice_id == invoice.id)
+                            .order_by(payment.id).all())
+    return invoice
+
+
+
+# Bumped by every commit that writes business data; cached pages built at
+# an older version are not served again
+data_version = DataVersion(DATA_STAMP)
+data_version.watch(Customer, Product, Invoice, InvoiceItem, Payment,
+                   CustomerStats, LedgerEntry, DailySummary, ArchivedYear)
+page_cache = PageCache(data_version)
+
+
+def page_vary():
+    """What cached pages depend on besides data: today's date (current
+    month and financial year) and the settings"""
+    return dt.now().date(), app_settings.version
+
+
+def history_unfiltered():
+    """History with no filters: only paging and sorting arguments"""
+    return set(request.args) <= {"sort", "per_page", "after"}
+
+with app.app_context():
+    db.create_all()
+    if AppSetting.get('INVOICE_FY_PREFIX') is None:
+        AppSetting.set('INVOICE_FY_PREFIX', 'false')
+
+with app.app_context():
+    run_migrations(db.engine)
+    # Bring archives up to the migrated schema here: report connections
+    # are read-only and can only attach archives that are already in step.
+    # New ids also start past every archived one
+    with db.engine.begin() as conn:
+        for year in ArchivedYear.query.all():
+            schema, = archive.attach(conn, [(year.label, year.path)])
+            archive.reserve_ids(conn, schema)
+    # First start with the summary table: build it from existing data
+    if db.session.get(DailySummary, DailySummary.ALL) is None:
+        DailySummary.rebuild()
+        db.session.commit()
+    # Statements over the threshold go to a rotating log beside the database
+    slow_queries.install(
+        os.getenv("SLOW_QUERY_LOG") or os.path.join(
+            os.path.dirname(db.engine.url.database), "slow_queries.jsonl"),
+        AppSetting.get(slow_queries.SETTING_KEY))
+
+
+@app.cli.command("archive-year")
+@click.argument("label")
+def archive_year_command(label):
+    """Move settled invoices of a closed financial year (e.g. 2023-24)
+    to their archive file."""
+    try:
+        moved = ArchivedYear.archive(label)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    print(f"Archived FY {label}: {moved['invoice']} invoices, "
+          f"{moved['invoice_item']} items, {moved['payment']} payments")
+
+
+@app.cli.command("rebuild-summary")
+def rebuild_summary_command():
+    """Recompute daily_summary from invoices, payments and customers."""
+    DailySummary.rebuild()
+    db.session.commit()
+    totals = DailySummary.for_period(DailySummary.ALL)
+    print(f"Rebuilt summary: {totals.bill_count} bills, "
+          f"revenue {format_rupees(totals.revenue_paise)}")
+
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(sorted(importer.KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=importer.BATCH_SIZE, show_default=True)
+def import_command(kind, path, batch_size):
+    """Import products or customers from a CSV or XLSX file, matching
+    existing rows by barcode (products) or phone (customers)."""
+    with open(path, "rb") as stream:
+        try:
+            rows = importer.read_rows(stream, path, importer.KINDS[kind])
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        for progress in import_records(kind, rows, batch_size):
+            for line, error in progress["errors"]:
+                print(f"  line {line}: {error}")
+            if progress.get("error"):
+                raise click.ClickException(progress["error"])
+            if not progress.get("done"):
+                print(f"{progress['rows']} rows: {progress['created']} new, "
+                      f"{progress['updated']} updated, {progress['failed']} failed")
+    print(f"Imported {progress['rows']} {kind} rows in {progress['seconds']:.1f}s")
+
+# Fuzzy name lookups for Chotu, kept current from committed writes
+product_names = matcher.NameIndex(
+    lambda: db.session.query(Product.id, Product.name).all())
+customer_names = matcher.NameIndex(
+    lambda: db.session.query(Customer.id, Customer.name).all())
+matcher.track(Product, product_names)
+matcher.track(Customer, customer_names)
+
 # Initialize Chotu Assistant with database models
 
 # Create assistant and initialize with models
 chotu_assistant = get_assistant()
-chotu_assistant.initialize_models(Customer, Product, Invoice, InvoiceItem, db)
+chotu_assistant.initialize_models(
+    Customer, Product, Invoice, InvoiceItem, db,
+    invoice_sequence_model=InvoiceSequence,
+    customer_stats_model=CustomerStats,
+    ledger_model=LedgerEntry,
+    summary_model=DailySummary,
+    product_index=product_names,
+    customer_index=customer_names)
 
 
-def generate_next_invoice_number():
-    """Generate the next invoice number safely by finding the maximum existing number"""
-    try:
-        # Get all existing invoice numbers
-        all_nums = [inv.number for inv in Invoice.query.all() if inv.number and inv.number.startswith('INV-')]
-        if all_nums:
-            # Extract numbers and find the maximum
-            values = []
-            for n in all_nums:
-                # Extract the numeric part after 'INV-'
-                if n.startswith('INV-'):
-                    try:
-                        num_part = int(n[4:])  # Remove 'INV-' prefix
-                        values.append(num_part)
-                    except ValueError:
-                        continue
-            next_num = (max(values) + 1) if values else 1
-        else:
-            next_num = 1
-    except Exception:
-        # Fallback to count-based approach if there's an error
-        next_num = Invoice.query.count() + 1
-    
-    return f"INV-{str(next_num).zfill(6)}"
+def generate_next_invoice_number(on_date=None):
+    """Reserve the next invoice number from the sequence table.
+
+    Must be called inside the transaction that inserts the invoice.
+    """
+    return InvoiceSequence.next_number(on_date)
 
 
 # ---------- ROUTES ----------
 
 
 @app.route("/")
+@page_cache.cached(vary=page_vary)
 def dashboard():
     """Main dashboard with statistics"""
-    # Basic counts
-    cust_count = Customer.query.count()
+    # Lifetime totals come from the summary row
+    totals = DailySummary.for_period(DailySummary.ALL)
+    cust_count = totals.new_customers
     prod_count = Product.query.count()
-    inv_count = Invoice.query.count()
+    inv_count = totals.bill_count
 
     # Invoice statistics
-    total_revenue = db.session.query(db.func.sum(Invoice.total)).scalar() or 0
+    total_revenue = totals.revenue
     average_invoice = (total_revenue / inv_count) if inv_count > 0 else 0
 
     # Unique customers who have invoices
-    unique_customers = db.session.query(Invoice.customer_id).distinct().count()
+    unique_customers = CustomerStats.query.filter(
+        CustomerStats.invoice_count > 0).count()
 
     # Khata book statistics
-    total_outstanding = db.session.query(db.func.sum(Customer.outstanding_balance)).scalar() or 0
+    total_outstanding = totals.outstanding_change
 
     return render_template("dashboard.html",
                            cust_count=cust_count,
@@ -317,42 +1122,23 @@ def customers():
     search_query = request.args.get('search', '').strip()
     customer_id = request.args.get('customer_id', type=int)
 
-    # Search customers if query provided
-    if search_query:
-        customers = Customer.query.filter(
-            db.or_(
-                Customer.name.ilike(f"%{search_query}%"),
-                Customer.email.ilike(f"%{search_query}%"),
-                Customer.phone.ilike(f"%{search_query}%")
-            )
-        ).all()
-
-        # Add purchase statistics for each customer
-        customers_with_stats = []
-        for customer in customers:
-            invoices = Invoice.query.filter_by(customer_id=customer.id).all()
-            total_spent = sum(invoice.total or 0 for invoice in invoices)
-            invoice_count = len(invoices)
+    # Customers and their purchase stats in one query
+    query = db.session.query(Customer, CustomerStats).outerjoin(
+        CustomerStats, CustomerStats.customer_id == Customer.id)
 
-            customers_with_stats.append({
-                'customer': customer,
-                'total_spent': total_spent,
-                'invoice_count': invoice_count
-            })
-    else:
-        # Show all customers with stats
-        customers = Customer.query.all()
-        customers_with_stats = []
-        for customer in customers:
-            invoices = Invoice.query.filter_by(customer_id=customer.id).all()
-            total_spent = sum(invoice.total or 0 for invoice in invoices)
-            invoice_count = len(invoices)
+    # Search customers if query provided (name, phone, email word prefixes)
+    hits = fts.ranked('customer', search_query)
+    if hits is not None:
+        query = query.join(hits, hits.c.rowid == Customer.id).order_by(hits.c.rank)
 
-            customers_with_stats.append({
-                'customer': customer,
-                'total_spent': total_spent,
-                'invoice_count': invoice_count
-            })
+    customers_with_stats = [
+        {
+            'customer': customer,
+            'total_spent': stats.total_spent if stats else 0,
+            'invoice_count': stats.invoice_count if stats else 0
+        }
+        for customer, stats in query.all()
+    ]
 
     # Get selected customer's history if customer_id provided
     selected_customer = None
@@ -366,35 +1152,14 @@ def customers():
             .order_by(Invoice.id.desc()).all()
         )
 
-        if customer_invoices:
-            total_spent = sum(
-                invoice.total or 0
-                for invoice in customer_invoices
-            )
-            # Convert string dates to datetime for comparison
-            valid_dates = [
-                dt.strptime(
-                    invoice.invoice_date, '%Y-%m-%d'
-                )
-                for invoice in customer_invoices
-                if invoice.invoice_date
-            ]
-
-            if valid_dates:
-                first_purchase = min(valid_dates)
-                last_purchase = max(valid_dates)
-            else:
-                first_purchase = None
-                last_purchase = None
-
-            avg_order_value = total_spent / len(customer_invoices)
-
+        stats = selected_customer.stats
+        if stats and stats.invoice_count:
             customer_stats = {
-                'total_spent': total_spent,
-                'invoice_count': len(customer_invoices),
-                'first_purchase': first_purchase,
-                'last_purchase': last_purchase,
-                'avg_order_value': avg_order_value
+                'total_spent': stats.total_spent,
+                'invoice_count': stats.invoice_count,
+                'first_purchase': stats.first_purchase,
+                'last_purchase': stats.last_purchase,
+                'avg_order_value': stats.avg_order_value
             }
         else:
             customer_stats = {
@@ -413,13 +1178,13 @@ def customers():
                            search_query=search_query)
 
 
+@app.route("/search_customers")
 def search_customers():
-    """Search customers by name or phone"""
-    q = request.args.get("q", "").strip()
-    if q:
-        customers = Customer.query.filter(
-            (Customer.name.ilike(f"%{q}%")) | (Customer.phone.ilike(f"%{q}%"))
-        ).all()
+    """Search customers by name, phone or email"""
+    hits = fts.ranked('customer', request.args.get("q", ""), limit=20)
+    if hits is not None:
+        customers = Customer.query.join(
+            hits, hits.c.rowid == Customer.id).order_by(hits.c.rank).all()
     else:
         customers = Customer.query.limit(20).all()
 
@@ -434,6 +1199,7 @@ def search_customers():
     return jsonify(results)
 
 
+@app.route("/add_customer", methods=["POST"])
 def add_customer():
     """Add new customer"""
     # Check for existing phone/email
@@ -467,8 +1233,10 @@ def add_customer():
             email=email,
             address=request.form.get("address") or None,
             gstin=request.form.get("gstin") or None,
+            created_on=dt.now().date(),
         )
         db.session.add(c)
+        DailySummary.bump(c.created_on, new_customers=1)
         db.session.commit()
 
         # Check if it's an AJAX request (from new invoice modal)
@@ -519,55 +1287,70 @@ def edit_customer(customer_id):
     return redirect(url_for("customers"))
 
 
+@app.route("/delete_customer/<int:customer_id>", methods=["POST", "GET"])
 def delete_customer(customer_id):
     """Delete customer"""
     customer = Customer.query.get_or_404(customer_id)
+    DailySummary.bump(customer.created_on, new_customers=-1)
+    # Their balance leaves the lifetime outstanding total with them
+    DailySummary.bump(None, outstanding_change_paise=-(
+        customer.outstanding_balance_paise or 0))
     db.session.delete(customer)
     db.session.commit()
     flash("Customer deleted successfully!", "success")
     return redirect(url_for("customers"))
 
 
-def export_customers():
-    """Export all customers to Excel"""
-    import io
-    import csv
-    from flask import make_response
-
-    # Create CSV content
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Write header
-    writer.writerow(['Name', 'Phone', 'Email', 'Address',
-                    'GSTIN', 'Total Spent', 'Total Orders'])
-
-    # Write customer data
-    customers = Customer.query.all()
-    for customer in customers:
-        invoices = Invoice.query.filter_by(customer_id=customer.id).all()
-        total_spent = sum(invoice.total or 0 for invoice in invoices)
-        invoice_count = len(invoices)
-
-        writer.writerow([
-            customer.name,
-            customer.phone or '',
-            customer.email or '',
-            customer.address or '',
-            customer.gstin or '',
-            total_spent,
-            invoice_count
-        ])
-
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    filename = (
-        f'customers_export_{dt.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    )
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+# Rows fetched from SQLite (and written to the response) per step
+EXPORT_BATCH = 1000
 
-    return response
+
+def csv_download(filename, header, rows):
+    """Stream rows as a CSV attachment. The header goes out at once and
+    rows follow a batch at a time, so memory stays flat however big the
+    table is; rows is closed (ending its read snapshot) when the download
+    finishes or the client goes away."""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        with closing(rows):
+            for count, row in enumerate(rows, 1):
+                if count % EXPORT_BATCH == 1:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                writer.writerow(row)
+        yield buffer.getvalue()
+
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route("/export_customers")
+def export_customers():
+    """Export all customers to CSV"""
+    def rows():
+        # One query: customers with their maintained stats, streamed from
+        # one snapshot of the report pool
+        with db_profile.snapshot_session(report_engine) as session:
+            result = session.execute(
+                db.select(Customer.name, Customer.phone, Customer.email,
+                          Customer.address, Customer.gstin,
+                          CustomerStats.total_spent_paise,
+                          CustomerStats.invoice_count)
+                .outerjoin(CustomerStats,
+                           CustomerStats.customer_id == Customer.id)
+                .execution_options(yield_per=EXPORT_BATCH))
+            for name, phone, email, address, gstin, spent, orders in result:
+                yield [name, phone or '', email or '', address or '',
+                       gstin or '', from_paise(spent) or 0, orders or 0]
+
+    return csv_download(
+        f'customers_export_{dt.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['Name', 'Phone', 'Email', 'Address', 'GSTIN',
+         'Total Spent', 'Total Orders'],
+        rows())
 
 # ---------- PRODUCT ROUTES ----------
 
@@ -579,13 +1362,13 @@ def show_products():
     return render_template("products.html", products=products)
 
 
+@app.route("/search_products")
 def search_products():
-    """Search products by name or barcode"""
-    q = request.args.get("q", "").strip()
-    if q:
-        products = Product.query.filter(
-            (Product.name.ilike(f"%{q}%")) | (Product.barcode.ilike(f"%{q}%"))
-        ).all()
+    """Search products by name, barcode, company or description"""
+    hits = fts.ranked('product', request.args.get("q", ""), limit=20)
+    if hits is not None:
+        products = Product.query.join(
+            hits, hits.c.rowid == Product.id).order_by(hits.c.rank).all()
     else:
         products = Product.query.limit(20).all()
 
@@ -700,14 +1483,81 @@ def delete_product(product_id):
 # ---------- INVOICE ROUTES ----------
 
 
+def page_size():
+    """Rows per page of long listings: ?per_page=, else the PAGE_SIZE setting"""
+    return paging.clean_page_size(
+        request.args.get("per_page") or AppSetting.get('PAGE_SIZE'))
+
+
+def page_links(next_cursor):
+    """URLs of the first page (when not on it) and the next page (when
+    there is one) of the current listing, filters kept"""
+    args = request.args.to_dict()
+    args.pop("after", None)
+    first_url = url_for(request.endpoint, **args) if "after" in request.args else None
+    next_url = url_for(request.endpoint, **args, after=next_cursor) if next_cursor else None
+    return first_url, next_url
+
+
+@app.route("/invoices")
 def invoices():
-    """List all invoices"""
-    invoices = Invoice.query.order_by(Invoice.id.desc()).all()
-    today_str = dt.now().strftime("%Y-%m-%d")
+    """List one financial year's invoices (the current one by default)"""
+    today = dt.now().date()
+    current_fy = financial_year(today)
+    fy = request.args.get("fy") or current_fy
+
+    if fy == "all":
+        invoice = with_archives(Invoice, ArchivedYear.overlapping())
+        query = db.session.query(invoice)
+    else:
+        try:
+            start, end = financial_year_bounds(fy)
+        except ValueError:
+            fy = current_fy
+            start, end = financial_year_bounds(fy)
+        invoice = with_archives(
+            Invoice, ArchivedYear.overlapping(start, end - timedelta(days=1)))
+        in_year = db.and_(invoice.invoice_date >= start,
+                          invoice.invoice_date < end)
+        if fy == current_fy:
+            # Undated bills have nowhere else to show up
+            in_year = db.or_(in_year, invoice.invoice_date.is_(None))
+        query = db.session.query(invoice).filter(in_year)
+
+    # Totals for the whole year in one aggregate; the table shows one page
+    invoice_count, revenue_paise, customer_count = query.with_entities(
+        db.func.count(invoice.id),
+        db.func.coalesce(db.func.sum(invoice.total_paise), 0),
+        db.func.count(invoice.customer_id.distinct())).one()
+    invoices, next_cursor = paging.page(
+        query.options(joinedload(invoice.customer)), None, invoice.id,
+        descending=True,
+        cursor=request.args.get("after"), size=page_size())
+    first_url, next_url = page_links(next_cursor)
+
+    # Year picker: every year from the oldest bill, archived ones included
+    oldest = [d for d in (
+        db.session.query(db.func.min(Invoice.invoice_date)).scalar(),
+        db.session.query(db.func.min(ArchivedYear.start_date)).scalar()) if d]
+    first_year = int(financial_year(min(oldest))[:4]) if oldest else today.year
+    fy_choices = [financial_year(dt(year, 4, 1).date()) for year in range(
+        int(current_fy[:4]), min(first_year, int(current_fy[:4])) - 1, -1)]
+
     return render_template(
         "invoices.html",
         invoices=invoices,
-        today_str=today_str)
+        invoice_count=invoice_count,
+        total_revenue=from_paise(revenue_paise),
+        avg_invoice=from_paise(revenue_paise) / invoice_count if invoice_count else 0,
+        customer_count=customer_count,
+        first_url=first_url,
+        next_url=next_url,
+        fy=fy,
+        fy_choices=fy_choices,
+        pdf_jobs=pdf_queue.latest(i.id for i in invoices),
+        pdf_job_labels=PDF_JOB_LABELS,
+        pdf_job_classes=PDF_JOB_CLASSES,
+        today=today)
 
 
 @app.route("/new-invoice")
@@ -727,30 +1577,34 @@ def new_invoice():
         selected_customer=selected_customer)
 
 
+@app.route("/save_invoice", methods=["POST"])
 def save_invoice():
     """Save new invoice"""
     try:
         cust_id = request.form["customer_id"]
-        inv_no = generate_next_invoice_number()
+        invoice_date = parse_date(request.form.get("invoice_date"))
+        inv_no = generate_next_invoice_number(invoice_date)
 
         # Create invoice
         inv = Invoice(
             number=inv_no,
             customer_id=cust_id,
-            invoice_date=request.form.get("invoice_date"),
-            due_date=request.form.get("due_date"),
+            invoice_date=invoice_date,
+            due_date=parse_date(request.form.get("due_date")),
             terms=request.form.get("terms"),
             salesperson=request.form.get("salesperson"),
             notes=request.form.get("notes"),
             discount_type=request.form.get("discount_type"),
-            discount_amount=float(request.form.get("invoice_discount") or 0),
-            total=0
+            discount_amount_paise=to_paise(
+                request.form.get("invoice_discount") or 0),
+            total_paise=0
         )
         db.session.add(inv)
-        db.session.commit()
+        # Flush only: the number, items and payment commit together below
+        db.session.flush()
 
         # Add invoice items
-        subtotal = 0
+        subtotal_paise = 0
         for pid, q, d, t, r, desc in zip(
             request.form.getlist("product_id[]"),
             request.form.getlist("qty[]"),
@@ -776,79 +1630,72 @@ def save_invoice():
                 price=price,
                 discount_amount=discount_amt,
                 tax=tax,
-                line_total=line_total,
+                line_total_paise=to_paise(line_total),
                 description=desc or (product.description if product else '')
             )
             db.session.add(item)
-            subtotal += line_total
+            subtotal_paise += item.line_total_paise
 
         # Update invoice total
-        inv.total = subtotal - inv.discount_amount
-        db.session.commit()
+        inv.total_paise = subtotal_paise - inv.discount_amount_paise
+        CustomerStats.record_invoice(cust_id, inv.total_paise, invoice_date)
+        LedgerEntry.post_invoice_change(inv, inv.total_paise, kind='invoice')
+        DailySummary.record_bill(
+            invoice_date, inv.total_paise, inv.discount_amount_paise)
 
         # Handle initial payment if provided
-        initial_payment_amount = float(request.form.get("initial_payment_amount") or 0)
-        if initial_payment_amount > 0:
+        initial_payment_paise = to_paise(
+            request.form.get("initial_payment_amount") or 0)
+        if initial_payment_paise > 0:
             payment_method = request.form.get("initial_payment_method")
-            payment_date = request.form.get("initial_payment_date")
+            payment_date = parse_date(
+                request.form.get("initial_payment_date"))
             payment_notes = request.form.get("initial_payment_notes")
 
             # Create payment record
             payment = Payment(
                 invoice_id=inv.id,
-                amount=initial_payment_amount,
+                amount_paise=initial_payment_paise,
                 payment_method=payment_method,
                 payment_date=payment_date,
                 notes=payment_notes or f"Initial payment for invoice {inv.number}"
             )
             db.session.add(payment)
+            db.session.flush()
 
             # Update invoice payment status
-            inv.total_paid = initial_payment_amount
-            if inv.total_paid >= inv.total:
-                inv.payment_status = 'paid'
-            elif inv.total_paid > 0:
-                inv.payment_status = 'partial'
-            else:
-                inv.payment_status = 'unpaid'
+            inv.total_paid_paise = initial_payment_paise
+            inv.update_payment_status()
+            LedgerEntry.post_payment(payment, inv.customer_id)
+            DailySummary.record_payment(
+                payment_date, initial_payment_paise, payment_method)
 
-            # Update customer's outstanding balance
             customer = Customer.query.get(cust_id)
             if customer:
-                customer.outstanding_balance = (customer.outstanding_balance or 0) + inv.total - initial_payment_amount
                 customer.last_payment_date = payment_date
                 
                 # Update next expected payment date if provided
-                next_expected_date = request.form.get("next_expected_payment_date")
+                next_expected_date = parse_date(
+                    request.form.get("next_expected_payment_date"))
                 if next_expected_date:
                     customer.expected_next_payment_date = next_expected_date
-                
-            db.session.commit()
 
-        # Generate PDF
-        pdf_path = os.path.join(INVOICE_DIR, f"{inv.number}.pdf")
-        if generate_invoice_pdf(inv, pdf_path):
-            flash("Invoice created successfully!", "success")
-            # Auto print based on settings
-            try:
-                auto_print = (
-                    (AppSetting.get('AUTO_PRINT_AFTER_SAVE', 'false') or 'false')
-                    .lower() == 'true'
-                )
-                default_printer = (
-                    AppSetting.get('DEFAULT_PRINTER', '') or None
-                )
-                if auto_print:
-                    result = print_invoice_directly(
-                        inv.number, default_printer)
-                    if not result.get('success'):
-                        flash(
-                            f"Auto-print failed: {result.get('message')}", "warning")
-            except Exception as e:
-                flash(f"Auto-print error: {e}", "warning")
+        # PDF, and the auto print, are done by a background worker;
+        # the job commits with the bill so it cannot be lost
+        auto_print = (
+            (AppSetting.get('AUTO_PRINT_AFTER_SAVE', 'false') or 'false')
+            .lower() == 'true'
+        )
+        if auto_print:
+            pdf_queue.enqueue(inv.id, 'print',
+                              AppSetting.get('DEFAULT_PRINTER', '') or None)
         else:
-            flash("Invoice created but PDF generation failed.", "warning")
+            pdf_queue.enqueue(inv.id, 'render')
+
+        db.session.commit()
+        pdf_queue.notify()
 
+        flash("Invoice created successfully!", "success")
         return redirect(url_for("invoices"))
 
     except Exception as e:
@@ -857,29 +1704,137 @@ def save_invoice():
         return redirect(url_for("new_invoice"))
 
 
+def invoice_pdf_file(invoice):
+    """(path, render key) of invoice's PDF, rendered first if anything
+    drawn on it changed since it was last published. path is None if
+    rendering failed; the key is None without the overlay renderer, which
+    renders every time as before. Only overlay renders are filed under a
+    key: a fallback drawing is never served in its place."""
+    path = os.path.join(INVOICE_DIR, f"{invoice.number}.pdf")
+    key = invoice_render_key(invoice)
+    if key is None:
+        return (path if generate_invoice_pdf(invoice, path) else None), None
+    if not pdf_cache.publish(
+            key, path,
+            lambda output: generate_invoice_pdf(invoice, output, fallback=False)):
+        return None, key
+    return path, key
+
+
+@app.route("/invoice_pdf/<number>")
 def invoice_pdf(number):
-    """Serve invoice PDF"""
+    """Serve invoice PDF.
+
+    A bill paid into or edited since its PDF was made is rendered again
+    first; archived bills are read from their year's archive. The strong
+    ETag is the render key (the file's hash for a PDF with no bill behind
+    it), so a tablet that already has it gets a 304 and a PDF
+    viewer can fetch byte ranges; no-cache makes every open revalidate
+    rather than show a stale copy.
+    """
     path = os.path.join(INVOICE_DIR, f"{number}.pdf")
-    if os.path.exists(path):
-        return send_file(
-            path,
-            download_name=f"{number}.pdf",
-            mimetype="application/pdf")
-    return "PDF not found", 404
+    etag = None
+    invoice = find_invoice(number=number)
+    if invoice is not None:
+        rendered, etag = invoice_pdf_file(invoice)
+        if rendered is None:
+            # Serve the last good render, if any, under its own hash
+            etag = None
+    if not os.path.exists(path):
+        return "PDF not found", 404
+    stat = os.stat(path)
+    response = send_file(
+        path,
+        download_name=f"{number}.pdf",
+        mimetype="application/pdf",
+        etag=etag or file_digest(path),
+        last_modified=stat.st_mtime,
+        conditional=True,
+        max_age=0)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def run_pdf_job(job):
+    """Render a queued invoice's PDF, then print it for a print job;
+    raising makes the queue try again later"""
+    invoice = Invoice.query.options(*invoice_document_options()) \
+        .filter(Invoice.id == job.invoice_id).first()
+    if invoice is None:
+        raise LookupError(f"Invoice {job.invoice_id} not found")
+    if not invoice_pdf_file(invoice)[0]:
+        raise RuntimeError("PDF generation failed")
+    if job.kind == 'print':
+        result = print_invoice_directly(invoice.number, job.printer)
+        if not result.get('success'):
+            raise RuntimeError(result.get('message') or "Print failed")
+
+
+pdf_queue = pdf_jobs.JobQueue(app, db, PdfJob, run_pdf_job)
+
+# Invoices list wording and colour for each job kind and status
+PDF_JOB_LABELS = {
+    'render': {'queued': "PDF queued", 'running': "Rendering PDF...",
+               'done': "PDF ready", 'failed': "PDF failed"},
+    'print': {'queued': "Print queued", 'running': "Printing...",
+              'done': "Printed", 'failed': "Print failed"},
+}
+PDF_JOB_CLASSES = {'queued': "text-muted", 'running': "text-primary",
+                   'done': "text-success", 'failed': "text-danger"}
+
+
+@app.before_request
+def start_pdf_workers():
+    # Not at import: CLI commands load the app too and must not take jobs
+    pdf_queue.start(PDF_WORKERS)
+
+
+@app.route("/pdf-jobs/status")
+def pdf_job_status():
+    """Newest render and print job of each ?invoice=<id>, for the invoices
+    list to poll while any is still queued or running"""
+    ids = request.args.getlist("invoice", type=int)
+    jobs = pdf_queue.latest(ids)
+    return jsonify({
+        str(invoice_id): {kind: job.to_dict() for kind, job in kinds.items()}
+        for invoice_id, kinds in jobs.items()})
+
+
+@app.route("/invoice/<int:invoice_id>/pdf-jobs/retry", methods=["POST"])
+def retry_pdf_jobs(invoice_id):
+    """Queue a bill's failed render or print again"""
+    invoice = Invoice.query.get_or_404(invoice_id)
+    if not pdf_queue.retry(invoice.id):
+        pdf_queue.enqueue(invoice.id, 'render')
+    db.session.commit()
+    pdf_queue.notify()
+    flash(f"PDF for invoice {invoice.number} queued again", "success")
+    return redirect(url_for("invoices"))
 
 
 @app.route("/invoice/<int:invoice_id>")
 def invoice_details(invoice_id):
     """Show invoice details"""
-    invoice = Invoice.query.get_or_404(invoice_id)
+    invoice = find_invoice(id=invoice_id, payments=True)
+    if invoice is None:
+        abort(404)
     return render_template("invoice_details.html", invoice=invoice)
 
 
+@app.route("/delete_invoice/<number>", methods=["POST"])
 def delete_invoice(number):
     """Delete invoice"""
     inv = Invoice.query.filter_by(number=number).first_or_404()
     InvoiceItem.query.filter_by(invoice_id=inv.id).delete()
+    # Take the unpaid part off the khata; payments already received stay
+    LedgerEntry.post_invoice_change(inv, -inv.remaining_paise,
+                                    kind='invoice_void')
+    DailySummary.record_bill(inv.invoice_date, -(inv.total_paise or 0),
+                             -(inv.discount_amount_paise or 0), bills=-1)
+    PdfJob.query.filter_by(invoice_id=inv.id).delete()
     db.session.delete(inv)
+    CustomerStats.refresh(inv.customer_id)
     db.session.commit()
 
     # Remove PDF file
@@ -891,14 +1846,15 @@ def delete_invoice(number):
     return redirect(url_for("invoices"))
 
 
+@app.route("/duplicate_invoice/<number>", methods=["POST"])
 def duplicate_invoice(number):
     """Create a duplicate of an existing invoice"""
     try:
         original = Invoice.query.filter_by(number=number).first_or_404()
 
         # Create new invoice number
-        new_number = generate_next_invoice_number()
-        today = dt.now().strftime("%Y-%m-%d")
+        today = dt.now().date()
+        new_number = generate_next_invoice_number(today)
 
         # Create duplicate invoice
         new_invoice = Invoice(
@@ -910,8 +1866,8 @@ def duplicate_invoice(number):
             salesperson=original.salesperson,
             notes=original.notes,
             discount_type=original.discount_type,
-            discount_amount=original.discount_amount,
-            total=original.total
+            discount_amount_paise=original.discount_amount_paise,
+            total_paise=original.total_paise
         )
 
         db.session.add(new_invoice)
@@ -926,15 +1882,19 @@ def duplicate_invoice(number):
                 price=item.price,
                 discount_amount=item.discount_amount,
                 tax=item.tax,
-                line_total=item.line_total
+                line_total_paise=item.line_total_paise
             )
             db.session.add(new_item)
 
+        CustomerStats.record_invoice(
+            new_invoice.customer_id, new_invoice.total_paise, today)
+        LedgerEntry.post_invoice_change(
+            new_invoice, new_invoice.total_paise, kind='invoice')
+        DailySummary.record_bill(today, new_invoice.total_paise,
+                                 new_invoice.discount_amount_paise)
+        pdf_queue.enqueue(new_invoice.id, 'render')
         db.session.commit()
-
-        # Generate PDF for new invoice
-        pdf_path = os.path.join(INVOICE_DIR, f"{new_number}.pdf")
-        generate_invoice_pdf(new_invoice, pdf_path)
+        pdf_queue.notify()
 
         flash(f"Invoice duplicated as {new_number}!", "success")
         return redirect(url_for("invoices"))
@@ -944,14 +1904,14 @@ def duplicate_invoice(number):
         return redirect(url_for("invoices"))
 
 
+@app.route("/search_invoices")
 def search_invoices():
-    """Search invoices by number or customer name"""
-    q = request.args.get("q", "").strip()
-    if q:
-        invoices = Invoice.query.join(Customer).filter(
-            (Invoice.number.ilike(f"%{q}%")) |
-            (Customer.name.ilike(f"%{q}%"))
-        ).order_by(Invoice.id.desc()).limit(20).all()
+    """Search invoices by number, customer name or notes"""
+    hits = fts.ranked('invoice', request.args.get("q", ""), limit=20)
+    if hits is not None:
+        invoices = Invoice.query.join(
+            hits, hits.c.rowid == Invoice.id).order_by(
+            hits.c.rank, Invoice.id.desc()).all()
     else:
         invoices = Invoice.query.order_by(Invoice.id.desc()).limit(20).all()
 
@@ -962,7 +1922,7 @@ def search_invoices():
             "id": inv.id,
             "number": inv.number,
             "customer_name": customer_name,
-            "date": inv.invoice_date,
+            "date": format_date(inv.invoice_date),
             "total": inv.total,
             "text": (
                 f"{inv.number} - "
@@ -973,120 +1933,168 @@ def search_invoices():
     return jsonify(results)
 
 
+@app.route("/invoice_history")
 @app.route("/invoice-history")
+@page_cache.cached(when=history_unfiltered, vary=page_vary)
 def invoice_history():
     """Advanced invoice history with filtering and search"""
     # Get filter parameters
     search_query = request.args.get("search", "").strip()
+    # The autocomplete sends the customer's id; ?customer= name links
+    # still filter by name, but only for the view they open
+    customer_id = request.args.get("customer_id", type=int)
     customer_filter = request.args.get("customer", "").strip()
+    if customer_filter and not customer_id:
+        matches = db.session.query(Customer.id).filter(
+            Customer.name.ilike(f"%{customer_filter}%")).limit(2).all()
+        if len(matches) == 1:
+            # One customer: continue as if picked in the filter field
+            args = request.args.to_dict(flat=False)
+            del args["customer"]
+            args["customer_id"] = [matches[0].id]
+            return redirect(url_for("invoice_history", **args))
     date_from = request.args.get("date_from", "").strip()
     date_to = request.args.get("date_to", "").strip()
     min_amount = request.args.get("min_amount", "").strip()
     max_amount = request.args.get("max_amount", "").strip()
     sort_by = request.args.get("sort", "date_desc")
 
-    # Start with base query
-    query = Invoice.query.join(Customer, isouter=True)
-
-    # Apply filters
-    if search_query:
-        query = query.filter(
-            (Invoice.number.ilike(f"%{search_query}%")) |
-            (Customer.name.ilike(f"%{search_query}%")) |
-            (Invoice.notes.ilike(f"%{search_query}%"))
-        )
-
-    if customer_filter:
-        query = query.filter(Customer.name.ilike(f"%{customer_filter}%"))
-
-    if date_from:
-        query = query.filter(Invoice.invoice_date >= date_from)
-
-    if date_to:
-        query = query.filter(Invoice.invoice_date <= date_to)
-
-    if min_amount:
-        try:
-            query = query.filter(Invoice.total >= float(min_amount))
-        except ValueError:
-            pass
+    # Opening the page without filters shows the current financial year;
+    # clearing the dates in the form searches every year
+    if "date_from" not in request.args and "date_to" not in request.args:
+        date_from = financial_year_bounds(
+            financial_year(dt.now().date()))[0].isoformat()
+    from_date = parse_date(date_from)
+    to_date = parse_date(date_to)
+
+    # One read snapshot for the whole report, rendering included, on the
+    # read-only report pool
+    with db_profile.snapshot_session(report_engine) as session:
+        # Archived years are only read when the date range reaches them
+        years = ArchivedYear.overlapping(from_date, to_date, session)
+
+        # The search covers number, customer name and notes. Each file's
+        # bills are looked up by id from its own index's hits, so a search
+        # across every year does not read every bill
+        def matching(table, schema):
+            return fts.contains('invoice', search_query, table.c.id, schema)
+
+        invoice = with_archives(Invoice, years, session, where=matching)
+
+        # Start with base query
+        query = session.query(invoice).join(
+            Customer, invoice.customer_id == Customer.id, isouter=True)
+
+        if not years:
+            criterion = matching(Invoice.__table__, 'main')
+            if criterion is not None:
+                query = query.filter(criterion)
+
+        if customer_id:
+            query = query.filter(invoice.customer_id == customer_id)
+        if customer_filter:
+            query = query.filter(Customer.name.ilike(f"%{customer_filter}%"))
+
+        # Date bounds are compared as DATEs so they range-scan ix_invoice_date_id
+        if from_date:
+            query = query.filter(invoice.invoice_date >= from_date)
+
+        if to_date:
+            query = query.filter(invoice.invoice_date <= to_date)
+
+        if min_amount:
+            try:
+                query = query.filter(invoice.total_paise >= to_paise(min_amount))
+            except ValueError:
+                pass
 
-    if max_amount:
-        try:
-            query = query.filter(Invoice.total <= float(max_amount))
-        except ValueError:
-            pass
-
-    # Apply sorting
-    if sort_by == "date_asc":
-        query = query.order_by(Invoice.invoice_date.asc(), Invoice.id.asc())
-    elif sort_by == "date_desc":
-        query = query.order_by(Invoice.invoice_date.desc(), Invoice.id.desc())
-    elif sort_by == "amount_asc":
-        query = query.order_by(Invoice.total.asc())
-    elif sort_by == "amount_desc":
-        query = query.order_by(Invoice.total.desc())
-    elif sort_by == "customer":
-        query = query.order_by(
-            Customer.name.asc()
-        )
-    elif sort_by == "number":
-        query = query.order_by(Invoice.number.asc())
-    else:
-        query = query.order_by(Invoice.id.desc())
-
-    invoices = query.all()
-
-    # Get all customers for filter dropdown
-    customers = Customer.query.order_by(Customer.name).all()
-
-    # Calculate statistics
-    total_revenue = sum(inv.total for inv in invoices) if invoices else 0
-    total_discounts = sum(
-        inv.discount_amount for inv in invoices if inv.discount_amount) if invoices else 0
-    avg_invoice = total_revenue / len(invoices) if invoices else 0
-
-    # Get today's date for overdue calculation
-    today_str = dt.now().strftime('%Y-%m-%d')
-
-    return render_template("invoice_history.html",
-                           invoices=invoices,
-                           customers=customers,
-                           search_query=search_query,
-                           customer_filter=customer_filter,
-                           date_from=date_from,
-                           date_to=date_to,
-                           min_amount=min_amount,
-                           max_amount=max_amount,
-                           sort_by=sort_by,
-                           total_revenue=total_revenue,
-                           total_discounts=total_discounts,
-                           avg_invoice=avg_invoice,
-                           today_str=today_str)
+        if max_amount:
+            try:
+                query = query.filter(invoice.total_paise <= to_paise(max_amount))
+            except ValueError:
+                pass
+
+        # Statistics over every match in one aggregate of the same filtered
+        # query; the table shows one page. Bills without a total count as 0
+        invoice_count, revenue_paise, discount_paise, avg_paise = \
+            query.with_entities(
+                db.func.count(invoice.id),
+                db.func.coalesce(db.func.sum(invoice.total_paise), 0),
+                db.func.coalesce(db.func.sum(invoice.discount_amount_paise), 0),
+                db.func.coalesce(db.func.avg(
+                    db.func.coalesce(invoice.total_paise, 0)), 0)).one()
+
+        # Sort key per option; ties (and the default) go by id
+        sort_keys = {
+            "date_asc": (invoice.invoice_date, False),
+            "date_desc": (invoice.invoice_date, True),
+            "amount_asc": (invoice.total_paise, False),
+            "amount_desc": (invoice.total_paise, True),
+            "customer": (Customer.name, False),
+            "number": (invoice.number, False),
+        }
+        key, descending = sort_keys.get(sort_by, (None, True))
+        # The rows show each bill's customer (already joined for the
+        # filters) and item count
+        invoices, next_cursor = paging.page(
+            query.options(contains_eager(invoice.customer)), key, invoice.id,
+            descending=descending, cursor=request.args.get("after"),
+            size=page_size())
+        first_url, next_url = page_links(next_cursor)
+        load_invoice_items(invoices, years, session)
+
+        # Only the chosen customer: the filter field autocompletes
+        # through /search_customers
+        selected_customer = (session.get(Customer, customer_id)
+                             if customer_id else None)
+
+        total_revenue = from_paise(revenue_paise)
+        total_discounts = from_paise(discount_paise)
+        avg_invoice = from_paise(avg_paise)
+
+        # Get today's date for overdue calculation
+        today = dt.now().date()
+
+        return render_template("invoice_history.html",
+                               invoices=invoices,
+                               invoice_count=invoice_count,
+                               first_url=first_url,
+                               next_url=next_url,
+                               selected_customer=selected_customer,
+                               search_query=search_query,
+                               customer_filter=customer_filter,
+                               date_from=date_from,
+                               date_to=date_to,
+                               min_amount=min_amount,
+                               max_amount=max_amount,
+                               sort_by=sort_by,
+                               total_revenue=total_revenue,
+                               total_discounts=total_discounts,
+                               avg_invoice=avg_invoice,
+                               today=today)
 
 # ---------- PRINTING ROUTES ----------
 
 
+@app.route("/print_invoice/<invoice_number>", methods=["POST", "GET"])
 def print_invoice_route(invoice_number):
     """Print invoice"""
-    # First, ensure PDF exists
-    invoice = Invoice.query.filter_by(number=invoice_number).first()
+    # First, ensure the PDF exists and shows the bill as it is now
+    invoice = Invoice.query.options(*invoice_document_options()) \
+        .filter_by(number=invoice_number).first()
     if not invoice:
         flash(f"Invoice {invoice_number} not found", "danger")
         return redirect(url_for("invoices"))
 
-    # Generate PDF if it doesn't exist
-    pdf_path = os.path.join("invoices", f"{invoice_number}.pdf")
-    if not os.path.exists(pdf_path):
-        try:
-            if not generate_invoice_pdf(invoice, pdf_path):
-                flash(
-                    f"Failed to generate PDF for invoice {invoice_number}",
-                    "danger")
-                return redirect(url_for("invoices"))
-        except Exception as e:
-            flash(f"Error generating PDF: {str(e)}", "danger")
+    try:
+        if not invoice_pdf_file(invoice)[0]:
+            flash(
+                f"Failed to generate PDF for invoice {invoice_number}",
+                "danger")
             return redirect(url_for("invoices"))
+    except Exception as e:
+        flash(f"Error generating PDF: {str(e)}", "danger")
+        return redirect(url_for("invoices"))
 
     # Now proceed with printing
     printer_name = request.form.get(
@@ -1119,6 +2127,7 @@ def api_printers():
 # ---------- KHATA BOOK ROUTES ----------
 
 @app.route("/khata-book")
+@page_cache.cached(vary=page_vary)
 def khata_book():
     """Khata Book - Customer Account Ledger"""
     try:
@@ -1129,35 +2138,33 @@ def khata_book():
         selected_month = request.args.get('month') or dt.now().strftime('%Y-%m')
 
         # Base query for customers with outstanding balances
-        query = Customer.query.filter(Customer.outstanding_balance > 0)
+        query = Customer.query.filter(Customer.outstanding_balance_paise > 0)
 
         # Apply search filter
-        if search:
-            query = query.filter(
-                db.or_(
-                    Customer.name.ilike(f'%{search}%'),
-                    Customer.phone.ilike(f'%{search}%')
-                )
-            )
+        hits = fts.ranked('customer', search)
+        if hits is not None:
+            query = query.join(hits, hits.c.rowid == Customer.id)
 
         # Apply balance filter
         if balance_filter == 'high':
-            query = query.filter(Customer.outstanding_balance >= 10000)
+            query = query.filter(
+                Customer.outstanding_balance_paise >= to_paise(10000))
         elif balance_filter == 'medium':
             query = query.filter(
                 db.and_(
-                    Customer.outstanding_balance >= 1000,
-                    Customer.outstanding_balance < 10000
+                    Customer.outstanding_balance_paise >= to_paise(1000),
+                    Customer.outstanding_balance_paise < to_paise(10000)
                 )
             )
         elif balance_filter == 'low':
-            query = query.filter(Customer.outstanding_balance < 1000)
+            query = query.filter(
+                Customer.outstanding_balance_paise < to_paise(1000))
 
         # Apply sorting
         if sort_by == 'balance_desc':
-            query = query.order_by(Customer.outstanding_balance.desc())
+            query = query.order_by(Customer.outstanding_balance_paise.desc())
         elif sort_by == 'balance_asc':
-            query = query.order_by(Customer.outstanding_balance.asc())
+            query = query.order_by(Customer.outstanding_balance_paise.asc())
         elif sort_by == 'name':
             query = query.order_by(Customer.name.asc())
         elif sort_by == 'last_payment':
@@ -1178,15 +2185,15 @@ def khata_book():
 
         # Calculate money expected this month
         current_month = selected_month  # Use selected month instead of current month
-        money_expected_this_month = 0.0
-        
+
         # Include outstanding balances for customers with expected payment dates this month
-        customers_with_expected_payments = Customer.query.filter(
-            Customer.expected_next_payment_date.like(f'{current_month}%')
-        ).all()
-        
-        for customer in customers_with_expected_payments:
-            money_expected_this_month += customer.outstanding_balance
+        month_start, next_month_start = month_bounds(current_month)
+        money_expected_this_month = from_paise(db.session.query(
+            db.func.sum(Customer.outstanding_balance_paise)
+        ).filter(
+            Customer.expected_next_payment_date >= month_start,
+            Customer.expected_next_payment_date < next_month_start
+        ).scalar() or 0)
 
         # Generate month options for the filter (current month and next 11 months)
         month_options = []
@@ -1230,30 +2237,44 @@ def customer_khata(customer_id):
     try:
         customer = Customer.query.get_or_404(customer_id)
 
-        # Get all invoices for this customer
-        invoices = Invoice.query.filter_by(customer_id=customer_id).all()
-
-        # Get all payments for this customer
-        payments = db.session.query(Payment).join(Invoice).filter(
-            Invoice.customer_id == customer_id
-        ).order_by(Payment.payment_date.desc()).all()
+        # Ledger statement for the requested period (default: everything)
+        statement_from = parse_date(request.args.get('from'))
+        statement_to = parse_date(request.args.get('to'))
 
-        # Calculate total outstanding
-        total_outstanding = sum(
-            inv.total - inv.total_paid for inv in invoices
-            if inv.total > inv.total_paid
-        )
+        # Settled bills of archived years are listed when 'from' reaches them
+        years = (ArchivedYear.overlapping(statement_from, statement_to)
+                 if statement_from else [])
+        invoice = with_archives(Invoice, years)
+        payment = with_archives(Payment, years)
 
-        # Update customer's outstanding balance
-        customer.outstanding_balance = total_outstanding
-        db.session.commit()
+        # Get all invoices for this customer
+        invoices = db.session.query(invoice).filter(
+            invoice.customer_id == customer_id).all()
+
+        # Get all payments for this customer; payment.invoice in the
+        # template comes from the invoices above without another query
+        payments = db.session.query(payment).join(
+            invoice, payment.invoice_id == invoice.id
+        ).filter(
+            invoice.customer_id == customer_id
+        ).order_by(payment.payment_date.desc()).all()
+
+        # Balance is kept current by the ledger; nothing is written here
+        total_outstanding = customer.outstanding_balance
+        opening_paise, ledger_entries, closing_paise = LedgerEntry.statement(
+            customer_id, statement_from, statement_to)
 
         return render_template(
             "customer_khata.html",
             customer=customer,
             invoices=invoices,
             payments=payments,
-            total_outstanding=total_outstanding
+            total_outstanding=total_outstanding,
+            ledger_entries=ledger_entries,
+            opening_balance=from_paise(opening_paise),
+            closing_balance=from_paise(closing_paise),
+            statement_from=statement_from,
+            statement_to=statement_to
         )
     except Exception as e:
         flash(f"Error loading customer khata: {str(e)}", "danger")
@@ -1268,25 +2289,27 @@ def add_customer_payment(customer_id):
 
         if request.method == "POST":
             invoice_id = request.form.get("invoice_id")
-            amount = float(request.form.get("amount", 0))
-            payment_date = request.form.get("payment_date")
+            amount_paise = to_paise(request.form.get("amount") or 0)
+            amount = from_paise(amount_paise)
+            payment_date = parse_date(request.form.get("payment_date"))
             payment_method = request.form.get("payment_method")
             reference_number = request.form.get("reference_number")
             notes = request.form.get("notes")
-            expected_next_payment = request.form.get("expected_next_payment")
+            expected_next_payment = parse_date(
+                request.form.get("expected_next_payment"))
 
-            if not amount or not payment_date:
+            if not amount_paise or not payment_date:
                 flash("Please fill all required fields", "danger")
                 return redirect(request.url)
 
-            remaining_amount = amount
+            remaining_paise = amount_paise
 
             # If specific invoice selected, apply payment to that invoice
             if invoice_id:
                 # Create payment
                 payment = Payment(
                     invoice_id=invoice_id,
-                    amount=amount,
+                    amount_paise=amount_paise,
                     payment_date=payment_date,
                     payment_method=payment_method,
                     reference_number=reference_number,
@@ -1294,33 +2317,34 @@ def add_customer_payment(customer_id):
                     received_by="Admin"
                 )
                 db.session.add(payment)
+                db.session.flush()
+                LedgerEntry.post_payment(payment, customer.id)
 
                 # Update invoice total_paid
                 invoice = Invoice.query.get(invoice_id)
                 if invoice:
-                    payment_amount = min(remaining_amount, invoice.total - invoice.total_paid)
-                    invoice.total_paid += payment_amount
-                    if invoice.total_paid >= invoice.total:
-                        invoice.payment_status = 'paid'
-                    elif invoice.total_paid > 0:
-                        invoice.payment_status = 'partial'
-                    remaining_amount -= payment_amount
+                    applied_paise = min(remaining_paise, invoice.remaining_paise)
+                    invoice.total_paid_paise += applied_paise
+                    invoice.update_payment_status()
+                    remaining_paise -= applied_paise
             else:
                 # No specific invoice selected - apply to oldest unpaid invoices
                 unpaid_invoices = Invoice.query.filter_by(
                     customer_id=customer_id
-                ).filter(Invoice.total > Invoice.total_paid).order_by(Invoice.invoice_date).all()
+                ).filter(
+                    Invoice.total_paise > Invoice.total_paid_paise
+                ).order_by(Invoice.invoice_date).all()
 
                 for invoice in unpaid_invoices:
-                    if remaining_amount <= 0:
+                    if remaining_paise <= 0:
                         break
 
-                    payment_amount = min(remaining_amount, invoice.total - invoice.total_paid)
+                    applied_paise = min(remaining_paise, invoice.remaining_paise)
 
                     # Create payment for this invoice
                     payment = Payment(
                         invoice_id=invoice.id,
-                        amount=payment_amount,
+                        amount_paise=applied_paise,
                         payment_date=payment_date,
                         payment_method=payment_method,
                         reference_number=reference_number,
@@ -1328,18 +2352,23 @@ def add_customer_payment(customer_id):
                         received_by="Admin"
                     )
                     db.session.add(payment)
+                    db.session.flush()
+                    LedgerEntry.post_payment(payment, customer.id)
 
                     # Update invoice
-                    invoice.total_paid += payment_amount
-                    if invoice.total_paid >= invoice.total:
-                        invoice.payment_status = 'paid'
-                    elif invoice.total_paid > 0:
-                        invoice.payment_status = 'partial'
+                    invoice.total_paid_paise += applied_paise
+                    invoice.update_payment_status()
+
+                    remaining_paise -= applied_paise
 
-                    remaining_amount -= payment_amount
+                # Money beyond the unpaid bills is kept as an advance
+                LedgerEntry.post(
+                    customer.id, 'advance', credit_paise=remaining_paise,
+                    entry_date=payment_date,
+                    memo=f"Advance ({payment_method or 'cash'})")
 
-            # Update customer outstanding balance and last payment date
-            customer.outstanding_balance = max(0, customer.outstanding_balance - amount)
+            DailySummary.record_payment(
+                payment_date, amount_paise, payment_method)
             customer.last_payment_date = payment_date
             if expected_next_payment:
                 customer.expected_next_payment_date = expected_next_payment
@@ -1381,7 +2410,7 @@ def add_customer_payment(customer_id):
         # GET request - show form
         invoices = Invoice.query.filter_by(
             customer_id=customer_id
-        ).filter(Invoice.total > Invoice.total_paid).all()
+        ).filter(Invoice.total_paise > Invoice.total_paid_paise).all()
 
         return render_template(
             "add_payment.html",
@@ -1431,16 +2460,20 @@ def api_chat():
 # ---------- API ROUTES ----------
 
 
+@app.route("/api/dashboard_stats", methods=["GET"])
 def dashboard_stats():
     """API endpoint for dashboard statistics"""
     try:
+        totals = DailySummary.for_period(DailySummary.ALL)
+        today = DailySummary.for_period(dt.now().date())
         stats = {
-            'customers_count': Customer.query.count(),
+            'customers_count': totals.new_customers,
             'products_count': Product.query.count(),
-            'invoices_count': Invoice.query.count(),
-            'total_revenue': db.session.query(
-                db.func.sum(
-                    Invoice.total)).scalar() or 0}
+            'invoices_count': totals.bill_count,
+            'total_revenue': totals.revenue,
+            'today_bills': today.bill_count,
+            'today_revenue': today.revenue,
+            'today_payments': today.payments}
         return jsonify({"success": True, "stats": stats})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)})
@@ -1449,6 +2482,12 @@ def dashboard_stats():
 # ---------- ERROR HANDLERS ----------
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     """Handle 404 errors"""
@@ -1466,33 +2505,21 @@ def internal_error(error):
 
 # ---------- SETTINGS / ADMIN ROUTES ----------
 
-# Add missing settings routes
-@app.route("/settings", methods=["GET"])
-def settings_route():
-    return settings_page()
-
-@app.route("/settings/login", methods=["POST"])
-def settings_login_route():
-    return settings_login()
-
-@app.route("/settings/logout", methods=["GET"])
-def settings_logout_route():
-    return settings_logout()
-
-
 def admin_logged_in() -> bool:
     return session.get("admin_logged_in") is True
 
 
+@app.route("/settings", methods=["GET"])
 def settings_page():
     """Settings page (login if not authenticated)"""
     if not admin_logged_in():
         return render_template("settings.html", mode="login")
     # Some quick counts to show on settings page
+    totals = DailySummary.for_period(DailySummary.ALL)
     stats = {
-        "customers": Customer.query.count(),
+        "customers": totals.new_customers,
         "products": Product.query.count(),
-        "invoices": Invoice.query.count(),
+        "invoices": totals.bill_count,
     }
     # Load preferences
     prefs = {
@@ -1503,15 +2530,28 @@ def settings_page():
         'DEFAULT_PRINTER': AppSetting.get('DEFAULT_PRINTER', ''),
         'AUTO_PRINT_AFTER_SAVE': (
             AppSetting.get('AUTO_PRINT_AFTER_SAVE', 'false') or 'false'
-        ).lower() == 'true'
+        ).lower() == 'true',
+        'INVOICE_FY_PREFIX': (
+            AppSetting.get('INVOICE_FY_PREFIX', 'false') or 'false'
+        ).lower() == 'true',
+        'PAGE_SIZE': paging.clean_page_size(AppSetting.get('PAGE_SIZE')),
+    }
+    # Saved connection profile next to what the live connection reports
+    db_prefs = {
+        name: AppSetting.get(db_profile.setting_key(name)) or default
+        for name, default in db_profile.DEFAULT_PROFILE.items()
     }
     return render_template(
         "settings.html",
         mode="settings",
         stats=stats,
-        prefs=prefs)
+        prefs=prefs,
+        db_prefs=db_prefs,
+        db_choices=db_profile.CHOICES,
+        db_active=db_profile.current_pragmas(db.engine))
 
 
+@app.route("/settings/login", methods=["POST"])
 def settings_login():
     username = request.form.get("username", "").strip()
     password = request.form.get("password", "")
@@ -1525,6 +2565,7 @@ def settings_login():
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/logout", methods=["POST"])
 def settings_logout():
     session.pop("admin_logged_in", None)
     session.pop("admin_username", None)
@@ -1532,6 +2573,7 @@ def settings_logout():
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/change_credentials", methods=["POST"])
 def change_credentials():
     if not admin_logged_in():
         flash("Please login first.", "danger")
@@ -1569,6 +2611,7 @@ def change_credentials():
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/update_preferences", methods=["POST"])
 def update_preferences():
     if not admin_logged_in():
         flash("Please login first.", "danger")
@@ -1602,16 +2645,83 @@ def update_preferences():
     AppSetting.set(
         'AUTO_PRINT_AFTER_SAVE',
         'true' if request.form.get('auto_print') == 'on' else 'false')
+    AppSetting.set(
+        'INVOICE_FY_PREFIX',
+        'true' if request.form.get('invoice_fy_prefix') == 'on' else 'false')
+    AppSetting.set(
+        'PAGE_SIZE',
+        str(paging.clean_page_size(request.form.get('page_size'))))
     flash("Preferences saved.", "success")
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/update_db_profile", methods=["POST"])
+def update_db_profile():
+    if not admin_logged_in():
+        flash("Please login first.", "danger")
+        return redirect(url_for("settings_page"))
+    try:
+        profile = {
+            name: db_profile.clean_value(
+                name, request.form.get(name, default))
+            for name, default in db_profile.DEFAULT_PROFILE.items()
+        }
+    except ValueError as e:
+        flash(f"Database settings not saved: {e}", "danger")
+        return redirect(url_for("settings_page"))
+    for name, value in profile.items():
+        AppSetting.set(db_profile.setting_key(name), str(value))
+    # Drop pooled connections so new ones pick up the profile
+    db.engine.dispose()
+    flash("Database settings saved.", "success")
+    return redirect(url_for("settings_page"))
+
+
+@app.route("/settings/queries")
+def query_stats():
+    """Queries run by the latest requests, N+1 suspects first"""
+    if not admin_logged_in():
+        flash("Please login first.", "danger")
+        return redirect(url_for("settings_page"))
+    requests = query_monitor.recent()
+    requests.sort(key=lambda r: not r['repeated'])
+    return render_template("query_stats.html", requests=requests,
+                           threshold=query_monitor.REPEAT_THRESHOLD)
+
+
+@app.route("/settings/slow-queries", methods=["GET", "POST"])
+def slow_query_log():
+    """Slowest statement fingerprints by total time, and the threshold"""
+    if not admin_logged_in():
+        flash("Please login first.", "danger")
+        return redirect(url_for("settings_page"))
+    if request.method == "POST":
+        try:
+            threshold = slow_queries.clean_threshold(request.form.get("threshold"))
+        except ValueError as e:
+            flash(f"Threshold not saved: {e}", "danger")
+        else:
+            AppSetting.set(slow_queries.SETTING_KEY, str(threshold))
+            slow_queries.set_threshold(threshold)
+            flash("Slow query threshold saved.", "success")
+        return redirect(url_for("slow_query_log"))
+    return render_template("slow_queries.html",
+                           statements=slow_queries.worst(),
+                           threshold=slow_queries.threshold_ms,
+                           log_path=slow_queries.log_path)
+
+
 def _clear_invoices_internal():
-    # Delete invoice items first
+    # Delete invoice items and PDF jobs first
     InvoiceItem.query.delete()
+    PdfJob.query.delete()
     db.session.commit()
-    # Delete invoices
+    # Delete invoices and the aggregates built from them
     Invoice.query.delete()
+    CustomerStats.query.delete()
+    LedgerEntry.query.delete()
+    db.session.query(Customer).update({Customer.outstanding_balance_paise: 0})
+    DailySummary.rebuild()
     db.session.commit()
     # Remove PDFs
     try:
@@ -1624,6 +2734,7 @@ def _clear_invoices_internal():
                         pass
     except Exception:
         pass
+    pdf_cache.clear()
 
 
 def _check_admin_password(form_field_name='admin_password'):
@@ -1633,6 +2744,7 @@ def _check_admin_password(form_field_name='admin_password'):
     return bool(admin and admin.check_password(pwd))
 
 
+@app.route("/settings/clear_products", methods=["POST"])
 def clear_products():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
@@ -1646,6 +2758,7 @@ def clear_products():
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/clear_customers", methods=["POST"])
 def clear_customers():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
@@ -1656,12 +2769,16 @@ def clear_customers():
     # Detach customers from invoices to avoid FK issues
     db.session.query(Invoice).update({Invoice.customer_id: None})
     db.session.commit()
+    CustomerStats.query.delete()
+    LedgerEntry.query.delete()
     Customer.query.delete()
+    DailySummary.rebuild()
     db.session.commit()
     flash("All customers cleared.", "success")
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/clear_invoices", methods=["POST"])
 def clear_invoices():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
@@ -1674,6 +2791,7 @@ def clear_invoices():
     return redirect(url_for("settings_page"))
 
 
+@app.route("/settings/clear_all", methods=["POST"])
 def clear_all():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
@@ -1684,33 +2802,41 @@ def clear_all():
     _clear_invoices_internal()
     Product.query.delete()
     Customer.query.delete()
+    DailySummary.rebuild()
     db.session.commit()
     flash("All data cleared (invoices, products, customers).", "success")
     return redirect(url_for("settings_page"))
 
 
+@app.route('/settings/backup_db', methods=['GET'])
 def backup_db():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
         return redirect(url_for('settings_page'))
-    # Prefer configured DB path; for sqlite:///data.db this is project root
-    db_path = os.path.join(os.path.dirname(__file__), 'data.db')
-    if not os.path.exists(db_path):
-        # Fallback to instance folder
-        db_path = os.path.join(
-            os.path.dirname(__file__),
-            'instance',
-            'data.db')
-    if not os.path.exists(db_path):
+    db_path = db.engine.url.database
+    if not db_path or not os.path.exists(db_path):
         flash('Database file not found.', 'danger')
         return redirect(url_for('settings_page'))
+    # In WAL mode recent commits may still sit in the -wal file, so copy
+    # through SQLite's online backup API instead of the raw file. The copy
+    # is a single step on a report connection: one read snapshot that
+    # billing writes carry on beside
+    backup_path = os.path.join(tempfile.mkdtemp(), 'backup.db')
+    source = report_engine.raw_connection()
+    try:
+        target = sqlite3.connect(backup_path)
+        source.driver_connection.backup(target)
+        target.close()
+    finally:
+        source.close()
     return send_file(
-        db_path,
+        backup_path,
         as_attachment=True,
         download_name=f"backup_{
             dt.now().strftime('%Y%m%d_%H%M%S')}.db")
 
 
+@app.route('/settings/backup_invoices', methods=['GET'])
 def backup_invoices():
     if not admin_logged_in():
         flash("Unauthorized.", "danger")
@@ -1731,27 +2857,90 @@ def backup_invoices():
         ))
 
 
+@app.route('/export_products')
 def export_products():
+    def rows():
+        with db_profile.snapshot_session(report_engine) as session:
+            result = session.execute(
+                db.select(Product.barcode, Product.name, Product.description,
+                          Product.company, Product.price, Product.tax)
+                .execution_options(yield_per=EXPORT_BATCH))
+            for barcode, name, description, company, price, tax in result:
+                yield [barcode or '', name, description or '',
+                       company or '', price or 0, tax or 0]
+
+    return csv_download(
+        f"products_export_{dt.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        ['Barcode', 'Name', 'Description', 'Company', 'Price', 'Tax'],
+        rows())
+
+
+IMPORT_MODELS = {'products': Product, 'customers': Customer}
+
+
+def import_records(kind, rows, batch_size=importer.BATCH_SIZE):
+    """Write (line, raw row) pairs from importer.read_rows, one transaction
+    per batch. Yields running totals with that batch's errors after each
+    batch; the last one has done=True (and error if the file broke off)."""
+    spec = importer.KINDS[kind]
+    table = IMPORT_MODELS[kind].__table__
+    today = dt.now().date()
+    insert_only = {'created_on': today} if kind == 'customers' else None
+    names = product_names if kind == 'products' else customer_names
+    totals = {'rows': 0, 'created': 0, 'updated': 0, 'failed': 0}
+    started = time.perf_counter()
     try:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Barcode', 'Name', 'Description',
-                        'Company', 'Price', 'Tax'])
-        for p in Product.query.all():
-            writer.writerow([p.barcode or '',
-                             p.name,
-                             p.description or '',
-                             p.company or '',
-                             p.price or 0,
-                             p.tax or 0])
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f"attachment; filename=products_export_{
-            dt.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        return response
-    except Exception as e:
-        flash(f"Export failed: {e}", 'danger')
-        return redirect(url_for('settings_page'))
+        for batch in importer.batches(rows, batch_size):
+            created, updated, errors = importer.write_batch(
+                db.session, spec, table, batch, insert_only)
+            if kind == 'customers' and created:
+                DailySummary.bump(today, new_customers=created)
+            db.session.commit()
+            totals['rows'] += len(batch)
+            totals['created'] += created
+            totals['updated'] += updated
+            totals['failed'] += len(errors)
+            yield dict(totals, errors=errors)
+    except ValueError as e:
+        totals['error'] = str(e)
+    finally:
+        # Core UPSERTs bypass the ORM events that keep Chotu's index and
+        # the cached pages current (row-by-row retries skip the session)
+        names.invalidate()
+        data_version.bump()
+    yield dict(totals, errors=[], done=True,
+               seconds=round(time.perf_counter() - started, 3))
+
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    """Import an uploaded CSV/XLSX of products or customers, streaming one
+    JSON line of progress per batch"""
+    if not admin_logged_in():
+        return jsonify({"success": False, "error": "Unauthorized."}), 403
+    if kind not in importer.KINDS:
+        return jsonify({"success": False, "error": f"Cannot import {kind}."}), 404
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"success": False, "error": "Choose a CSV or XLSX file."}), 400
+    # Flask closes the upload when the view returns, before the response
+    # has streamed, so the rows are read from a copy
+    stream = tempfile.TemporaryFile()
+    upload.save(stream)
+    stream.seek(0)
+    try:
+        rows = importer.read_rows(stream, upload.filename, importer.KINDS[kind])
+    except ValueError as e:
+        stream.close()
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    def progress():
+        with stream:
+            for totals in import_records(kind, rows):
+                yield json.dumps(totals) + "\n"
+
+    return Response(stream_with_context(progress()),
+                    mimetype='application/x-ndjson')
 
 # ---------- PAYMENT MANAGEMENT ROUTES ----------
 
@@ -1770,9 +2959,11 @@ def add_payment(invoice_id):
 
     if request.method == "POST":
         try:
-            amount = float(request.form.get("amount", 0))
-            payment_date = request.form.get(
-                "payment_date", dt.now().strftime("%Y-%m-%d"))
+            amount_paise = to_paise(request.form.get("amount") or 0)
+            amount = from_paise(amount_paise)
+            payment_date = (
+                parse_date(request.form.get("payment_date"))
+                or dt.now().date())
             payment_method = request.form.get("payment_method", "cash")
             reference_number = request.form.get("reference_number", "")
             notes = request.form.get("notes", "")
@@ -1781,7 +2972,7 @@ def add_payment(invoice_id):
             # Create payment
             payment = Payment(
                 invoice_id=invoice_id,
-                amount=amount,
+                amount_paise=amount_paise,
                 payment_date=payment_date,
                 payment_method=payment_method,
                 reference_number=reference_number,
@@ -1789,19 +2980,17 @@ def add_payment(invoice_id):
                 received_by=received_by
             )
             db.session.add(payment)
+            db.session.flush()
 
             # Update invoice payment status
-            invoice.total_paid = (invoice.total_paid or 0) + amount
-            if invoice.total_paid >= invoice.total:
-                invoice.payment_status = 'paid'
-            else:
-                invoice.payment_status = 'partial'
+            invoice.total_paid_paise = (
+                (invoice.total_paid_paise or 0) + amount_paise)
+            invoice.update_payment_status()
+            LedgerEntry.post_payment(payment, invoice.customer_id)
+            DailySummary.record_payment(
+                payment_date, amount_paise, payment_method)
 
-            # Update customer's outstanding balance
             if invoice.customer:
-                invoice.customer.outstanding_balance = max(
-                    0, (invoice.customer.outstanding_balance or 0) - amount
-                )
                 invoice.customer.last_payment_date = payment_date
 
             db.session.commit()
@@ -1834,6 +3023,7 @@ def add_payment(invoice_id):
     return render_template("add_payment.html", invoice=invoice, today=dt.now().strftime("%Y-%m-%d"))
 
 
+@app.route("/payment/<int:payment_id>/delete", methods=["POST"])
 def delete_payment(payment_id):
     """Delete a payment"""
     payment = Payment.query.get_or_404(payment_id)
@@ -1842,15 +3032,15 @@ def delete_payment(payment_id):
     try:
         # Update invoice totals
         invoice = payment.invoice
-        invoice.total_paid = (invoice.total_paid or 0) - payment.amount
+        invoice.total_paid_paise = (
+            (invoice.total_paid_paise or 0) - (payment.amount_paise or 0))
 
         # Update payment status
-        if invoice.total_paid <= 0:
-            invoice.payment_status = 'unpaid'
-        elif invoice.total_paid < invoice.total:
-            invoice.payment_status = 'partial'
-        else:
-            invoice.payment_status = 'paid'
+        invoice.update_payment_status()
+        LedgerEntry.post_payment(payment, invoice.customer_id, reversal=True)
+        DailySummary.record_payment(
+            payment.payment_date, -(payment.amount_paise or 0),
+            payment.payment_method)
 
         db.session.delete(payment)
         db.session.commit()
@@ -0,0 +1,223 @@
+"""
+Financial-year archives
+Settled invoices of a closed financial year (with their items and payments)
+are moved out of the main database into one SQLite file per year. Day to
+day pages only read the main file; an archive is ATTACHed to the connection
+when a date filter reaches into its year, and its rows are read through a
+UNION ALL with the main table.
+
+Archive tables mirror the main schema (columns are added on attach when
+the main tables have grown), and each archive carries its own copy of
+invoice_fts so searches still cover it. Archived rows are never written
+again.
+"""
+
+import re
+
+from sqlalchemy import Column, MetaData, Table, select, union_all
+
+# Tables whose closed-year rows are archived, parents first
+TABLES = ('invoice', 'invoice_item', 'payment')
+# Full-text indexes copied along with their table
+FTS_TABLES = {'invoice': 'invoice_fts'}
+# Main-file rows about an invoice that are dropped, not archived, with it
+DROPPED_TABLES = ('pdf_job',)
+# SQLite's default SQLITE_MAX_ATTACHED
+MAX_ATTACHED = 10
+
+_metadata = MetaData()
+# (schema, path) of archives this process has brought in step with the
+# main schema; other connections attaching them need not check again
+_synced = set()
+
+
+def schema_name(label):
+    """Schema an archive is attached as: '2023-24' -> 'fy2023_24'"""
+    return 'fy' + label.replace('-', '_')
+
+
+def file_name(label):
+    return f"invoices-{label}.db"
+
+
+def attached_schemas(conn):
+    return {row[1] for row in conn.exec_driver_sql("PRAGMA database_list")}
+
+
+def attach(conn, archives):
+    """ATTACH (label, path) archives not yet on this connection.
+
+    Returns their schema names. Connections are pooled, so archives stay
+    attached; other archives are detached when SQLite's limit is reached.
+    What is attached is kept in the connection's info, so an archive that
+    is already there costs no query at all.
+    """
+    if len(archives) > MAX_ATTACHED:
+        raise ValueError(f"At most {MAX_ATTACHED} archived years can be read at once")
+    wanted = [schema_name(label) for label, _ in archives]
+    current = conn.info.get('archives')
+    if current is None:
+        current = conn.info['archives'] = {
+            s for s in attached_schemas(conn) if s.startswith('fy')}
+    missing = [(schema, path) for schema, (_, path) in zip(wanted, archives)
+               if schema not in current]
+    extra = sorted(current.difference(wanted))
+    while extra and len(current) + len(missing) > MAX_ATTACHED:
+        schema = extra.pop()
+        conn.exec_driver_sql(f"DETACH DATABASE {schema}")
+        current.discard(schema)
+    for schema, path in missing:
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (path,))
+        if (schema, path) not in _synced:
+            sync_schema(conn, schema)
+            _synced.add((schema, path))
+        current.add(schema)
+    return wanted
+
+
+def _columns(conn, schema, table):
+    return [(row[1], row[2]) for row in
+            conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _in_schema(sql, schema):
+    """Rewrite a main-schema CREATE statement to create in schema"""
+    return re.sub(r'^CREATE (UNIQUE |VIRTUAL )?(TABLE|INDEX) ',
+                  lambda m: f"CREATE {m.group(1) or ''}{m.group(2)} "
+                            f"IF NOT EXISTS {schema}.",
+                  sql, count=1)
+
+
+def sync_schema(conn, schema):
+    """Create missing archive tables/indexes and add missing columns.
+
+    Only writes when something is missing, so an archive that is already
+    in step can be attached to a read-only connection.
+    """
+    existing = {row[0] for row in conn.exec_driver_sql(
+        f"SELECT name FROM {schema}.sqlite_master")}
+    names = list(TABLES) + [FTS_TABLES[t] for t in TABLES if t in FTS_TABLES]
+    for name in names:
+        if name in existing:
+            continue
+        sql = conn.exec_driver_sql(
+            "SELECT sql FROM main.sqlite_master WHERE name = ?", (name,)).scalar()
+        conn.exec_driver_sql(_in_schema(sql, schema))
+    for table in TABLES:
+        have = {name for name, _ in _columns(conn, schema, table)}
+        for name, ddl_type in _columns(conn, 'main', table):
+            if name not in have:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {ddl_type}")
+        for name, sql in conn.exec_driver_sql(
+                "SELECT name, sql FROM main.sqlite_master WHERE type = 'index' "
+                "AND tbl_name = ? AND sql IS NOT NULL", (table,)):
+            if name not in existing:
+                conn.exec_driver_sql(_in_schema(sql, schema))
+    for fts in FTS_TABLES.values():
+        rank = conn.exec_driver_sql(
+            f"SELECT v FROM main.{fts}_config WHERE k = 'rank'").scalar()
+        archived_rank = conn.exec_driver_sql(
+            f"SELECT v FROM {schema}.{fts}_config WHERE k = 'rank'").scalar()
+        if rank and rank != archived_rank:
+            conn.exec_driver_sql(
+                f"INSERT INTO {schema}.{fts} ({fts}, rank) VALUES ('rank', ?)", (rank,))
+
+
+def move_year(conn, label, path, start, end):
+    """Move settled invoices dated in [start, end) into the year's archive.
+
+    The main tables' ids are AUTOINCREMENT, so SQLite never hands the
+    moved ids out again. Returns rows moved per table.
+    """
+    schema, = attach(conn, [(label, path)])
+    # The file may be new, or replaced since this process last checked it
+    sync_schema(conn, schema)
+    conn.exec_driver_sql("DROP TABLE IF EXISTS temp.archive_invoice_ids")
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE archive_invoice_ids AS SELECT id FROM main.invoice "
+        "WHERE invoice_date >= ? AND invoice_date < ? "
+        "AND COALESCE(total_paid_paise, 0) >= COALESCE(total_paise, 0)",
+        (start, end))
+
+    moved = {}
+    for table in TABLES:
+        key = 'id' if table == 'invoice' else 'invoice_id'
+        where = f"{key} IN (SELECT id FROM temp.archive_invoice_ids)"
+        columns = ', '.join(name for name, _ in _columns(conn, 'main', table))
+        moved[table] = conn.exec_driver_sql(
+            f"INSERT INTO {schema}.{table} ({columns}) "
+            f"SELECT {columns} FROM main.{table} WHERE {where}").rowcount
+        fts = FTS_TABLES.get(table)
+        if fts:
+            fts_columns = ', '.join(
+                name for name, _ in _columns(conn, 'main', fts))
+            conn.exec_driver_sql(
+                f"INSERT INTO {schema}.{fts} (rowid, {fts_columns}) "
+                f"SELECT rowid, {fts_columns} FROM main.{fts} "
+                f"WHERE rowid IN (SELECT id FROM temp.archive_invoice_ids)")
+    # Background PDF jobs of a closed year's bills are of no further use
+    for table in DROPPED_TABLES:
+        conn.exec_driver_sql(
+            f"DELETE FROM main.{table} "
+            f"WHERE invoice_id IN (SELECT id FROM temp.archive_invoice_ids)")
+    # Children first; the invoice delete trigger clears main invoice_fts
+    for table in reversed(TABLES):
+        key = 'id' if table == 'invoice' else 'invoice_id'
+        conn.exec_driver_sql(
+            f"DELETE FROM main.{table} "
+            f"WHERE {key} IN (SELECT id FROM temp.archive_invoice_ids)")
+    conn.exec_driver_sql("DROP TABLE temp.archive_invoice_ids")
+    return moved
+
+
+def reserve_ids(conn, schema):
+    """Raise the main tables' id sequences past the ids in an archive.
+
+    Archives made before the tables were AUTOINCREMENT may hold ids above
+    anything left in the main file; a new row must not take one of them.
+    """
+    for table in TABLES:
+        top = conn.exec_driver_sql(f"SELECT MAX(id) FROM {schema}.{table}").scalar()
+        if top is None:
+            continue
+        seq = conn.exec_driver_sql(
+            "SELECT seq FROM main.sqlite_sequence WHERE name = ?", (table,)).scalar()
+        if seq is None:
+            conn.exec_driver_sql(
+                "INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)",
+                (table, top))
+        elif seq < top:
+            conn.exec_driver_sql(
+                "UPDATE main.sqlite_sequence SET seq = ? WHERE name = ?", (top, table))
+
+
+def archived_table(table, schema):
+    """Core Table for table's copy in an attached archive"""
+    key = f"{schema}.{table.name}"
+    if key not in _metadata.tables:
+        # Plain columns: archives are only read, so no keys or defaults
+        Table(table.name, _metadata,
+              *[Column(column.name, column.type, primary_key=column.primary_key)
+                for column in table.columns],
+              schema=schema)
+    return _metadata.tables[key]
+
+
+def union_all_years(table, schemas, where=None):
+    """Subquery of table's rows in the main file and the given archives.
+
+    where(source, schema), if given, is a criterion on each file's rows. It
+    goes inside the union: SQLite does not push every kind of filter (an IN
+    subquery, say) down into the parts, and outside it would read them all.
+    """
+    sources = [(table, 'main')] + [
+        (archived_table(table, schema), schema) for schema in schemas]
+    parts = []
+    for source, schema in sources:
+        part = select(*[source.c[column.name] for column in table.columns])
+        criterion = where(source, schema) if where else None
+        if criterion is not None:
+            part = part.where(criterion)
+        parts.append(part)
+    return union_all(*parts).subquery(f"{table.name}_all_years")
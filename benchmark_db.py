@@ -0,0 +1,143 @@
+"""
+Concurrent read/write benchmark for the SQLite connection profile.
+
+Runs the same workload (reader threads running khata-style aggregates while
+writer threads save invoices) against a scratch database twice: once with
+SQLite's stock settings and once with db_profile.DEFAULT_PROFILE.
+
+    python benchmark_db.py [--seconds 10] [--readers 6] [--writers 2]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from db_profile import DEFAULT_PROFILE, apply_profile
+
+SCHEMA = [
+    "CREATE TABLE customer (id INTEGER PRIMARY KEY, name TEXT, "
+    "outstanding_balance_paise INTEGER DEFAULT 0)",
+    "CREATE TABLE invoice (id INTEGER PRIMARY KEY, customer_id INTEGER, "
+    "invoice_date DATE, total_paise INTEGER, total_paid_paise INTEGER DEFAULT 0)",
+    "CREATE TABLE invoice_item (id INTEGER PRIMARY KEY, invoice_id INTEGER, "
+    "description TEXT, line_total_paise INTEGER)",
+    "CREATE INDEX ix_invoice_customer ON invoice (customer_id, invoice_date)",
+    "CREATE INDEX ix_invoice_item_invoice_id ON invoice_item (invoice_id)",
+]
+
+CUSTOMERS = 500
+
+# SQLite defaults, except pysqlite's own 5 s busy timeout which is what the
+# app got before the profile existed
+STOCK_PROFILE = {
+    'busy_timeout': 5000,
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+}
+
+
+def make_database(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for ddl in SCHEMA:
+            conn.exec_driver_sql(ddl)
+        conn.execute(text("INSERT INTO customer (id, name) VALUES (:id, :name)"),
+                     [{"id": i, "name": f"Customer {i}"} for i in range(1, CUSTOMERS + 1)])
+        conn.execute(
+            text("INSERT INTO invoice (customer_id, invoice_date, total_paise) "
+                 "VALUES (:c, '2025-09-01', :t)"),
+            [{"c": random.randint(1, CUSTOMERS), "t": random.randint(100, 500000)}
+             for _ in range(20000)])
+    engine.dispose()
+
+
+def read_once(conn):
+    customer_id = random.randint(1, CUSTOMERS)
+    conn.execute(text(
+        "SELECT SUM(total_paise - total_paid_paise), COUNT(*) FROM invoice "
+        "WHERE customer_id = :c"), {"c": customer_id}).one()
+    conn.execute(text(
+        "SELECT SUM(outstanding_balance_paise) FROM customer "
+        "WHERE outstanding_balance_paise > 0")).scalar()
+
+
+def write_once(conn):
+    customer_id = random.randint(1, CUSTOMERS)
+    invoice_id = conn.execute(text(
+        "INSERT INTO invoice (customer_id, invoice_date, total_paise) "
+        "VALUES (:c, '2025-10-01', 0) RETURNING id"), {"c": customer_id}).scalar()
+    total = 0
+    for n in range(3):
+        line = random.randint(100, 50000)
+        total += line
+        conn.execute(text(
+            "INSERT INTO invoice_item (invoice_id, description, line_total_paise) "
+            "VALUES (:i, :d, :l)"), {"i": invoice_id, "d": f"Item {n}", "l": line})
+    conn.execute(text("UPDATE invoice SET total_paise = :t WHERE id = :i"),
+                 {"t": total, "i": invoice_id})
+    conn.execute(text(
+        "UPDATE customer SET outstanding_balance_paise = "
+        "outstanding_balance_paise + :t WHERE id = :c"), {"t": total, "c": customer_id})
+
+
+def worker(engine, action, deadline, counts, key):
+    done = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                action(conn)
+            done += 1
+        except OperationalError:
+            errors += 1
+    with counts["lock"]:
+        counts[key] += done
+        counts["errors"] += errors
+
+
+def run(label, profile, path, seconds, readers, writers):
+    engine = create_engine(f"sqlite:///{path}", pool_size=readers + writers)
+    event.listen(engine, "connect",
+                 lambda dbapi_conn, record: apply_profile(dbapi_conn, profile))
+    counts = {"reads": 0, "writes": 0, "errors": 0, "lock": threading.Lock()}
+    deadline = time.monotonic() + seconds
+    threads = (
+        [threading.Thread(target=worker, args=(engine, read_once, deadline, counts, "reads"))
+         for _ in range(readers)]
+        + [threading.Thread(target=worker, args=(engine, write_once, deadline, counts, "writes"))
+           for _ in range(writers)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    print(f"{label:<8} reads/s {counts['reads'] / seconds:>9.1f}   "
+          f"writes/s {counts['writes'] / seconds:>8.1f}   "
+          f"lock errors {counts['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chotu-bench-")
+    for label, profile in (("stock", STOCK_PROFILE), ("profile", DEFAULT_PROFILE)):
+        path = os.path.join(work_dir, f"{label}.db")
+        random.seed(42)
+        make_database(path)
+        run(label, profile, path, args.seconds, args.readers, args.writers)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import os
 from datetime import datetime
 import re
 from openai import OpenAI
+from money import to_paise, from_paise
+import metrics
+from dates import parse_date, format_date
 
 
 class ChotuAssistant:
@@ -19,7 +22,13 @@ class ChotuAssistant:
             product_model=None,
             invoice_model=None,
             invoice_item_model=None,
-            db=None):
+            db=None,
+            invoice_sequence_model=None,
+            customer_stats_model=None,
+            ledger_model=None,
+            summary_model=None,
+            product_index=None,
+            customer_index=None):
         """Initialize Chotu Assistant with database models"""
         # Personality
         self.personality = {
@@ -102,6 +111,12 @@ class ChotuAssistant:
         self.product_model = product_model
         self.invoice_model = invoice_model
         self.invoice_item_model = invoice_item_model
+        self.invoice_sequence_model = invoice_sequence_model
+        self.customer_stats_model = customer_stats_model
+        self.ledger_model = ledger_model
+        self.summary_model = summary_model
+        self.product_index = product_index
+        self.customer_index = customer_index
         self.db = db
 
         # Conversation tracking
@@ -122,12 +137,24 @@ class ChotuAssistant:
             product_model,
             invoice_model,
             invoice_item_model=None,
-            db=None):
+            db=None,
+            invoice_sequence_model=None,
+            customer_stats_model=None,
+            ledger_model=None,
+            summary_model=None,
+            product_index=None,
+            customer_index=None):
         """Initialize database models after creation"""
         self.customer_model = customer_model
         self.product_model = product_model
         self.invoice_model = invoice_model
         self.invoice_item_model = invoice_item_model
+        self.invoice_sequence_model = invoice_sequence_model
+        self.customer_stats_model = customer_stats_model
+        self.ledger_model = ledger_model
+        self.summary_model = summary_model
+        self.product_index = product_index
+        self.customer_index = customer_index
         self.db = db
 
     def process_message(
@@ -220,12 +247,19 @@ class ChotuAssistant:
             messages = self._prepare_messages_for_openai_with_data(
                 message, session_id, database_context, conversation_history)
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_completion_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            with metrics.timed(metrics.OPENAI_SECONDS, metrics.OPENAI_FAILURES,
+                               model=self.model):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_completion_tokens=self.max_tokens,
+                    temperature=self.temperature
+                )
+            if response.usage:
+                metrics.OPENAI_TOKENS.inc(response.usage.prompt_tokens,
+                                          model=self.model, kind='prompt')
+                metrics.OPENAI_TOKENS.inc(response.usage.completion_tokens,
+                                          model=self.model, kind='completion')
 
             ai_response = response.choices[0].message.content.strip()
 
@@ -332,9 +366,8 @@ class ChotuAssistant:
                 self.db.session.commit()
                 return f"Customer {name} update ho gaya!"
             else:
-                new_customer = self.customer_model(
+                new_customer = self._add_customer(
                     name=name, phone=phone, address=address)
-                self.db.session.add(new_customer)
                 self.db.session.commit()
                 return f"Customer {name} add ho gaya!"
         except Exception as e:
@@ -383,9 +416,7 @@ class ChotuAssistant:
 
         try:
             # Find customer
-            customer = self.customer_model.query.filter(
-                self.customer_model.name.ilike(
-                    f'%{customer_name}%')).first()
+            customer = self._find_customer(customer_name)
             if not customer:
                 return f"Customer {customer_name} nahi mila. Pehle customer add kariye."
 
@@ -425,9 +456,7 @@ class ChotuAssistant:
                 return "Invoice nahi chal raha. Pehle invoice start kariye."
 
             # Find or create product
-            product = self.product_model.query.filter(
-                self.product_model.name.ilike(
-                    f'%{product_name}%')).first()
+            product = self._find_product(product_name)
             if not product:
                 if not price:
                     return f"Product {product_name} nahi mila aur price nahi diya. Price batayiye."
@@ -491,10 +520,11 @@ class ChotuAssistant:
                 return "Invoice nahi mila."
 
             # Calculate total
-            total = sum((item.line_total or 0)
-                        for item in invoice.invoice_items)
-            invoice.total = total
+            total_paise = sum((item.line_total_paise or 0)
+                              for item in invoice.invoice_items)
+            self._set_invoice_total(invoice, total_paise)
             self.db.session.commit()
+            total = from_paise(total_paise)
 
             # Clear state
             self.conversation_state[session_id] = {}
@@ -516,8 +546,8 @@ class ChotuAssistant:
             'invoice') or param_dict.get('invoicenumber')
         amount = param_dict.get('amount')
         payment_method = param_dict.get('method', 'cash')
-        payment_date = param_dict.get(
-            'date', datetime.now().strftime('%Y-%m-%d'))
+        payment_date = (parse_date(param_dict.get('date'))
+                        or datetime.now().date())
 
         if not invoice_number or not amount:
             return None
@@ -530,30 +560,37 @@ class ChotuAssistant:
                 return f"Invoice {invoice_number} nahi mila."
 
             # Record payment
-            amount_float = float(amount.replace('₹', '').replace(',', ''))
+            amount_paise = to_paise(amount)
+            amount_float = from_paise(amount_paise)
 
             # Import Payment model
             from app import Payment
 
             payment = Payment(
                 invoice_id=invoice.id,
-                amount=amount_float,
+                amount_paise=amount_paise,
                 payment_date=payment_date,
                 payment_method=payment_method,
                 notes="Recorded via chat assistant"
             )
             self.db.session.add(payment)
+            self.db.session.flush()
 
             # Update invoice payment status
-            invoice.total_paid = (invoice.total_paid or 0) + amount_float
-            if invoice.total_paid >= invoice.total:
-                invoice.payment_status = 'paid'
-            else:
-                invoice.payment_status = 'partial'
+            invoice.total_paid_paise = (
+                (invoice.total_paid_paise or 0) + amount_paise)
+            invoice.update_payment_status()
+            if self.ledger_model:
+                self.ledger_model.post_payment(payment, invoice.customer_id)
+            if self.summary_model:
+                self.summary_model.record_payment(
+                    payment_date, amount_paise, payment_method)
+            if invoice.customer:
+                invoice.customer.last_payment_date = payment_date
 
             self.db.session.commit()
 
-            remaining = invoice.total - invoice.total_paid
+            remaining = invoice.remaining_balance
             return f"Payment ₹{amount_float} record ho gaya! Remaining: ₹{remaining}"
         except Exception as e:
             self.db.session.rollback()
@@ -565,17 +602,17 @@ class ChotuAssistant:
             context = {}
 
             # Get customers
-            customers = self.customer_model.query.all()
+            customers = self.customer_model.query.limit(10).all()
             context['customers'] = [
                 {"name": c.name, "phone": c.phone, "address": c.address}
-                for c in customers[:10]  # Limit to avoid token overflow
+                for c in customers  # Limit to avoid token overflow
             ]
 
             # Get products
-            products = self.product_model.query.all()
+            products = self.product_model.query.limit(15).all()
             context['products'] = [
                 {"name": p.name, "price": p.price, "description": p.description}
-                for p in products[:15]  # Limit to avoid token overflow
+                for p in products  # Limit to avoid token overflow
             ]
 
             # Get recent invoices
@@ -589,21 +626,19 @@ class ChotuAssistant:
                     "number": inv.number,
                     "customer": (inv.customer.name if getattr(inv, 'customer', None) else "Unknown"),
                     "total": inv.total,
-                    "date": inv.invoice_date
+                    "date": format_date(inv.invoice_date)
                 }
                 for inv in recent_invoices
             ]
 
-            # Get today's business summary
-            today = datetime.now().strftime('%Y-%m-%d')
-            today_invoices = self.invoice_model.query.filter(
-                self.invoice_model.invoice_date == today
-            ).all()
-
-            context['today_summary'] = {
-                "bills_count": len(today_invoices),
-                "total_revenue": float(sum((inv.total or 0) for inv in today_invoices))
-            }
+            # Get today's business summary (one summary row)
+            if self.summary_model:
+                today = self.summary_model.for_period(datetime.now().date())
+                context['today_summary'] = {
+                    "bills_count": today.bill_count,
+                    "total_revenue": today.revenue,
+                    "payments_collected": today.payments
+                }
 
             return context
 
@@ -770,13 +805,20 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
                         if not inv.invoice_items:
                             try:
                                 self.db.session.delete(inv)
+                                if self.customer_stats_model:
+                                    self.customer_stats_model.refresh(
+                                        inv.customer_id)
+                                if self.summary_model:
+                                    self.summary_model.record_bill(
+                                        inv.invoice_date, 0, bills=-1)
                                 self.db.session.commit()
                             except Exception:
                                 self.db.session.rollback()
                         else:
                             try:
-                                inv.total = sum((it.line_total or 0)
-                                                for it in inv.invoice_items)
+                                self._set_invoice_total(inv, sum(
+                                    (it.line_total_paise or 0)
+                                    for it in inv.invoice_items))
                                 self.db.session.commit()
                             except Exception:
                                 self.db.session.rollback()
@@ -831,9 +873,8 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
                     customer_name = state.get('customer_name')
 
                     # Create customer
-                    new_customer = self.customer_model(
+                    new_customer = self._add_customer(
                         name=customer_name, phone=phone)
-                    self.db.session.add(new_customer)
                     self.db.session.commit()
 
                     # Clear state
@@ -887,9 +928,8 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
                         new_customer = existing_customer
                     else:
                         # Create new customer
-                        new_customer = self.customer_model(
+                        new_customer = self._add_customer(
                             name=customer_name, phone=phone, address=address)
-                        self.db.session.add(new_customer)
                         self.db.session.commit()
 
                     # Start invoice for this customer
@@ -951,6 +991,39 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
 
         return None
 
+    def _add_customer(self, **fields):
+        """Add a customer (caller commits) and count it in today's summary"""
+        today = datetime.now().date()
+        customer = self.customer_model(created_on=today, **fields)
+        self.db.session.add(customer)
+        if self.summary_model:
+            self.summary_model.bump(today, new_customers=1)
+        return customer
+
+    def _find_product(self, name):
+        """Best product for a spoken/typed name, or None"""
+        if self.product_index is None:
+            return self.product_model.query.filter(
+                self.product_model.name.ilike(f'%{name}%')).first()
+        match = self.product_index.best(name)
+        return self.db.session.get(self.product_model, match.id) if match else None
+
+    def _find_customer(self, name):
+        """Best customer for a spoken/typed name, or None"""
+        if self.customer_index is None:
+            return self.customer_model.query.filter(
+                self.customer_model.name.ilike(f'%{name}%')).first()
+        match = self.customer_index.best(name)
+        return self.db.session.get(self.customer_model, match.id) if match else None
+
+    def _suggest_products(self, name, limit=3):
+        """Closest product names to offer when nothing matched well"""
+        if self.product_index is not None:
+            suggestions = [m.name for m in self.product_index.search(name, limit)]
+            if suggestions:
+                return suggestions
+        return [p.name for p in self.product_model.query.limit(limit).all()]
+
     def _extract_customer_from_text(self, text):
         """Find a customer whose name appears in the text (case-insensitive)."""
         candidates = self.customer_model.query.all()
@@ -965,24 +1038,13 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
             return matches[0]
         return None
 
-    def _compute_next_invoice_number(self):
-        """Compute next invoice number by scanning existing numbers safely."""
-        try:
-            all_nums = [
-                inv.number for inv in self.invoice_model.query.all() if inv.number]
-            values = []
-            for n in all_nums:
-                m = re.search(r'(\d+)$', n)
-                if m:
-                    values.append(int(m.group(1)))
-            next_num = (max(values) + 1) if values else 1
-        except Exception:
-            next_num = (self.invoice_model.query.count() + 1)
-        return f"INV-{str(next_num).zfill(6)}"
+    def _compute_next_invoice_number(self, on_date=None):
+        """Reserve the next invoice number from the shared sequence table."""
+        return self.invoice_sequence_model.next_number(on_date)
 
     def _start_invoice_for_customer(self, customer):
-        today = datetime.now().strftime('%Y-%m-%d')
-        inv_no = self._compute_next_invoice_number()
+        today = datetime.now().date()
+        inv_no = self._compute_next_invoice_number(today)
         inv = self.invoice_model(
             number=inv_no,
             customer_id=customer.id,
@@ -992,20 +1054,41 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
             salesperson=None,
             notes=None,
             discount_type=None,
-            discount_amount=0.0,
-            total=0.0
+            discount_amount_paise=0,
+            total_paise=0
         )
         self.db.session.add(inv)
+        if self.customer_stats_model:
+            self.customer_stats_model.record_invoice(customer.id, 0, today)
+        if self.summary_model:
+            self.summary_model.record_bill(today, 0)
         self.db.session.commit()
         return inv
 
+    def _set_invoice_total(self, invoice, total_paise):
+        """Set an invoice total; stats and khata move by the change"""
+        delta_paise = total_paise - (invoice.total_paise or 0)
+        if self.customer_stats_model:
+            self.customer_stats_model.record_total_change(
+                invoice.customer_id, delta_paise)
+        if self.ledger_model:
+            # First total on a chat-built bill is the bill itself
+            kind = 'invoice_adjustment' if invoice.total_paise else 'invoice'
+            self.ledger_model.post_invoice_change(invoice, delta_paise, kind)
+        if self.summary_model:
+            self.summary_model.record_bill(
+                invoice.invoice_date, delta_paise, bills=0)
+        invoice.total_paise = total_paise
+
     def _finalize_invoice(self, session_id, invoice_id):
         invoice = self.invoice_model.query.get(invoice_id)
         if not invoice:
             return "Maaf kijiye, invoice nahi mila. Phir se try kariye."
-        total = sum((item.line_total or 0) for item in invoice.invoice_items)
-        invoice.total = total
+        total_paise = sum((item.line_total_paise or 0)
+                          for item in invoice.invoice_items)
+        self._set_invoice_total(invoice, total_paise)
         self.db.session.commit()
+        total = from_paise(total_paise)
         # Clear state
         self.conversation_state[session_id] = {}
         return f"✅ Invoice {
@@ -1065,10 +1148,8 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
                 product_part,
                 flags=re.IGNORECASE).strip()
 
-            # Find product by name (ILIKE)
-            product = self.product_model.query.filter(
-                self.product_model.name.ilike(f'%{product_part}%')
-            ).first()
+            # Find product by name (fuzzy, transliteration-aware)
+            product = self._find_product(product_part)
 
             if not product:
                 # Offer to create new product
@@ -1088,8 +1169,7 @@ Shop: {self.environment['shop_details']['name']}, {self.environment['shop_detail
                     return self._create_product_and_add_to_invoice(
                         session_id, price_override)
                 else:
-                    suggestions = [
-                        p.name for p in self.product_model.query.limit(3).all()]
+                    suggestions = self._suggest_products(product_part)
                     return f"'{product_part}' product database mein nahi hai. Price batayiye ya available products mein se choose kariye: {
                         ', '.join(suggestions)}."
 
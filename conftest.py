@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database and PDF folder before any test
+# imports it
+_test_dir = tempfile.mkdtemp(prefix="chotu-tests-")
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(_test_dir, "test.db"))
+os.environ.setdefault("INVOICE_DIR", os.path.join(_test_dir, "invoices"))
+# Tests run queued PDF jobs themselves (pdf_queue.run_pending())
+os.environ.setdefault("PDF_WORKERS", "0")
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client():
+    """Client with an admin session (separate from client), for the
+    settings and import views"""
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+        sess["admin_username"] = "admin"
+    return client
+
+
+@pytest.fixture(scope="module")
+def archive_year():
+    """archive_year(label) archives a closed financial year of the test
+    database; the module's archives are dropped again when it is done so
+    other modules read the main file only"""
+    from app import app, db, report_engine, ArchivedYear
+    labels = []
+
+    def archive(label):
+        labels.append(label)
+        moved = ArchivedYear.archive(label)
+        db.session.commit()
+        return moved
+
+    yield archive
+    with app.app_context():
+        paths = []
+        for label in labels:
+            year = db.session.get(ArchivedYear, label)
+            if year is not None:
+                paths.append(year.path)
+                db.session.delete(year)
+        db.session.commit()
+        # Pooled connections keep the archives attached
+        db.engine.dispose()
+    report_engine.dispose()
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,101 @@
+"""
+Data version counters
+A DataVersion is a number that goes up after every commit that wrote one
+of the tables it watches, whether through the ORM unit of work, a bulk
+query update/delete or a Core insert run on the session. Caches keep the
+version their contents were built at and rebuild when it moves on.
+
+Other processes on the same database (the CLI importer, archive-year)
+are noticed through a stamp file that is replaced on every bump. Its stat
+is compared at most once every STAMP_CHECK_SECONDS, so reading the
+version costs no query and at most one stat call a second.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+STAMP_CHECK_SECONDS = 1.0
+
+
+class DataVersion:
+    def __init__(self, stamp_path=None, check_every=STAMP_CHECK_SECONDS):
+        self.stamp_path = stamp_path
+        self.check_every = check_every
+        self.value = 0
+        self._lock = threading.Lock()
+        self._stamp = self._read_stamp()
+        self._checked = time.monotonic()
+
+    def current(self):
+        """The version, moved on if another process has bumped the stamp"""
+        if self.stamp_path is not None:
+            now = time.monotonic()
+            if now - self._checked >= self.check_every:
+                self._checked = now
+                stamp = self._read_stamp()
+                if stamp != self._stamp:
+                    with self._lock:
+                        self._stamp = stamp
+                        self.value += 1
+        return self.value
+
+    def bump(self):
+        """Move the version on here and in every other process"""
+        with self._lock:
+            self.value += 1
+            self._write_stamp()
+            self._stamp = self._read_stamp()
+
+    def watch(self, *models):
+        """Bump after any commit that wrote one of models' tables"""
+        tables = {model.__table__ for model in models}
+        flag = f"data_version_{id(self)}"
+
+        @event.listens_for(Session, "after_flush")
+        def _flushed(session, flush_context):
+            if any(isinstance(obj, models) for obj in
+                   (*session.new, *session.dirty, *session.deleted)):
+                session.info[flag] = True
+
+        @event.listens_for(Session, "do_orm_execute")
+        def _statement(orm_state):
+            if not (orm_state.is_insert or orm_state.is_update
+                    or orm_state.is_delete):
+                return
+            if (getattr(orm_state.statement, 'table', None) in tables
+                    or any(m.class_ in models for m in orm_state.all_mappers)):
+                orm_state.session.info[flag] = True
+
+        @event.listens_for(Session, "after_commit")
+        def _committed(session):
+            if session.info.pop(flag, False):
+                self.bump()
+
+        @event.listens_for(Session, "after_rollback")
+        def _rolled_back(session):
+            session.info.pop(flag, None)
+
+    def _read_stamp(self):
+        if self.stamp_path is None:
+            return None
+        try:
+            stat = os.stat(self.stamp_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _write_stamp(self):
+        if self.stamp_path is None:
+            return
+        temp_path = f"{self.stamp_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(f"{os.getpid()} {self.value} {time.time()}\n")
+            # A new file each time, so its inode changes too
+            os.replace(temp_path, self.stamp_path)
+        except OSError:
+            pass  # other processes catch up on their next write
@@ -0,0 +1,57 @@
+"""
+Date helpers
+Dates live in DATE columns (ISO 'YYYY-MM-DD' text in SQLite), so range
+filters and MIN/MAX run on indexes; strings only exist in forms and JSON.
+"""
+
+from datetime import date, datetime
+
+# Formats seen in form posts and older rows, most common first
+ACCEPTED_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y/%m/%d')
+
+
+def parse_date(value):
+    """Parse a form or legacy date string; None when blank or invalid"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    # Drop a time part such as '2025-10-01 14:30:00' or '2025-10-01T14:30'
+    if len(text) > 10 and text[10] in ' T':
+        text = text[:10]
+    for fmt in ACCEPTED_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def month_bounds(month):
+    """First day of a 'YYYY-MM' month and the first day of the next one"""
+    start = datetime.strptime(month, '%Y-%m').date()
+    if start.month == 12:
+        return start, date(start.year + 1, 1, 1)
+    return start, date(start.year, start.month + 1, 1)
+
+
+def financial_year(on_date):
+    """Indian financial year label (April-March) for a date, e.g. '2025-26'"""
+    start = on_date.year if on_date.month >= 4 else on_date.year - 1
+    return f"{start}-{str(start + 1)[-2:]}"
+
+
+def financial_year_bounds(label):
+    """First day of a '2025-26' financial year and the first day of the next"""
+    start = int(label[:4])
+    if label != f"{start}-{str(start + 1)[-2:]}":
+        raise ValueError(f"Invalid financial year: {label!r}")
+    return date(start, 4, 1), date(start + 1, 4, 1)
+
+
+def format_date(value):
+    """ISO string for JSON output; None stays None"""
+    return value.isoformat() if value else None
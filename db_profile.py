@@ -0,0 +1,138 @@
+"""
+SQLite connection profile
+PRAGMAs applied to every new pooled connection. WAL lets waitress threads
+read while one thread writes, and busy_timeout makes a second writer wait
+for the lock instead of failing with "database is locked".
+
+The profile is stored in the app_setting table (SQLITE_* keys) and read
+with the raw DB-API connection, so it works before any app context exists.
+
+Reports and exports use a second, read-only engine (snapshot_engine) so a
+long read neither takes a billing connection nor sees half of a write.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+DEFAULT_PROFILE = {
+    'busy_timeout': 5000,        # ms a writer waits for the lock
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # safe with WAL; fsync at checkpoints only
+    'cache_size': -65536,        # negative = KiB, i.e. 64 MB page cache
+    'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
+CHOICES = {
+    'journal_mode': ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY'),
+}
+
+# busy_timeout first so switching journal_mode waits for other connections
+PRAGMA_ORDER = tuple(DEFAULT_PROFILE)
+
+
+def setting_key(name):
+    """AppSetting key a PRAGMA is stored under"""
+    return f"SQLITE_{name.upper()}"
+
+
+def clean_value(name, value):
+    """Validate one PRAGMA value; raises ValueError when it is not allowed"""
+    if name in CHOICES:
+        value = str(value).strip().upper()
+        if value not in CHOICES[name]:
+            raise ValueError(f"{name} must be one of {', '.join(CHOICES[name])}")
+        return value
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number")
+    if name != 'cache_size' and number < 0:
+        raise ValueError(f"{name} cannot be negative")
+    return number
+
+
+def load_profile(dbapi_conn):
+    """Defaults overlaid with the saved SQLITE_* settings"""
+    profile = dict(DEFAULT_PROFILE)
+    try:
+        cursor = dbapi_conn.cursor()
+        cursor.execute("SELECT key, value FROM app_setting WHERE key LIKE 'SQLITE_%'")
+        saved = dict(cursor.fetchall())
+        cursor.close()
+    except sqlite3.Error:
+        # Brand new database: app_setting is created after the first connect
+        return profile
+    for name in PRAGMA_ORDER:
+        raw = saved.get(setting_key(name))
+        if raw in (None, ''):
+            continue
+        try:
+            profile[name] = clean_value(name, raw)
+        except ValueError:
+            pass  # keep the default rather than refuse to connect
+    return profile
+
+
+def apply_profile(dbapi_conn, profile):
+    cursor = dbapi_conn.cursor()
+    for name in PRAGMA_ORDER:
+        cursor.execute(f"PRAGMA {name} = {profile[name]}")
+    cursor.close()
+
+
+def current_pragmas(engine):
+    """PRAGMA values as seen by a live connection (for the settings page)"""
+    with engine.connect() as conn:
+        return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in PRAGMA_ORDER}
+
+
+def install(engine):
+    """Apply the profile on every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_on_connect(dbapi_conn, connection_record):
+        apply_profile(dbapi_conn, load_profile(dbapi_conn))
+
+
+def snapshot_engine(engine):
+    """Read-only engine on the same SQLite file for reports and exports.
+
+    Every transaction opens with an explicit BEGIN, so it is one SQLite read
+    transaction: in WAL mode it sees a single point-in-time snapshot and
+    never holds a lock that writers wait on. PRAGMA query_only refuses
+    writes, and the separate pool leaves the main engine's connections to
+    billing.
+    """
+    reader = create_engine(engine.url)
+    install(reader)
+
+    @event.listens_for(reader, "connect")
+    def _read_only(dbapi_conn, connection_record):
+        # pysqlite would not BEGIN before a SELECT; the begin hook does
+        dbapi_conn.isolation_level = None
+        dbapi_conn.execute("PRAGMA query_only = ON")
+
+    @event.listens_for(reader, "begin")
+    def _begin_snapshot(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return reader
+
+
+@contextmanager
+def snapshot_session(engine):
+    """ORM session reading one snapshot; the read transaction ends on exit"""
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,217 @@
+"""
+Bulk import
+Products and customers are imported from CSV or XLSX files; the headings
+of the export files are accepted as they are. Rows are read as a stream and
+written in batches: each batch is one executemany UPSERT keyed on the
+product barcode or the customer phone, in its own transaction, so a 20k-row
+price list costs a handful of commits instead of one per row.
+
+Rows without a barcode/phone have nothing to match on and are always
+inserted. Bad rows are reported by line number and skipped; they never
+stop the rest of the file.
+"""
+
+import csv
+import io
+from collections import namedtuple
+from itertools import chain, repeat
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+BATCH_SIZE = 2000
+
+# table: what is imported; key: the unique column rows are matched on;
+# required: fields a row cannot do without; numbers: fields parsed as float
+Kind = namedtuple('Kind', 'table key columns required numbers')
+
+KINDS = {
+    'products': Kind('product', 'barcode',
+                     ('barcode', 'name', 'description', 'company', 'price', 'tax'),
+                     ('name', 'price'), ('price', 'tax')),
+    'customers': Kind('customer', 'phone',
+                      ('name', 'phone', 'email', 'address', 'gstin'),
+                      ('name',), ()),
+}
+
+# Headings distributors' sheets use for our columns
+HEADING_ALIASES = {
+    'mobile': 'phone',
+    'sku': 'barcode',
+    'mrp': 'price',
+    'brand': 'company',
+}
+
+
+def column_name(heading):
+    """'Total Spent ' -> 'total_spent', then through HEADING_ALIASES"""
+    name = '_'.join(str(heading or '').strip().lower().split())
+    return HEADING_ALIASES.get(name, name)
+
+
+def _xlsx_rows(stream):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("Reading .xlsx files needs openpyxl (pip install openpyxl)")
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    return workbook.active.iter_rows(values_only=True)
+
+
+def read_rows(stream, filename, kind):
+    """(line number, {column: raw value}) for each data row of a CSV/XLSX.
+
+    The heading row is checked here, so a file missing a required column
+    fails before anything is written. Rows are produced lazily; a file that
+    turns out unreadable part way raises ValueError from the iterator.
+    """
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(stream)
+    else:
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        headings = [column_name(heading) for heading in next(rows, ())]
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Could not read {filename}: {e}")
+    missing = [name for name in kind.required if name not in headings]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    def numbered():
+        line = 1
+        try:
+            for line, values in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    # Short rows get None for their missing cells
+                    yield line, dict(zip(headings, chain(values, repeat(None))))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not read {filename} after line {line}: {e}")
+
+    return numbered()
+
+
+def blank(value):
+    """Whether a raw cell is empty"""
+    return value is None or not str(value).strip()
+
+
+def clean_row(kind, raw):
+    """Values for kind's table from one raw row; ValueError says what is wrong"""
+    row = {}
+    for name in kind.columns:
+        if name not in raw:
+            continue
+        value = raw[name]
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)  # spreadsheet numbers: 9876543210.0
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            if name in kind.required:
+                raise ValueError(f"{name} is missing")
+            value = 0.0 if name in kind.numbers else None
+        elif name in kind.numbers:
+            try:
+                value = float(value.replace(',', ''))
+            except ValueError:
+                raise ValueError(f"{name} '{value}' is not a number")
+        row[name] = value
+    return row
+
+
+def batches(rows, size=BATCH_SIZE):
+    """Lists of up to size items from an iterator"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_statement(table, key, columns):
+    """INSERT that updates columns of the row whose key already exists.
+
+    Columns not listed (missing from the sheet or blank in the row) keep
+    their stored values. Rows whose values are unchanged are left alone, so
+    re-importing a price list only rewrites (and re-indexes for search)
+    what actually changed.
+    """
+    stmt = sqlite_insert(table)
+    updates = [name for name in columns if name != key]
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[key]],
+        set_={name: stmt.excluded[name] for name in updates},
+        where=or_(*[table.c[name].is_distinct_from(stmt.excluded[name])
+                    for name in updates]))
+
+
+def existing_keys(session, column, keys):
+    found = set()
+    keys = list(keys)
+    # Stay well under SQLite's bound-parameter limit
+    for chunk in range(0, len(keys), 500):
+        found.update(session.execute(
+            select(column).where(column.in_(keys[chunk:chunk + 500]))).scalars())
+    return found
+
+
+def write_batch(session, kind, table, batch, insert_only=None):
+    """Clean and UPSERT one batch of (line, raw row) pairs.
+
+    Runs in the session's transaction (the caller commits) and returns
+    (created, updated, errors) with errors as (line, message). If the batch
+    breaks another unique column (a customer email already on someone
+    else, say) it is rolled back and written row by row, so only the
+    offending rows fail.
+
+    A blank cell fills a new row but never overwrites a stored value, so
+    rows are grouped by which cells they have and each group is one
+    executemany.
+    """
+    rows, errors = [], []
+    statements = {}
+    for line, raw in batch:
+        try:
+            values = clean_row(kind, raw)
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        updates = tuple(name for name in values if not blank(raw[name]))
+        if updates not in statements:
+            statements[updates] = upsert_statement(table, kind.key, updates)
+        rows.append((line, values, statements[updates]))
+    if not rows:
+        return 0, 0, errors
+
+    params = [dict(values, **(insert_only or {})) for _, values, _ in rows]
+    existing = existing_keys(session, table.c[kind.key],
+                             {values[kind.key] for _, values, _ in rows
+                              if values.get(kind.key)})
+    try:
+        for stmt in statements.values():
+            session.execute(stmt, [row_params for (_, _, row_stmt), row_params
+                                   in zip(rows, params) if row_stmt is stmt])
+    except IntegrityError:
+        session.rollback()
+        written = []
+        for (line, values, stmt), row_params in zip(rows, params):
+            try:
+                session.connection().execute(stmt, row_params)
+                written.append((line, values, stmt))
+            except IntegrityError as e:
+                errors.append((line, str(e.orig)))
+        rows = written
+
+    created = updated = 0
+    for _, values, _ in rows:
+        key = values.get(kind.key)
+        if key and key in existing:
+            updated += 1
+        else:
+            created += 1
+            if key:
+                existing.add(key)
+    return created, updated, sorted(errors)
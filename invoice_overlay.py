@@ -3,6 +3,8 @@ PDF Overlay Invoice Generator
 Uses a static PDF template and overlays invoice data directly onto it
 """
 
+import hashlib
+import json
 import os
 from pypdf import PdfReader, PdfWriter
 from reportlab.pdfgen import canvas
@@ -10,6 +12,13 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black
 from reportlab.lib.units import mm
 import tempfile
+from money import format_rupees
+import metrics
+from pdf_cache import file_digest
+
+# Bump whenever the drawing code changes what a page looks like, so every
+# cached render is made again
+RENDERER_VERSION = 1
 
 
 class PDFOverlayInvoiceGenerator:
@@ -46,6 +55,8 @@ class PDFOverlayInvoiceGenerator:
             'amount': 413,    # Amount column (moved 10pt left for right margin)
         }
     
+    @metrics.track(metrics.PDF_RENDER_SECONDS, metrics.PDF_RENDER_FAILURES,
+                   ok=lambda result: result[0], renderer='overlay')
     def generate_invoice_pdf(self, invoice, output_path=None):
         """Generate invoice by overlaying data on template"""
         try:
@@ -79,6 +90,41 @@ class PDFOverlayInvoiceGenerator:
             traceback.print_exc()
             return False, str(e)
     
+    def render_key(self, invoice):
+        """Hash of everything the page depends on: the drawn fields, the
+        layout, the template's bytes and RENDERER_VERSION"""
+        payload = json.dumps({
+            'renderer': RENDERER_VERSION,
+            'template': file_digest(self.template_path),
+            'positions': self.positions,
+            'item_positions': self.item_positions,
+            'item_rows': (self.item_start_y, self.item_row_height),
+            'fields': self.drawn_fields(invoice),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def drawn_fields(self, invoice):
+        """Every value _create_data_overlay reads, under the same
+        conditions; keep the two in step or edits go unseen by the cache"""
+        customer = invoice.customer
+        paid = invoice.total_paid_paise or 0
+        return {
+            'number': invoice.number,
+            'invoice_date': invoice.invoice_date,
+            'customer': (customer.name, customer.phone, customer.address)
+                        if customer else None,
+            'next_payment_date': customer.expected_next_payment_date
+                                 if customer and invoice.payment_status != 'paid'
+                                 else None,
+            'items': [(item.product.name, item.product.description)
+                      if item.product else None
+                      for item in invoice.invoice_items[:12]],
+            'amounts': [(item.qty, item.price, item.line_total_paise)
+                        for item in invoice.invoice_items[:12]],
+            'total_paise': invoice.total_paise,
+            'paid': (paid, invoice.remaining_paise) if paid > 0 else None,
+        }
+
     def _create_data_overlay(self, invoice):
         """Create a transparent PDF with just the invoice data"""
         # Create temporary file for overlay
@@ -169,28 +215,27 @@ class PDFOverlayInvoiceGenerator:
                 c.drawRightString(self.item_positions['rate'], base_y_pos, f"{item.price:.2f}")
             
             # Amount (aligned with product name)
-            if item.line_total:
-                c.drawRightString(self.item_positions['amount'], base_y_pos, f"{item.line_total:.2f}")
+            if item.line_total_paise:
+                c.drawRightString(self.item_positions['amount'], base_y_pos, format_rupees(item.line_total_paise))
             
             current_row += 1  # Move to next row
         
         # Add total amount
-        if invoice.total:
+        if invoice.total_paise:
             c.setFont("Helvetica-Bold", 12)
             c.drawCentredString(self.positions['total_amount'][0], 
                               self.positions['total_amount'][1], 
-                              f"{invoice.total:.2f}")
+                              format_rupees(invoice.total_paise))
 
         # Add paid and remaining amounts (configurable positions)
-        if invoice.total_paid and invoice.total_paid > 0:
+        if invoice.total_paid_paise and invoice.total_paid_paise > 0:
             c.setFont("Helvetica", 10)
             c.drawRightString(self.positions['paid_amount'][0], 
                             self.positions['paid_amount'][1], 
-                            f"Paid: {invoice.total_paid:.2f}")
-            remaining = invoice.total - invoice.total_paid
+                            f"Paid: {format_rupees(invoice.total_paid_paise)}")
             c.drawRightString(self.positions['remaining_amount'][0], 
                             self.positions['remaining_amount'][1], 
-                            f"Remaining: {remaining:.2f}")
+                            f"Remaining: {format_rupees(invoice.remaining_paise)}")
         
         # Save the overlay
         c.save()
@@ -275,4 +320,9 @@ def generate_invoice_pdf_overlay(invoice, pdf_path=None, paid_x=None, paid_y=Non
     if next_payment_x is not None or next_payment_y is not None:
         generator.update_next_payment_position(x=next_payment_x, y=next_payment_y)
     
-    return generator.generate_invoice_pdf(invoice, pdf_path)
\ No newline at end of file
+    return generator.generate_invoice_pdf(invoice, pdf_path)
+
+
+def invoice_render_key(invoice):
+    """Render key for invoice with the default layout"""
+    return get_overlay_generator().render_key(invoice)
\ No newline at end of file
@@ -3,6 +3,7 @@ Invoice Printer Module - Updated to match provided format
 Handles all PDF generation and printing functionality
 """
 
+import logging
 import os
 import re
 import tempfile
@@ -10,6 +11,11 @@ import subprocess
 import platform
 import pdfkit
 from datetime import datetime
+from money import format_rupees
+import metrics
+
+# app.logger: Flask names the app's logger after the app module
+log = logging.getLogger("app")
 
 # Updated Bill HTML Template to match the provided format
 BILL_HTML_TEMPLATE = """<!DOCTYPE html>
@@ -576,11 +582,11 @@ class InvoicePrinter:
             # Get invoice data
             customer = invoice.customer
             invoice_number = invoice.number or ''
-            invoice_date = invoice.invoice_date or ''
+            invoice_date = str(invoice.invoice_date or '')
             customer_name = customer.name if customer else ''
             customer_village = customer.address if customer else ''
             customer_mobile = customer.phone if customer else ''
-            total_amount = f"{invoice.total or 0:.2f}"
+            total_amount = format_rupees(invoice.total_paise)
             
             # Payment information
             payment_status = ''
@@ -595,9 +601,9 @@ class InvoicePrinter:
                 else:
                     payment_status = 'બાકી'
                 
-                if hasattr(invoice, 'total_paid') and invoice.total_paid:
-                    total_paid = f"{invoice.total_paid:.2f}"
-                    remaining_balance = f"{(invoice.total - invoice.total_paid):.2f}"
+                if getattr(invoice, 'total_paid_paise', None):
+                    total_paid = format_rupees(invoice.total_paid_paise)
+                    remaining_balance = format_rupees(invoice.remaining_paise)
             
             # Start with template
             html_content = BILL_HTML_TEMPLATE
@@ -621,7 +627,7 @@ class InvoicePrinter:
                 product_name = item.product.name if item.product else 'N/A'
                 qty = item.qty or 0
                 rate = f"{item.price or 0:.2f}"
-                amount = f"{item.line_total or 0:.2f}"
+                amount = format_rupees(item.line_total_paise)
                 
                 table_rows.append(
                     f'                    <tr>'
@@ -648,6 +654,8 @@ class InvoicePrinter:
             traceback.print_exc()
             return None
     
+    @metrics.track(metrics.PDF_RENDER_SECONDS, metrics.PDF_RENDER_FAILURES,
+                   ok=lambda result: result[0], renderer='wkhtmltopdf')
     def generate_pdf(self, invoice, pdf_path=None):
         """Generate PDF from invoice"""
         try:
@@ -722,6 +730,9 @@ class InvoicePrinter:
         
         return None
     
+    @metrics.track(metrics.PRINT_SECONDS, metrics.PRINT_FAILURES,
+                   ok=lambda result: result["success"],
+                   system=platform.system().lower())
     def print_invoice(self, invoice_number, printer_name=None):
         """Print invoice by number"""
         pdf_path = os.path.join(self.invoice_dir, f"{invoice_number}.pdf")
@@ -832,14 +843,21 @@ class InvoicePrinter:
 printer = InvoicePrinter()
 
 # Convenience functions for backward compatibility
-def generate_invoice_pdf(invoice, pdf_path):
-    """Generate PDF for an invoice using PDF overlay method"""
+def generate_invoice_pdf(invoice, pdf_path, fallback=True):
+    """Generate PDF for an invoice using PDF overlay method. With
+    fallback=False a missing overlay renderer fails the render instead of
+    drawing the bill another way, for callers that file the PDF under the
+    overlay's render key."""
     try:
         from invoice_overlay import generate_invoice_pdf_overlay
         success, result = generate_invoice_pdf_overlay(invoice, pdf_path)
         return success
     except ImportError as e:
-        print(f"Overlay method failed, falling back to ReportLab: {e}")
+        if not fallback:
+            log.warning("Overlay method failed for invoice %s: %s",
+                        invoice.number, e)
+            return False
+        log.warning("Overlay method failed, falling back to ReportLab: %s", e)
         try:
             from invoice_reportlab import generate_invoice_pdf_reportlab
             success, result = generate_invoice_pdf_reportlab(invoice, pdf_path)
@@ -849,6 +867,16 @@ def generate_invoice_pdf(invoice, pdf_path):
             success, result = printer.generate_pdf(invoice, pdf_path)
             return success
 
+def invoice_render_key(invoice):
+    """Cache key for the PDF generate_invoice_pdf makes of invoice, or None
+    when the overlay method (or its template) is unavailable"""
+    try:
+        from invoice_overlay import invoice_render_key as overlay_render_key
+        return overlay_render_key(invoice)
+    except (ImportError, OSError) as e:
+        log.warning("Invoice render key unavailable: %s", e)
+        return None
+
 def generate_invoice_pdf_with_colors(invoice, pdf_path=None):
     """Generate PDF using ReportLab with guaranteed color preservation"""
     try:
@@ -14,6 +14,8 @@ from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import tempfile
+from money import format_rupees
+import metrics
 
 
 class InvoiceReportLab:
@@ -36,6 +38,8 @@ class InvoiceReportLab:
         except:
             pass
     
+    @metrics.track(metrics.PDF_RENDER_SECONDS, metrics.PDF_RENDER_FAILURES,
+                   ok=lambda result: result[0], renderer='reportlab')
     def generate_invoice_pdf(self, invoice, pdf_path=None):
         """Generate PDF using ReportLab with proper colors"""
         try:
@@ -186,7 +190,7 @@ class InvoiceReportLab:
             product_name = item.product.name if item.product else 'N/A'
             qty = str(item.qty or 0)
             rate = f"{item.price or 0:.2f}"
-            amount = f"{item.line_total or 0:.2f}"
+            amount = format_rupees(item.line_total_paise)
             
             table_data.append([str(i), product_name, qty, rate, amount])
         
@@ -231,7 +235,7 @@ class InvoiceReportLab:
     
     def _create_total_section(self, invoice):
         """Create total section with pink border"""
-        total_amount = f"{invoice.total or 0:.2f}"
+        total_amount = format_rupees(invoice.total_paise)
         
         total_data = [
             ['કુલ'],
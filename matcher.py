@@ -0,0 +1,373 @@
+"""
+Fuzzy name matcher for Chotu
+An in-memory index over product and customer names, so "samsng tv",
+"pankha" or a Gujarati-script name resolves to the right row instead of
+missing (and creating a duplicate product) or hitting an arbitrary ilike
+match. Names are transliterated to Latin and split into words; words are
+indexed by trigrams and a consonant-skeleton phonetic key, and lookups
+score only the rows whose words resemble the query's.
+
+The index loads lazily on first use and is kept current from ORM events:
+committed inserts, updates and deletes are applied in place, bulk
+query().delete()/update() drops it for a reload.
+"""
+
+import heapq
+import re
+import threading
+from collections import Counter, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+Match = namedtuple('Match', 'score id name')
+
+# Below this a lookup is treated as "not found"
+MIN_SCORE = 0.6
+
+# ---------- transliteration ----------
+
+# Devanagari letters; Gujarati uses the same layout 0x180 code points higher
+_DEVANAGARI_VOWELS = dict(zip(
+    'अआइईउऊऋएऐओऔ',
+    ['a', 'aa', 'i', 'ii', 'u', 'uu', 'ri', 'e', 'ai', 'o', 'au']))
+_DEVANAGARI_SIGNS = dict(zip(
+    'ािीुूृेैोौ',
+    ['aa', 'i', 'ii', 'u', 'uu', 'ri', 'e', 'ai', 'o', 'au']))
+_DEVANAGARI_CONSONANTS = dict(zip(
+    'कखगघङचछजझञटठडढणतथदधनपफबभमयरलळवशषसह',
+    ['k', 'kh', 'g', 'gh', 'n', 'ch', 'chh', 'j', 'jh', 'n',
+     't', 'th', 'd', 'dh', 'n', 't', 'th', 'd', 'dh', 'n',
+     'p', 'ph', 'b', 'bh', 'm', 'y', 'r', 'l', 'l', 'v', 'sh', 'sh', 's', 'h']))
+# Consonant + nukta (़) for sounds borrowed from Urdu/English
+_NUKTA_FORMS = {'क': 'q', 'ख': 'kh', 'ग': 'g', 'ज': 'z', 'ड': 'r', 'ढ': 'rh',
+                'फ': 'f', 'य': 'y'}
+_VIRAMA, _NUKTA = '्', '़'
+_NASALS = {'ं': 'n', 'ँ': 'n', 'ः': 'h'}
+_GUJARATI_OFFSET = 0x180
+
+
+def _as_devanagari(ch):
+    """Map a Gujarati letter onto its Devanagari counterpart"""
+    if '઀' <= ch <= '૿':
+        return chr(ord(ch) - _GUJARATI_OFFSET)
+    return ch
+
+
+def transliterate(text):
+    """Latin spelling of Devanagari/Gujarati text; other characters pass through"""
+    chars = [_as_devanagari(ch) for ch in text]
+    out = []
+    for i, ch in enumerate(chars):
+        nxt = chars[i + 1] if i + 1 < len(chars) else ''
+        if ch in _DEVANAGARI_CONSONANTS:
+            if nxt == _NUKTA:
+                out.append(_NUKTA_FORMS.get(ch, _DEVANAGARI_CONSONANTS[ch]))
+                nxt = chars[i + 2] if i + 2 < len(chars) else ''
+            else:
+                out.append(_DEVANAGARI_CONSONANTS[ch])
+            # Inherent 'a' unless a vowel sign or virama follows; dropped at
+            # the end of a word as in spoken Hindi/Gujarati
+            if (nxt not in _DEVANAGARI_SIGNS and nxt != _VIRAMA
+                    and nxt.strip() and _is_indic_letter(nxt)):
+                out.append('a')
+        elif ch in _DEVANAGARI_VOWELS:
+            out.append(_DEVANAGARI_VOWELS[ch])
+        elif ch in _DEVANAGARI_SIGNS:
+            out.append(_DEVANAGARI_SIGNS[ch])
+        elif ch in _NASALS:
+            out.append(_NASALS[ch])
+        elif '०' <= ch <= '९':
+            out.append(str(ord(ch) - ord('०')))
+        elif ch in (_VIRAMA, _NUKTA):
+            continue
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def _is_indic_letter(ch):
+    return ('ऀ' <= ch <= 'ॿ') and ch not in (_VIRAMA, _NUKTA)
+
+
+# ---------- keys ----------
+
+# Shop words customers say in Hindi/Gujarati for products stocked in English
+ALIASES = {
+    'pankha': 'fan', 'pankho': 'fan',
+    'batti': 'bulb', 'bati': 'bulb',
+    'taar': 'wire', 'tar': 'wire', 'vayar': 'wire',
+    'istri': 'iron', 'press': 'iron',
+    'chabi': 'key',
+    'bijli': 'electric',
+    'dhabbo': 'box', 'dabba': 'box',
+}
+
+# Spelling variants that sound alike, applied in order
+_PHONETIC_RULES = [
+    ('chh', 'c'), ('ch', 'c'), ('sh', 's'), ('ph', 'f'), ('ck', 'k'),
+    ('q', 'k'), ('x', 'ks'), ('z', 'j'), ('w', 'v'),
+]
+
+
+def normalize(text):
+    """Lower-case Latin words of a name, transliterated from Indic scripts"""
+    return re.findall(r'[a-z0-9]+', transliterate(text or '').lower())
+
+
+def phonetic_key(word):
+    """Consonant skeleton of a word: 'samsung' and 'samsng' share 'smsng'"""
+    if word.isdigit():
+        return word
+    for old, new in _PHONETIC_RULES:
+        word = word.replace(old, new)
+    # Aspiration (kh, bh, th ...) and vowels after the first letter are
+    # where spellings of the same name differ most
+    head, tail = word[:1], re.sub(r'[aeiouyh]', '', word[1:])
+    return re.sub(r'(.)\1+', r'\1', head + tail)
+
+
+_ALIAS_KEYS = {phonetic_key(word): target for word, target in ALIASES.items()}
+
+
+def trigrams(word):
+    """Letter triples of a word with one space of padding each side"""
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ---------- index ----------
+
+class NameIndex:
+    """Ranked fuzzy lookup of (id, name) rows.
+
+    Query words are first matched against the distinct words of all names
+    (by trigram, phonetic key and prefix), then rows are scored from the
+    postings of the words that matched, so lookups do not touch every row.
+
+    loader returns every (id, name) pair and runs on first use or after the
+    index is invalidated; add/discard keep it current in between. Changes
+    that arrive while the loader runs are replayed over what it returned.
+    """
+
+    # Query words match indexed words at least this well to count
+    WORD_CUTOFF = 0.4
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._names = None
+        # (row_id, name or None) changes waiting for a running load
+        self._changes = None
+        # Bumped by invalidate(), so a load it overtook is thrown away
+        self._generation = 0
+        self._words = {}
+        self._rows_by_word = {}
+        self._words_by_gram = {}
+        self._gram_counts = {}
+        self._words_by_key = {}
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._names is not None:
+                return
+            generation = self._generation
+            if self._changes is None:
+                self._changes = []
+        rows = self.loader()
+        with self._lock:
+            if self._names is not None or generation != self._generation:
+                # Loaded by another thread, or invalidated while loading
+                return
+            self._names, self._words, self._rows_by_word = {}, {}, {}
+            self._words_by_gram, self._gram_counts = {}, {}
+            self._words_by_key = {}
+            for row_id, name in rows:
+                if name:
+                    self._insert(row_id, name)
+            for row_id, name in self._changes:
+                self._apply(row_id, name)
+            self._changes = None
+
+    def _insert(self, row_id, name):
+        words = tuple(dict.fromkeys(normalize(name)))
+        self._names[row_id] = name
+        self._words[row_id] = words
+        for word in words:
+            if word not in self._rows_by_word:
+                self._rows_by_word[word] = set()
+                grams = trigrams(word)
+                self._gram_counts[word] = len(grams)
+                for gram in grams:
+                    self._words_by_gram.setdefault(gram, set()).add(word)
+                self._words_by_key.setdefault(phonetic_key(word), set()).add(word)
+            self._rows_by_word[word].add(row_id)
+
+    def _remove(self, row_id):
+        if row_id not in self._names:
+            return
+        del self._names[row_id]
+        for word in self._words.pop(row_id):
+            rows = self._rows_by_word[word]
+            rows.discard(row_id)
+            if not rows:
+                del self._rows_by_word[word]
+                del self._gram_counts[word]
+                for gram in trigrams(word):
+                    self._words_by_gram[gram].discard(word)
+                self._words_by_key[phonetic_key(word)].discard(word)
+
+    def _apply(self, row_id, name):
+        self._remove(row_id)
+        if name:
+            self._insert(row_id, name)
+
+    def _change(self, row_id, name):
+        with self._lock:
+            if self._names is not None:
+                self._apply(row_id, name)
+            elif self._changes is not None:
+                self._changes.append((row_id, name))
+
+    def add(self, row_id, name):
+        """Index a new row or re-index a renamed one"""
+        self._change(row_id, name)
+
+    def discard(self, row_id):
+        self._change(row_id, None)
+
+    def invalidate(self):
+        """Drop everything; the next lookup reloads from the loader"""
+        with self._lock:
+            self._names = None
+            self._changes = None
+            self._generation += 1
+
+    def search(self, query, limit=5):
+        """Best matches for query, highest score first (score in 0..1)"""
+        self._ensure_loaded()
+        words = list(dict.fromkeys(normalize(query)))
+        if not words:
+            return []
+        # Try the words as said and with Hindi/Gujarati shop words swapped
+        variants = [words]
+        aliased = [_ALIAS_KEYS.get(phonetic_key(w), w) for w in words]
+        if aliased != words:
+            variants.append(aliased)
+
+        scores = {}
+        with self._lock:
+            if self._names is None:  # invalidated since loading
+                return []
+            for variant in variants:
+                for row_id, score in self._score(variant).items():
+                    scores[row_id] = max(score, scores.get(row_id, 0))
+            ranked = heapq.nsmallest(
+                limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [Match(round(score, 3), row_id, self._names[row_id])
+                    for row_id, score in ranked]
+
+    def best(self, query, min_score=MIN_SCORE):
+        """Top match when it scores at least min_score, else None"""
+        matches = self.search(query, limit=1)
+        if matches and matches[0].score >= min_score:
+            return matches[0]
+        return None
+
+    def _similar_words(self, said):
+        """Indexed words close to a query word, with their similarity.
+
+        Equal words score 1, words the query is a prefix of 0.9 (still
+        typing), same phonetic key 0.8, otherwise trigram overlap (Jaccard).
+        """
+        grams = trigrams(said)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._words_by_gram.get(gram, ()))
+        # Jaccard can only reach the cutoff with this many shared trigrams
+        needed = self.WORD_CUTOFF * len(grams) / (1 + self.WORD_CUTOFF)
+
+        similar = {}
+        for word, common in shared.items():
+            if word.startswith(said):
+                similar[word] = 1.0 if word == said else 0.9
+            elif common >= needed:
+                score = common / (len(grams) + self._gram_counts[word] - common)
+                if score >= self.WORD_CUTOFF:
+                    similar[word] = score
+        for word in self._words_by_key.get(phonetic_key(said), ()):
+            if len(word) > 2:
+                similar[word] = max(similar.get(word, 0), 0.8)
+        return similar
+
+    def _score(self, words):
+        # Per row: best similarity for each query word, summed
+        totals, matched = {}, {}
+        for said in words:
+            best = {}
+            for word, score in self._similar_words(said).items():
+                for row_id in self._rows_by_word[word]:
+                    if score > best.get(row_id, 0):
+                        best[row_id] = score
+            for row_id, score in best.items():
+                totals[row_id] = totals.get(row_id, 0) + score
+                matched[row_id] = matched.get(row_id, 0) + 1
+
+        # Mostly how much of the query matched; a little for how much of the
+        # name it explains, so "LED TV" beats "Samsung TV 32 inch" for "tv"
+        return {
+            row_id: 0.8 * total / len(words)
+            + 0.2 * min(matched[row_id] / len(self._words[row_id]), 1.0)
+            for row_id, total in totals.items()
+        }
+
+
+# ---------- keeping indexes current ----------
+
+_PENDING = 'name_index_pending'
+# model -> indexes of its rows, for bulk UPDATE/DELETE
+_TRACKED = {}
+
+
+def _pending(session):
+    return session.info.setdefault(_PENDING, [])
+
+
+def track(model, index, column='name'):
+    """Apply committed changes to model rows to index"""
+    def upsert(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            _pending(session).append(
+                (index.add, target.id, getattr(target, column)))
+
+    def remove(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            _pending(session).append((index.discard, target.id))
+
+    event.listen(model, 'after_insert', upsert)
+    event.listen(model, 'after_update', upsert)
+    event.listen(model, 'after_delete', remove)
+    _TRACKED.setdefault(model, []).append(index)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_write(orm_execute_state):
+    # Rows a bulk UPDATE/DELETE touched are unknown: reload after commit
+    mapper = orm_execute_state.bind_mapper
+    if ((orm_execute_state.is_update or orm_execute_state.is_delete)
+            and mapper is not None):
+        for index in _TRACKED.get(mapper.class_, ()):
+            _pending(orm_execute_state.session).append((index.invalidate,))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for change in session.info.pop(_PENDING, []):
+        change[0](*change[1:])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    session.info.pop(_PENDING, None)
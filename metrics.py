@@ -0,0 +1,210 @@
+"""
+Prometheus metrics
+Counters and histograms kept in memory and served at /metrics in the
+Prometheus text format (version 0.0.4). waitress serves the app from one
+process, so one set of in-memory series covers every request thread.
+
+Series are labelled by Flask endpoint, PDF renderer, model and so on, never
+by URL or invoice number, so their number stays small.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request
+
+import query_monitor
+
+# Prometheus' default buckets, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# PDFs, printing and the assistant take seconds, not milliseconds
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, value in series:
+                lines += self._samples(list(zip(self.labelnames, key)), value)
+        return lines
+
+
+class Counter(Metric):
+    """Monotonic total, e.g. failures or tokens"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def _samples(self, pairs, value):
+        return [f"{self.name}{_labels(pairs)} {_number(value)}"]
+
+
+class Histogram(Metric):
+    """Durations counted into cumulative le buckets, plus _sum and _count"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, amount, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + amount)
+
+    def count(self, **labels):
+        counts, _ = self._series.get(self._key(labels), ([0], 0.0))
+        return counts[-1]
+
+    def _samples(self, pairs, value):
+        counts, total = value
+        lines = [f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {count}"
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_sum{_labels(pairs)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(pairs)} {counts[-1]}")
+        return lines
+
+
+@contextmanager
+def timed(histogram, failures=None, **labels):
+    """Observe the block's duration; count it in failures if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if failures is not None:
+            failures.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def track(histogram, failures=None, ok=None, **labels):
+    """Decorator form of timed(); ok(result) false also counts as a failure
+    for the renderers and printers that report errors instead of raising"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, failures, **labels):
+                result = func(*args, **kwargs)
+            if failures is not None and ok is not None and not ok(result):
+                failures.inc(**labels)
+            return result
+        return wrapper
+    return decorate
+
+
+def render():
+    """Every metric in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to serve a request, body included',
+    ('endpoint', 'method', 'status'))
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request', ('endpoint',))
+REQUEST_QUERIES = Histogram(
+    'http_request_queries', 'SQL statements run per request', ('endpoint',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250, 1000))
+
+PDF_RENDER_SECONDS = Histogram(
+    'pdf_render_seconds', 'Time to render an invoice PDF', ('renderer',),
+    buckets=SLOW_BUCKETS)
+PDF_RENDER_FAILURES = Counter(
+    'pdf_render_failures_total', 'Invoice PDFs that failed to render', ('renderer',))
+
+PRINT_SECONDS = Histogram(
+    'print_job_seconds', 'Time to hand an invoice to the printer', ('system',),
+    buckets=SLOW_BUCKETS)
+PRINT_FAILURES = Counter(
+    'print_job_failures_total', 'Print jobs that failed', ('system',))
+
+OPENAI_SECONDS = Histogram(
+    'openai_request_seconds', 'Latency of assistant chat completions', ('model',),
+    buckets=SLOW_BUCKETS)
+OPENAI_FAILURES = Counter(
+    'openai_request_failures_total', 'Assistant chat completions that failed', ('model',))
+OPENAI_TOKENS = Counter(
+    'openai_tokens_total', 'Tokens used by the assistant', ('model', 'kind'))
+
+
+def install(app):
+    """Time every request of app, and the SQL query_monitor charged to it"""
+    @app.before_request
+    def _start():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _observe(stats):
+        endpoint = request.endpoint or 'none'
+        REQUEST_DB_SECONDS.observe(stats.seconds, endpoint=endpoint)
+        REQUEST_QUERIES.observe(stats.count, endpoint=endpoint)
+
+    query_monitor.reporters.append(_observe)
+
+    @app.teardown_request
+    def _finish(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                endpoint=request.endpoint or 'none',
+                                method=request.method, status=status)
@@ -0,0 +1,384 @@
+"""
+Schema migrations for the SQLite database
+db.create_all() only creates missing tables, so changes to existing tables
+(indexes, new columns, backfills) are applied here once, in order, and
+tracked with SQLite's PRAGMA user_version.
+
+Steps use plain SQL frozen at the time they were written, and skip work a
+freshly created schema already has, so they are safe on new and old files.
+"""
+
+import logging
+import re
+
+MIGRATIONS = []
+
+log = logging.getLogger(__name__)
+
+
+def migration(func):
+    """Register a migration step; steps run in definition order"""
+    MIGRATIONS.append(func)
+    return func
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn, table, column, ddl_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    if column not in _columns(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+
+
+def _create_index(conn, name, table, *columns):
+    """CREATE INDEX IF NOT EXISTS, skipped when a column is not present"""
+    if set(columns) <= _columns(conn, table):
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+@migration
+def create_hot_query_indexes(conn):
+    """Indexes for the khata, history and customer page queries"""
+    _create_index(conn, "ix_customer_outstanding_balance",
+                  "customer", "outstanding_balance")
+    _create_index(conn, "ix_customer_name", "customer", "name")
+    _create_index(conn, "ix_invoice_customer_date_total",
+                  "invoice", "customer_id", "invoice_date", "total")
+    _create_index(conn, "ix_invoice_date_id", "invoice", "invoice_date", "id")
+    _create_index(conn, "ix_invoice_total", "invoice", "total")
+    _create_index(conn, "ix_invoice_item_invoice_id", "invoice_item", "invoice_id")
+    _create_index(conn, "ix_payment_invoice_date",
+                  "payment", "invoice_id", "payment_date")
+
+
+# (table, old float column, new integer paise column)
+PAISE_COLUMNS = [
+    ("customer", "outstanding_balance", "outstanding_balance_paise"),
+    ("invoice", "discount_amount", "discount_amount_paise"),
+    ("invoice", "total", "total_paise"),
+    ("invoice", "total_paid", "total_paid_paise"),
+    ("invoice_item", "line_total", "line_total_paise"),
+    ("payment", "amount", "amount_paise"),
+]
+
+
+@migration
+def store_money_as_paise(conn):
+    """Copy float rupee columns into integer paise columns.
+
+    The old float columns are left in place (unused) so a backup taken
+    before the upgrade is not the only way back.
+    """
+    for table, old, new in PAISE_COLUMNS:
+        _add_column(conn, table, new, "INTEGER DEFAULT 0")
+        if old in _columns(conn, table):
+            conn.exec_driver_sql(
+                f"UPDATE {table} SET {new} = CAST(ROUND({old} * 100) AS INTEGER) "
+                f"WHERE {old} IS NOT NULL")
+    for name in ("ix_customer_outstanding_balance",
+                 "ix_invoice_customer_date_total", "ix_invoice_total"):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    _create_index(conn, "ix_customer_outstanding_paise",
+                  "customer", "outstanding_balance_paise")
+    _create_index(conn, "ix_invoice_customer_date_total_paise",
+                  "invoice", "customer_id", "invoice_date", "total_paise")
+    _create_index(conn, "ix_invoice_total_paise", "invoice", "total_paise")
+
+
+# (table, column) pairs that were free-form strings before becoming DATEs
+DATE_COLUMNS = [
+    ("invoice", "invoice_date"),
+    ("invoice", "due_date"),
+    ("payment", "payment_date"),
+    ("customer", "last_payment_date"),
+    ("customer", "expected_next_payment_date"),
+]
+
+
+@migration
+def normalize_date_columns(conn):
+    """Rewrite stored dates as ISO 'YYYY-MM-DD' for the DATE columns.
+
+    SQLite keeps DATE values as ISO text, so the existing columns can hold
+    them without a table rebuild; only rows in other formats (DD-MM-YYYY,
+    with a time part, ...) are rewritten. Values that cannot be read as a
+    date are cleared rather than left to break range filters; the original
+    text is kept in unreadable_date so it can be put right by hand.
+    """
+    from dates import parse_date
+
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS unreadable_date ("
+        "table_name TEXT NOT NULL, row_id INTEGER NOT NULL, "
+        "column_name TEXT NOT NULL, raw_value TEXT NOT NULL, "
+        "PRIMARY KEY (table_name, row_id, column_name))")
+    for table, column in DATE_COLUMNS:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL").fetchall()
+        for row_id, raw in rows:
+            parsed = parse_date(raw)
+            normalized = parsed.isoformat() if parsed else None
+            if normalized == raw:
+                continue
+            if parsed is None and str(raw).strip():
+                conn.exec_driver_sql(
+                    "INSERT OR REPLACE INTO unreadable_date "
+                    "(table_name, row_id, column_name, raw_value) "
+                    "VALUES (?, ?, ?, ?)", (table, row_id, column, str(raw)))
+                log.warning("%s.%s id=%s: unreadable date %r cleared, kept in "
+                            "unreadable_date", table, column, row_id, raw)
+            conn.exec_driver_sql(
+                f"UPDATE {table} SET {column} = ? WHERE id = ?", (normalized, row_id))
+    _create_index(conn, "ix_customer_expected_payment",
+                  "customer", "expected_next_payment_date", "outstanding_balance_paise")
+
+
+@migration
+def backfill_customer_stats(conn):
+    """Build customer_stats rows from existing invoices"""
+    conn.exec_driver_sql("DELETE FROM customer_stats")
+    conn.exec_driver_sql(
+        "INSERT INTO customer_stats (customer_id, invoice_count, total_spent_paise, "
+        "first_purchase, last_purchase) "
+        "SELECT invoice.customer_id, COUNT(*), COALESCE(SUM(invoice.total_paise), 0), "
+        "MIN(invoice.invoice_date), MAX(invoice.invoice_date) "
+        "FROM invoice JOIN customer ON customer.id = invoice.customer_id "
+        "GROUP BY invoice.customer_id")
+
+
+@migration
+def backfill_customer_ledger(conn):
+    """Replay existing invoices and payments into ledger_entry.
+
+    Entries are posted on their own bill/payment dates (undated ones on the
+    day of the upgrade) in date order. Older payment paths recorded more in
+    payment rows than they applied to invoices, so where the replay does not
+    end on the khata figure (sum of unpaid invoice amounts) an 'opening'
+    entry dated today brings it there; balances do not jump on upgrade.
+    """
+    from datetime import date
+
+    today = date.today().isoformat()
+    events = []
+    for customer_id, invoice_id, number, on, total in conn.exec_driver_sql(
+            "SELECT invoice.customer_id, invoice.id, invoice.number, "
+            "invoice.invoice_date, invoice.total_paise FROM invoice "
+            "JOIN customer ON customer.id = invoice.customer_id"):
+        if total:
+            events.append((customer_id, on or today, 0, invoice_id, on, 'invoice',
+                           total, 0, invoice_id, None, f"Invoice {number}"))
+    for customer_id, payment_id, invoice_id, number, on, amount, method in conn.exec_driver_sql(
+            "SELECT invoice.customer_id, payment.id, payment.invoice_id, invoice.number, "
+            "payment.payment_date, payment.amount_paise, payment.payment_method "
+            "FROM payment JOIN invoice ON invoice.id = payment.invoice_id "
+            "JOIN customer ON customer.id = invoice.customer_id"):
+        if amount:
+            events.append((customer_id, on or today, 1, payment_id, on, 'payment',
+                           0, amount, invoice_id, payment_id,
+                           f"Payment ({method or 'cash'}) for {number}"))
+    events.sort(key=lambda e: e[:4])
+
+    conn.exec_driver_sql("DELETE FROM ledger_entry")
+    balances = {}
+    rows = []
+    for (customer_id, posted_on, _, _, entry_date, kind,
+         debit, credit, invoice_id, payment_id, memo) in events:
+        balance = balances.get(customer_id, 0) + debit - credit
+        balances[customer_id] = balance
+        rows.append((customer_id, posted_on, entry_date, kind, debit, credit,
+                     balance, invoice_id, payment_id, memo))
+    khata = dict(conn.exec_driver_sql(
+        "SELECT invoice.customer_id, SUM(invoice.total_paise - invoice.total_paid_paise) "
+        "FROM invoice JOIN customer ON customer.id = invoice.customer_id "
+        "GROUP BY invoice.customer_id").fetchall())
+    for customer_id in sorted(set(khata) | set(balances)):
+        balance = balances.get(customer_id, 0)
+        difference = (khata.get(customer_id) or 0) - balance
+        if difference:
+            balances[customer_id] = balance + difference
+            rows.append((customer_id, today, None, 'opening',
+                         max(difference, 0), max(-difference, 0), balance + difference,
+                         None, None, "Opening adjustment to invoice balances"))
+    if rows:
+        conn.exec_driver_sql(
+            "INSERT INTO ledger_entry (customer_id, posted_on, entry_date, kind, "
+            "debit_paise, credit_paise, balance_paise, invoice_id, payment_id, memo) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.exec_driver_sql("UPDATE customer SET outstanding_balance_paise = 0")
+    if balances:
+        conn.exec_driver_sql(
+            "UPDATE customer SET outstanding_balance_paise = ? WHERE id = ?",
+            [(balance, customer_id) for customer_id, balance in balances.items()])
+
+
+@migration
+def add_customer_created_on(conn):
+    """Customer sign-up day for the daily summary.
+
+    Existing customers get the date of their first bill as a best guess;
+    customers without bills stay undated (counted in lifetime totals only).
+    """
+    _add_column(conn, "customer", "created_on", "DATE")
+    conn.exec_driver_sql(
+        "UPDATE customer SET created_on = (SELECT MIN(invoice_date) FROM invoice "
+        "WHERE invoice.customer_id = customer.id) WHERE created_on IS NULL")
+
+
+# Word characters include combining marks so Devanagari/Gujarati names keep
+# their vowel signs inside one token
+FTS_OPTIONS = ("tokenize=\"unicode61 remove_diacritics 2 categories 'L* N* Co M*'\", "
+               "prefix='2 3 4'")
+
+SEARCH_INDEX_SQL = [
+    # Customers and products: external-content indexes over the tables
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts USING fts5("
+    f"name, phone, email, content='customer', content_rowid='id', {FTS_OPTIONS})",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_ai AFTER INSERT ON customer BEGIN "
+    "INSERT INTO customer_fts (rowid, name, phone, email) "
+    "VALUES (new.id, new.name, new.phone, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_ad AFTER DELETE ON customer BEGIN "
+    "INSERT INTO customer_fts (customer_fts, rowid, name, phone, email) "
+    "VALUES ('delete', old.id, old.name, old.phone, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_fts_au AFTER UPDATE OF name, phone, email "
+    "ON customer BEGIN "
+    "INSERT INTO customer_fts (customer_fts, rowid, name, phone, email) "
+    "VALUES ('delete', old.id, old.name, old.phone, old.email); "
+    "INSERT INTO customer_fts (rowid, name, phone, email) "
+    "VALUES (new.id, new.name, new.phone, new.email); END",
+
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "name, barcode, company, description, content='product', content_rowid='id', "
+    f"{FTS_OPTIONS})",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts (rowid, name, barcode, company, description) "
+    "VALUES (new.id, new.name, new.barcode, new.company, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts (product_fts, rowid, name, barcode, company, description) "
+    "VALUES ('delete', old.id, old.name, old.barcode, old.company, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF "
+    "name, barcode, company, description ON product BEGIN "
+    "INSERT INTO product_fts (product_fts, rowid, name, barcode, company, description) "
+    "VALUES ('delete', old.id, old.name, old.barcode, old.company, old.description); "
+    "INSERT INTO product_fts (rowid, name, barcode, company, description) "
+    "VALUES (new.id, new.name, new.barcode, new.company, new.description); END",
+
+    # Invoices: the index keeps its own copy so it can carry the customer name
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS invoice_fts USING fts5("
+    f"number, customer_name, notes, {FTS_OPTIONS})",
+    "CREATE TRIGGER IF NOT EXISTS invoice_fts_ai AFTER INSERT ON invoice BEGIN "
+    "INSERT INTO invoice_fts (rowid, number, customer_name, notes) "
+    "SELECT new.id, new.number, "
+    "(SELECT name FROM customer WHERE id = new.customer_id), new.notes; END",
+    "CREATE TRIGGER IF NOT EXISTS invoice_fts_ad AFTER DELETE ON invoice BEGIN "
+    "DELETE FROM invoice_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS invoice_fts_au AFTER UPDATE OF "
+    "number, customer_id, notes ON invoice BEGIN "
+    "DELETE FROM invoice_fts WHERE rowid = old.id; "
+    "INSERT INTO invoice_fts (rowid, number, customer_name, notes) "
+    "SELECT new.id, new.number, "
+    "(SELECT name FROM customer WHERE id = new.customer_id), new.notes; END",
+    "CREATE TRIGGER IF NOT EXISTS invoice_fts_customer_au AFTER UPDATE OF name "
+    "ON customer BEGIN "
+    "UPDATE invoice_fts SET customer_name = new.name "
+    "WHERE rowid IN (SELECT id FROM invoice WHERE customer_id = new.id); END",
+
+    # bm25 column weights used by ORDER BY rank
+    "INSERT INTO customer_fts (customer_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 2.0)')",
+    "INSERT INTO product_fts (product_fts, rank) "
+    "VALUES ('rank', 'bm25(10.0, 8.0, 2.0, 1.0)')",
+    "INSERT INTO invoice_fts (invoice_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+]
+
+
+@migration
+def create_search_index(conn):
+    """FTS5 indexes for customer, product and invoice search.
+
+    Triggers keep them current from here on; existing rows are indexed once.
+    """
+    for statement in SEARCH_INDEX_SQL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO customer_fts (customer_fts) VALUES ('rebuild')")
+    conn.exec_driver_sql("INSERT INTO product_fts (product_fts) VALUES ('rebuild')")
+    conn.exec_driver_sql("DELETE FROM invoice_fts")
+    conn.exec_driver_sql(
+        "INSERT INTO invoice_fts (rowid, number, customer_name, notes) "
+        "SELECT invoice.id, invoice.number, customer.name, invoice.notes "
+        "FROM invoice LEFT JOIN customer ON customer.id = invoice.customer_id")
+
+
+# Tables whose rows move to financial-year archives (see archive.py)
+AUTOINCREMENT_TABLES = ("invoice", "invoice_item", "payment")
+
+
+@migration
+def autoincrement_archived_ids(conn):
+    """Rebuild the archived tables with AUTOINCREMENT ids.
+
+    Without it SQLite gives a new row MAX(id) + 1 of what is left in the
+    main file, so ids of archived (or deleted) rows were handed out again.
+    Rows, indexes and triggers are kept; the sequence starts at the highest
+    id in the table, and archive.reserve_ids() raises it past the archives.
+    """
+    # Keep the REFERENCES and trigger bodies of other tables as they are
+    # while the rebuilt table is renamed into place
+    conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+    try:
+        for table in AUTOINCREMENT_TABLES:
+            sql = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table,)).scalar()
+            if sql is None or "AUTOINCREMENT" in sql:
+                continue
+            rebuilt, column = re.subn(
+                r"\bid INTEGER NOT NULL,",
+                "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,", sql, count=1)
+            rebuilt, key = re.subn(r",\s*PRIMARY KEY \(id\)", "", rebuilt, count=1)
+            if not (column and key):
+                raise RuntimeError(f"Unexpected {table} schema: {sql}")
+            rebuilt = rebuilt.replace(
+                f"CREATE TABLE {table} ", f"CREATE TABLE {table}_rebuild ", 1)
+            extras = [row[0] for row in conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE tbl_name = ? "
+                "AND type IN ('index', 'trigger') AND sql IS NOT NULL", (table,))]
+            columns = ", ".join(sorted(_columns(conn, table)))
+            conn.exec_driver_sql(rebuilt)
+            conn.exec_driver_sql(
+                f"INSERT INTO {table}_rebuild ({columns}) "
+                f"SELECT {columns} FROM {table}")
+            conn.exec_driver_sql(f"DROP TABLE {table}")
+            conn.exec_driver_sql(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+            for statement in extras:
+                conn.exec_driver_sql(statement)
+    finally:
+        conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+
+
+@migration
+def date_ledger_by_entry_date(conn):
+    """Statements and the daily summary go by ledger_entry.entry_date.
+
+    Undated entries take the day they were written, the statement index
+    moves to entry_date, and the summary is dropped so the next start
+    rebuilds it with back-dated entries on their own days.
+    """
+    conn.exec_driver_sql(
+        "UPDATE ledger_entry SET entry_date = posted_on WHERE entry_date IS NULL")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_ledger_customer_posted")
+    _create_index(conn, "ix_ledger_customer_entry",
+                  "ledger_entry", "customer_id", "entry_date", "id")
+    if _columns(conn, "daily_summary"):
+        conn.exec_driver_sql("DELETE FROM daily_summary")
+
+
+def run_migrations(engine):
+    """Apply every migration newer than the database's user_version"""
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            print(f"Applying migration {number}: {step.__name__}")
+            step(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
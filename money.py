@@ -0,0 +1,49 @@
+"""
+Money helpers
+Amounts are stored as integer paise so sums and comparisons are exact in
+SQLite; rupee floats only exist at the edges (forms, templates, PDFs, JSON).
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+def to_paise(amount):
+    """Convert a rupee amount (number or '₹1,234.50' string) to integer paise"""
+    if amount is None:
+        return None
+    if isinstance(amount, str):
+        amount = amount.replace('₹', '').replace(',', '').strip() or '0'
+    try:
+        rupees = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not rupees.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    return int((rupees * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_paise(paise):
+    """Convert integer paise to a rupee float for display and JSON"""
+    if paise is None:
+        return None
+    return paise / 100
+
+
+def format_rupees(paise):
+    """Format paise as a two-decimal rupee string without float rounding"""
+    return f"{Decimal(paise or 0).scaleb(-2):.2f}"
+
+
+def rupee_property(paise_attr):
+    """Read/write rupee view of a paise column, usable in queries too"""
+    def fget(self):
+        return from_paise(getattr(self, paise_attr))
+
+    def fset(self, value):
+        setattr(self, paise_attr, to_paise(value))
+
+    def expr(cls):
+        return getattr(cls, paise_attr) / 100.0
+
+    return hybrid_property(fget, fset, expr=expr)
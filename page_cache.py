@@ -0,0 +1,106 @@
+"""
+Rendered-page cache
+The dashboard, khata book and unfiltered history are opened from every
+counter PC all day and show the same numbers until a bill, payment,
+customer or product is saved. Their HTML is kept per route + query
+arguments + data version, so a repeat view is a dict lookup; a commit that
+writes business data moves the version on and the next view renders again.
+
+Entries are evicted least recently used first, by count and by bytes.
+Requests carrying flashed messages always render, since the message is
+part of the page.
+"""
+
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+import metrics
+
+MAX_ENTRIES = 256
+MAX_BYTES = 32 * 1024 * 1024
+
+PAGE_CACHE = metrics.Counter(
+    'page_cache_requests_total', 'Cacheable page views by result',
+    ('endpoint', 'result'))
+
+
+class PageCache:
+    def __init__(self, versions, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, entry):
+        body = entry[0]
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return  # rendered while a newer commit landed
+            # Everything from an older version is dead; free it at once
+            if version != self._version:
+                self._entries.clear()
+                self.size = 0
+                self._version = version
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = entry
+            self.size += len(body)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def cached(self, when=None, vary=None):
+        """Decorator for GET views whose HTML depends only on the query
+        arguments, the data and whatever vary() returns. when() false
+        (e.g. a filtered search) renders without the cache."""
+        def decorate(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if (request.method != 'GET' or '_flashes' in session
+                        or (when is not None and not when())):
+                    return view(*args, **kwargs)
+                version = self.versions.current()
+                key = (request.endpoint,
+                       tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))),
+                       vary() if vary is not None else None)
+                entry = self.get((version, key))
+                if entry is not None:
+                    PAGE_CACHE.inc(endpoint=request.endpoint, result='hit')
+                    body, content_type = entry
+                    response = Response(body, content_type=content_type)
+                    response.headers['X-Page-Cache'] = 'hit'
+                    return response
+                PAGE_CACHE.inc(endpoint=request.endpoint, result='miss')
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.put((version, key), version,
+                             (response.get_data(), response.content_type))
+                    response.headers['X-Page-Cache'] = 'miss'
+                return response
+            return wrapper
+        return decorate
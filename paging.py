@@ -0,0 +1,101 @@
+"""
+Keyset pagination
+Long listings are read a page at a time by remembering where the last page
+ended (its sort key and id) instead of counting rows off with OFFSET. The
+next page is a range scan that starts right after that row, so the 200th
+page costs what the first does and bills saved meanwhile do not shift rows
+between pages.
+
+The cursor is an opaque URL-safe token; a cursor that does not decode
+simply starts from the first page again.
+"""
+
+import base64
+import binascii
+import json
+import operator
+from datetime import date
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def clean_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Whole number of rows per page within 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v
+                      for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Sort values of the row a page ended on, typed like columns"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [None if value is None
+                else date.fromisoformat(value)
+                if column.type.python_type is date else value
+                for value, column in zip(values, columns)]
+    except (binascii.Error, ValueError, NotImplementedError):
+        return None
+
+
+def page(query, key, id_column, descending=False, cursor=None,
+         size=DEFAULT_PAGE_SIZE):
+    """(rows, next cursor or None) for one page of query ORDER BY key, id.
+
+    key may be None to order by id alone. Both columns are sorted the same
+    way so the cursor condition is one row-value comparison SQLite can
+    range-scan an index with. Rows with a NULL key (SQLite sorts them
+    lowest) cannot be reached by that comparison, so they are read as
+    their own run: after the others when descending, before them when
+    ascending.
+    """
+    columns = [id_column] if key is None else [key, id_column]
+    after = decode_cursor(cursor, columns)
+    beyond = operator.lt if descending else operator.gt
+    order = [column.desc() if descending else column.asc()
+             for column in columns]
+    query = query.add_columns(*columns)
+
+    if key is None:
+        runs = [(query, None)]
+    else:
+        keyed = (query.filter(key.isnot(None)),
+                 lambda values: beyond(tuple_(key, id_column), tuple_(*values)))
+        unkeyed = (query.filter(key.is_(None)),
+                   lambda values: beyond(id_column, values[-1]))
+        runs = [keyed, unkeyed] if descending else [unkeyed, keyed]
+        # Skip the first run when the last page ended in the second
+        if after is not None and (after[0] is None) == descending:
+            runs = runs[1:]
+
+    rows = []
+    for run_query, condition in runs:
+        if after is not None:
+            run_query = run_query.filter(
+                condition(after) if condition else beyond(id_column, after[-1]))
+            after = None
+        rows += run_query.order_by(*order).limit(size + 1 - len(rows)).all()
+        if len(rows) > size:
+            break
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(list(rows[-1])[-len(columns):])
+    return [row[0] for row in rows], next_cursor
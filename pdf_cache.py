@@ -0,0 +1,128 @@
+"""
+Content-addressed invoice PDF store
+Every render is filed under its render key, a hash of everything drawn on
+the page plus the template and renderer version, as <key>.pdf in the cache
+folder. The bill's own invoices/<number>.pdf, which printing and the
+invoice backup read, is a hard link to the entry for its current key (a
+copy where links are not supported).
+
+Opening or printing a bill compares its current key with what is
+published: an unchanged bill costs two stat calls, one whose payment,
+customer or items changed since is rendered again there and then, and
+inputs rendered before are linked rather than rendered twice.
+
+Entries no bill links to any more are dropped a day after they were made.
+"""
+
+import filecmp
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+PRUNE_AFTER_SECONDS = 24 * 60 * 60
+LOCK_STRIPES = 64
+
+
+@functools.lru_cache(maxsize=1024)
+def _digest(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """sha256 of a file's bytes, memoised by (path, mtime, size) so a file
+    written again is hashed again"""
+    stat = os.stat(path)
+    return _digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+class PdfCache:
+    def __init__(self, directory, prune_after=PRUNE_AFTER_SECONDS):
+        self.directory = directory
+        self.prune_after = prune_after
+        # One render per key at a time; other keys render in parallel
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def is_current(self, key, path):
+        """Whether the PDF at path is the render for key"""
+        entry = self.entry_path(key)
+        try:
+            return (os.path.samefile(path, entry)
+                    or filecmp.cmp(path, entry, shallow=False))
+        except OSError:
+            return False
+
+    def publish(self, key, path, render):
+        """Make path the render for key. render(output_path) -> bool is
+        called only if no entry for key exists yet. Returns False if
+        rendering failed, leaving path as it was."""
+        if self.is_current(key, path):
+            return True
+        with self._locks[int(key[:8], 16) % LOCK_STRIPES]:
+            entry = self.entry_path(key)
+            rendered = not os.path.exists(entry)
+            if rendered and not self._render(entry, render):
+                return False
+            self._link(entry, path)
+        if rendered:
+            # The render this one replaced may have no links left
+            self.prune()
+        return True
+
+    def prune(self):
+        """Drop entries no published PDF links to that are past
+        prune_after"""
+        cutoff = time.time() - self.prune_after
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".pdf"):
+                continue
+            entry = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry)
+                if stat.st_nlink == 1 and stat.st_mtime < cutoff:
+                    os.remove(entry)
+            except OSError:
+                pass
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _render(self, entry, render):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".pdf.tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            if not render(tmp):
+                return False
+            # Readers never see a half-written entry
+            os.replace(tmp, entry)
+            return True
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def _link(self, entry, path):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(entry, tmp)
+        except OSError:
+            shutil.copyfile(entry, tmp)
+        try:
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
@@ -0,0 +1,218 @@
+"""
+Background PDF rendering and auto-printing
+Saving a bill adds a job row in the same transaction and redirects; a small
+pool of worker threads renders the PDF (and prints it when auto-print is
+on) after the response has gone out. Jobs live in the database, so work
+queued before a restart is still done, a job left running by a crashed
+process is taken up again once its lease runs out (a live worker renews
+the lease while the job runs), and a failed job is
+tried again after a growing delay before it is marked failed.
+
+Several processes on one database share the table: a worker claims a job
+with a conditional UPDATE, so each attempt runs in exactly one of them.
+"""
+
+import logging
+import threading
+from datetime import datetime as dt, timedelta
+
+import metrics
+
+WORKERS = 2
+MAX_ATTEMPTS = 3
+RETRY_SECONDS = 30  # attempt n waits n * RETRY_SECONDS before the next
+POLL_SECONDS = 5  # for jobs queued by other processes and retries
+LEASE_SECONDS = 300  # a job not renewed for this long has been orphaned
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+PENDING = (QUEUED, RUNNING)
+
+JOBS = metrics.Counter(
+    'pdf_jobs_total', 'Background PDF job attempts by result',
+    ('kind', 'result'))
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, app, db, model, perform, max_attempts=MAX_ATTEMPTS,
+                 retry_seconds=RETRY_SECONDS, poll_seconds=POLL_SECONDS,
+                 lease_seconds=LEASE_SECONDS):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.perform = perform
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def enqueue(self, invoice_id, kind, printer=None):
+        """Add a job to the caller's transaction; call notify() once it
+        has committed"""
+        now = dt.now()
+        job = self.model(invoice_id=invoice_id, kind=kind, printer=printer,
+                         status=QUEUED, attempts=0, run_after=now,
+                         created_at=now)
+        self.db.session.add(job)
+        return job
+
+    def retry(self, invoice_id):
+        """Queue an invoice's failed jobs again with fresh attempts (caller
+        commits, then notify()); returns how many"""
+        return self.db.session.query(self.model).filter(
+            self.model.invoice_id == invoice_id,
+            self.model.status == FAILED,
+        ).update({'status': QUEUED, 'attempts': 0, 'run_after': dt.now()},
+                 synchronize_session=False)
+
+    def notify(self):
+        self._wake.set()
+
+    def latest(self, invoice_ids):
+        """{invoice_id: {kind: newest job}} for the given invoices"""
+        model = self.model
+        jobs = {}
+        ids = list(invoice_ids)
+        for chunk in range(0, len(ids), 500):
+            for job in self.db.session.query(model).filter(
+                    model.invoice_id.in_(ids[chunk:chunk + 500])
+            ).order_by(model.id):
+                jobs.setdefault(job.invoice_id, {})[job.kind] = job
+        return jobs
+
+    def start(self, workers=WORKERS):
+        if self._threads or workers <= 0:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for n in range(workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"pdf-jobs-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        with self._lock:
+            self._stop.set()
+            self._wake.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def run_pending(self):
+        """Run every due job in this thread; returns how many ran"""
+        ran = 0
+        while self._run_one():
+            ran += 1
+        return ran
+
+    def _work(self):
+        while not self._stop.is_set():
+            # Cleared before looking, so a notify() from now on is not lost
+            self._wake.clear()
+            try:
+                busy = self._run_one()
+            except Exception:
+                log.exception("PDF job worker error")
+                busy = False
+            if not busy:
+                self._wake.wait(self.poll_seconds)
+
+    def _run_one(self):
+        with self.app.app_context():
+            job = self._claim()
+            if job is None:
+                return False
+            job_id, attempts = job.id, job.attempts
+            done = threading.Event()
+            renewer = threading.Thread(
+                target=self._renew_lease, args=(job_id, attempts, done),
+                name=f"pdf-job-{job_id}-lease", daemon=True)
+            renewer.start()
+            try:
+                self.perform(job)
+            except Exception as e:
+                log.warning("PDF job %s (%s of invoice %s) failed: %s",
+                            job.id, job.kind, job.invoice_id, e)
+                self.db.session.rollback()
+                error = str(e) or type(e).__name__
+            else:
+                error = None
+            finally:
+                done.set()
+                renewer.join()
+            self._finish(job_id, attempts, error)
+            return True
+
+    def _renew_lease(self, job_id, attempts, done):
+        """Restart a claimed job's lease every third of lease_seconds
+        until done is set, so a slow render is not taken for orphaned and
+        run a second time"""
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                with self.app.app_context():
+                    self.db.session.query(self.model).filter(
+                        self.model.id == job_id,
+                        self.model.status == RUNNING,
+                        self.model.attempts == attempts,
+                    ).update({'started_at': dt.now()},
+                             synchronize_session=False)
+                    self.db.session.commit()
+            except Exception:
+                log.exception("Could not renew the lease of PDF job %s", job_id)
+
+    def _claim(self):
+        model = self.model
+        session = self.db.session
+        now = dt.now()
+        due = self.db.or_(
+            self.db.and_(model.status == QUEUED, model.run_after <= now),
+            self.db.and_(model.status == RUNNING, model.started_at
+                         < now - timedelta(seconds=self.lease_seconds)))
+        while True:
+            found = session.query(model.id, model.status, model.attempts) \
+                .filter(due).order_by(model.run_after, model.id).first()
+            if found is None:
+                session.rollback()
+                return None
+            claimed = session.query(model).filter(
+                model.id == found.id,
+                model.status == found.status,
+                model.attempts == found.attempts,
+            ).update({'status': RUNNING, 'attempts': found.attempts + 1,
+                      'started_at': now}, synchronize_session=False)
+            session.commit()
+            if claimed:
+                return session.get(model, found.id)
+            # Another worker got there first; look again
+
+    def _finish(self, job_id, attempts, error):
+        job = self.db.session.get(self.model, job_id)
+        self.db.session.refresh(job)
+        if job.status != RUNNING or job.attempts != attempts:
+            # The lease lapsed and another worker took the job over; its
+            # attempt records the result
+            log.warning("PDF job %s was taken over; result of attempt %s "
+                        "dropped", job_id, attempts)
+            self.db.session.rollback()
+            return
+        now = dt.now()
+        job.finished_at = now
+        job.last_error = error[:500] if error else None
+        if error is None:
+            job.status = DONE
+        elif job.attempts >= self.max_attempts:
+            job.status = FAILED
+        else:
+            job.status = QUEUED
+            job.run_after = now + timedelta(
+                seconds=self.retry_seconds * job.attempts)
+        JOBS.inc(kind=job.kind, result='ok' if error is None else 'error')
+        self.db.session.commit()
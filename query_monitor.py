@@ -0,0 +1,152 @@
+"""
+Per-request SQL accounting
+Every statement run on a watched engine while a request is being served is
+counted and timed against that request, grouped by fingerprint (the SQL
+with literals and IN-lists folded). A fingerprint that repeats
+REPEAT_THRESHOLD times or more in one request is reported as a likely N+1:
+one query per row of a list instead of one query for the whole list.
+
+The summary goes out three ways: a Server-Timing response header (shown in
+the browser's network panel), the app log when a request looks like N+1,
+and the last RECENT_REQUESTS summaries kept for the admin debug page.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+REPEAT_THRESHOLD = 5
+RECENT_REQUESTS = 100
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAM_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+SPACES = re.compile(r"\s+")
+
+# Callables given each finished request's RequestQueries (e.g. metrics)
+reporters = []
+# Callables given (conn, statement, parameters, executemany, seconds) for
+# every statement on a watched engine, in a request or not (e.g. slow_queries)
+statement_hooks = []
+
+_recent = deque(maxlen=RECENT_REQUESTS)
+_recent_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement):
+    """Statement with literals as ? and IN (?, ?, ...) as IN (...)"""
+    text = LITERALS.sub('?', statement)
+    text = PARAM_LISTS.sub('(...)', text)
+    return SPACES.sub(' ', text).strip()
+
+
+class RequestQueries:
+    """Queries of one request: count, DB time and repeats by fingerprint"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_seconds = Counter()
+
+    def add(self, statement, seconds):
+        key = fingerprint(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+        self.fingerprint_seconds[key] += seconds
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """[(fingerprint, times, seconds)] run threshold times or more"""
+        return [(key, times, self.fingerprint_seconds[key])
+                for key, times in self.fingerprints.most_common()
+                if times >= threshold]
+
+    def header(self):
+        """Server-Timing value, e.g. db;dur=3.41;desc="12 queries, 1 repeated" """
+        repeats = len(self.repeated())
+        desc = f"{self.count} {'query' if self.count == 1 else 'queries'}"
+        if repeats:
+            desc += f", {repeats} repeated"
+        return f'db;dur={self.seconds * 1000:.2f};desc="{desc}"'
+
+
+def current():
+    """RequestQueries of the request being served, or None"""
+    return g.get('query_stats') if has_app_context() else None
+
+
+def recent():
+    """Summaries of the latest requests, newest first"""
+    with _recent_lock:
+        return list(reversed(_recent))
+
+
+def watch(engine):
+    """Time every statement on engine and charge it to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started'].pop()
+        stats = current()
+        if stats is not None:
+            stats.add(statement, seconds)
+        for hook in statement_hooks:
+            hook(conn, statement, parameters, executemany, seconds)
+
+
+def install(app, *engines):
+    """Watch engines and report each request's queries"""
+    for engine in engines:
+        watch(engine)
+
+    @app.before_request
+    def _begin():
+        g.query_stats = RequestQueries()
+
+    @app.after_request
+    def _header(response):
+        stats = current()
+        if stats is not None:
+            # Streamed bodies run their queries after this; the log and
+            # the debug page see those too
+            response.headers['Server-Timing'] = stats.header()
+        return response
+
+    @app.teardown_request
+    def _report(exc):
+        stats = g.pop('query_stats', None)
+        if stats is None or request.endpoint == 'static':
+            return
+        for reporter in reporters:
+            reporter(stats)
+        repeated = stats.repeated()
+        for key, times, seconds in repeated:
+            app.logger.warning(
+                "N+1 suspect on %s %s: %d× %s (%.1f ms)",
+                request.method, request.path, times, key, seconds * 1000)
+        app.logger.info("%s %s: %d queries, %.1f ms",
+                        request.method, request.path, stats.count,
+                        stats.seconds * 1000)
+        with _recent_lock:
+            _recent.append({
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'at': time.strftime('%H:%M:%S'),
+                'count': stats.count,
+                'ms': stats.seconds * 1000,
+                'repeated': [(key, times, seconds * 1000)
+                             for key, times, seconds in repeated],
+                'top': [(key, times, stats.fingerprint_seconds[key] * 1000)
+                        for key, times in stats.fingerprints.most_common(5)],
+            })
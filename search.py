@@ -0,0 +1,70 @@
+"""
+Full-text search
+Customers, products and invoices are indexed in SQLite FTS5 tables that
+triggers keep in step with every insert, update and delete (the tables and
+triggers are created by migrations.create_search_index). Searches are word
+prefix matches ranked by bm25, so typeahead does not scan whole tables the
+way ilike('%q%') does.
+"""
+
+from sqlalchemy import Float, Integer, column, text
+
+# Searchable table -> FTS5 table holding its index
+INDEXES = {
+    'customer': 'customer_fts',
+    'product': 'product_fts',
+    'invoice': 'invoice_fts',
+}
+
+
+def match_expression(q):
+    """FTS5 MATCH string for free text: every word as a quoted prefix.
+
+    Quoting leaves tokenizing to FTS5 (so 'INV-2025-00' is a phrase of its
+    parts) and keeps user input from being read as query syntax. None when
+    there is nothing searchable in q.
+    """
+    terms = [word.replace('"', '""') for word in (q or '').split()
+             if any(ch.isalnum() for ch in word)]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def ranked(table, q, limit=None):
+    """Subquery of (rowid, rank) for rows of table matching q.
+
+    Lower rank is a better match (bm25 with the column weights stored in the
+    index); join on rowid = <table>.id and order by rank. None when q has no
+    searchable words, so callers can fall back to their unfiltered listing.
+    """
+    expression = match_expression(q)
+    if expression is None:
+        return None
+    fts = INDEXES[table]
+    sql = f"SELECT rowid, rank FROM {fts} WHERE {fts} MATCH :q ORDER BY rank"
+    params = {'q': expression}
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params['limit'] = limit
+    return (text(sql).bindparams(**params)
+            .columns(column('rowid', Integer), column('rank', Float))
+            .subquery(f"{table}_hits"))
+
+
+def contains(table, q, id_column, schema='main'):
+    """Criterion id_column IN (rowids matching q in schema's index of table).
+
+    Unranked; for filtering each part of a UNION over archived years
+    (attached as schema, each with its own index), where SQLite looks the
+    hits up by id rather than reading the whole table. None when q has no
+    searchable words.
+    """
+    expression = match_expression(q)
+    if expression is None:
+        return None
+    fts = INDEXES[table]
+    name = f"q_{schema}"
+    return id_column.in_(
+        text(f"SELECT rowid FROM {schema}.{fts} WHERE {fts} MATCH :{name}")
+        .bindparams(**{name: expression}).columns(column('rowid', Integer)))
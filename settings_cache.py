@@ -0,0 +1,52 @@
+"""
+In-memory AppSetting map
+Settings are read once into a dict and served from memory. A commit that
+writes the settings table, through AppSetting.set() or any other ORM
+insert, update or delete, moves the cache's DataVersion on; the next read
+loads the whole table again in one SELECT and swaps the new dict in, so a
+thread never sees half of an update.
+
+Other processes on the same database learn of a change from the version's
+stamp file, so a busy page makes no extra query and at most one stat call
+a second.
+"""
+
+import threading
+
+from data_version import DataVersion, STAMP_CHECK_SECONDS
+
+
+class SettingsCache:
+    def __init__(self, load, stamp_path=None, check_every=STAMP_CHECK_SECONDS):
+        self._load = load
+        self.versions = DataVersion(stamp_path, check_every)
+        self._values = None
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.versions.value
+
+    def get(self, key, default=None):
+        values = self._values
+        if values is None or self._loaded != self.versions.current():
+            values = self._reload()
+        return values[key] if key in values else default
+
+    def invalidate(self):
+        """Drop the map here and tell other processes to drop theirs"""
+        self.versions.bump()
+
+    def watch(self, model):
+        """Reload after any commit that wrote model's table"""
+        self.versions.watch(model)
+
+    def _reload(self):
+        with self._lock:
+            # Version first: a write landing during the load is seen next time
+            version = self.versions.current()
+            values = dict(self._load())
+            self._values = values
+            self._loaded = version
+            return values
@@ -0,0 +1,149 @@
+"""
+Slow-query log
+A statement that takes longer than the threshold is appended to a rotating
+JSONL file. Each record holds its parameters, the route that ran it and
+the EXPLAIN QUERY PLAN taken on the same connection straight afterwards,
+so a khata book or history page that was slow this morning can still be
+looked into in the evening.
+
+worst() reads the log back and ranks statement fingerprints by total time
+for the settings page.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+import query_monitor
+
+DEFAULT_THRESHOLD_MS = 250
+SETTING_KEY = 'SLOW_QUERY_MS'
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+MAX_PARAMETERS = 50     # long IN-lists are cut, the count is kept
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+threshold_ms = DEFAULT_THRESHOLD_MS
+log_path = None
+
+_logger = logging.getLogger('slow_queries')
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+
+
+def clean_threshold(value):
+    """Threshold in whole milliseconds; raises ValueError when not allowed"""
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError("threshold must be a whole number of milliseconds")
+    if number < 1:
+        raise ValueError("threshold must be at least 1 ms")
+    return number
+
+
+def set_threshold(value):
+    global threshold_ms
+    threshold_ms = clean_threshold(value)
+
+
+def install(path, threshold=None):
+    """Log statements slower than threshold ms (default 250) to path"""
+    global log_path
+    if threshold not in (None, ''):
+        try:
+            set_threshold(threshold)
+        except ValueError:
+            pass  # keep the default rather than refuse to start
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(path, maxBytes=MAX_BYTES,
+                                  backupCount=BACKUP_COUNT, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(handler)
+    log_path = path
+    if _record not in query_monitor.statement_hooks:
+        query_monitor.statement_hooks.append(_record)
+
+
+def explain(conn, statement, parameters):
+    """EXPLAIN QUERY PLAN details of statement, on conn as it is now"""
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[3] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except sqlite3.Error as e:
+        return [f"EXPLAIN failed: {e}"]
+
+
+def _record(conn, statement, parameters, executemany, seconds):
+    ms = seconds * 1000
+    if ms < threshold_ms or log_path is None:
+        return
+    if executemany:
+        rows, parameters = len(parameters), parameters[0] if parameters else ()
+    else:
+        rows = None
+    values = (list(parameters.values()) if isinstance(parameters, dict)
+              else list(parameters or ()))
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'ms': round(ms, 2),
+        'fingerprint': query_monitor.fingerprint(statement),
+        'statement': statement,
+        'parameters': values[:MAX_PARAMETERS],
+        'parameter_count': len(values),
+        'executemany_rows': rows,
+        'route': (f"{request.method} {request.full_path.rstrip('?')}"
+                  if has_request_context() else None),
+        'endpoint': request.endpoint if has_request_context() else None,
+        'plan': explain(conn, statement, parameters),
+    }
+    _logger.info(json.dumps(entry, default=str))
+
+
+def entries():
+    """Every record still in the log, oldest file first"""
+    if log_path is None:
+        return
+    paths = [f"{log_path}.{n}" for n in range(BACKUP_COUNT, 0, -1)] + [log_path]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+
+
+def worst(limit=20):
+    """Fingerprints by total logged time: count, total/max ms, the routes
+    that ran them and the latest record (with its plan)"""
+    ranked = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                  'routes': set(), 'latest': None})
+    for entry in entries():
+        row = ranked[entry['fingerprint']]
+        row['count'] += 1
+        row['total_ms'] += entry['ms']
+        row['max_ms'] = max(row['max_ms'], entry['ms'])
+        if entry.get('endpoint'):
+            row['routes'].add(entry['endpoint'])
+        row['latest'] = entry
+    rows = [dict(row, fingerprint=key) for key, row in ranked.items()]
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows[:limit]
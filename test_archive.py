@@ -0,0 +1,200 @@
+"""
+Financial-year archives: settled bills of a closed year move to their own
+file, default pages read only the main file, and date filters that reach
+the year union it back in.
+"""
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+import archive
+from dates import financial_year
+from app import (app, db, pdf_queue, report_engine, ArchivedYear, Customer, CustomerStats,
+                 DailySummary, Invoice, InvoiceItem, Payment, PdfJob, Product)
+
+
+@pytest.fixture(scope="module")
+def archived(archive_year):
+    with app.app_context():
+        customer = Customer(name="Archive Customer")
+        product = Product(name="Archive Tube Light", price=300.0)
+        db.session.add_all([customer, product])
+        db.session.flush()
+        settled = Invoice(number="ARC-000001", customer_id=customer.id,
+                          invoice_date=date(2022, 6, 1), notes="old shop fitting",
+                          total_paise=60000, total_paid_paise=60000)
+        unpaid = Invoice(number="ARC-000002", customer_id=customer.id,
+                         invoice_date=date(2022, 7, 1),
+                         total_paise=30000, total_paid_paise=0)
+        db.session.add_all([settled, unpaid])
+        db.session.flush()
+        db.session.add_all([
+            InvoiceItem(invoice_id=settled.id, product_id=product.id, qty=2,
+                        price=300.0, line_total_paise=60000),
+            Payment(invoice_id=settled.id, amount_paise=60000,
+                    payment_date=date(2022, 6, 1), payment_method="cash"),
+        ])
+        # A bill of the open year stays in the main file
+        newer = Invoice(number="ARC-000003", customer_id=customer.id,
+                        invoice_date=date.today(), total_paise=30000,
+                        total_paid_paise=30000)
+        db.session.add(newer)
+        db.session.flush()
+        db.session.add_all([
+            InvoiceItem(invoice_id=newer.id, product_id=product.id, qty=1,
+                        price=300.0, line_total_paise=30000),
+            Payment(invoice_id=newer.id, amount_paise=30000,
+                    payment_date=date.today(), payment_method="upi"),
+        ])
+        db.session.commit()
+        CustomerStats.refresh(customer.id)
+        DailySummary.rebuild()
+        db.session.commit()
+        stats = db.session.get(CustomerStats, customer.id)
+        before = ((stats.invoice_count, stats.total_spent_paise),
+                  DailySummary.for_period("2022-06-01").payments_paise)
+
+        customer_id, settled_id = customer.id, settled.id
+        moved = archive_year("2022-23")
+        yield customer_id, settled_id, moved, before
+
+
+def test_only_settled_bills_move(archived):
+    customer_id, settled_id, moved, _ = archived
+    assert moved == {"invoice": 1, "invoice_item": 1, "payment": 1}
+    with app.app_context():
+        assert db.session.get(Invoice, settled_id) is None
+        assert Invoice.query.filter_by(number="ARC-000002").count() == 1
+        assert os.path.exists(db.session.get(ArchivedYear, "2022-23").path)
+
+
+def test_default_pages_skip_archive(archived, client):
+    assert "ARC-000001" not in client.get("/invoices").data.decode()
+    page = client.get("/invoices?fy=2022-23").data.decode()
+    assert "ARC-000001" in page and "ARC-000002" in page
+    assert "ARC-000001" not in client.get("/invoice-history").data.decode()
+
+
+def test_history_and_statement_union_archive(archived, client):
+    customer_id, *_ = archived
+    page = client.get("/invoice-history?date_from=2022-04-01&date_to=2023-03-31"
+                      "&search=fitting").data.decode()
+    assert "ARC-000001" in page and "ARC-000002" not in page
+    assert "ARC-000001" not in client.get(
+        f"/customer/{customer_id}/khata").data.decode()
+    assert "ARC-000001" in client.get(
+        f"/customer/{customer_id}/khata?from=2022-04-01").data.decode()
+
+
+def test_attached_archives_are_not_checked_again(archived, client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    url = "/invoice-history?date_from=2022-04-01&date_to=2023-03-31"
+    client.get(url)
+    event.listen(report_engine, "before_cursor_execute", record)
+    try:
+        for _ in range(3):
+            client.get(url + "&search=fitting")
+    finally:
+        event.remove(report_engine, "before_cursor_execute", record)
+    assert statements
+    assert not [sql for sql in statements
+                if "sqlite_master" in sql or sql.startswith(("PRAGMA", "ATTACH"))]
+
+
+def test_archived_bill_opens(archived, client):
+    _, settled_id, _, _ = archived
+    resp = client.get(f"/invoice/{settled_id}")
+    assert resp.status_code == 200
+    page = resp.data.decode()
+    assert "ARC-000001" in page and "Archive Tube Light" in page
+    assert f"/invoice/{settled_id}" in client.get(
+        "/invoices?fy=2022-23").data.decode()
+    pdf = client.get("/invoice_pdf/ARC-000001")
+    assert pdf.status_code == 200 and pdf.data.startswith(b"%PDF")
+
+
+def test_archived_ids_are_not_handed_out_again(archived, archive_year):
+    with app.app_context():
+        customer = Customer(name="Archive Newest Customer")
+        db.session.add(customer)
+        db.session.flush()
+        bill = Invoice(number="ARC-000010", customer_id=customer.id,
+                       invoice_date=date(2021, 6, 1), total_paise=10000,
+                       total_paid_paise=10000)
+        db.session.add(bill)
+        db.session.flush()
+        item = InvoiceItem(invoice_id=bill.id, qty=1, price=100.0,
+                           line_total_paise=10000)
+        payment = Payment(invoice_id=bill.id, amount_paise=10000,
+                          payment_date=date(2021, 6, 1), payment_method="cash")
+        db.session.add_all([item, payment])
+        db.session.commit()
+        archived_ids = (bill.id, item.id, payment.id)
+        # The newest bill, item and payment all move out
+        archive_year("2021-22")
+        assert db.session.get(Invoice, archived_ids[0]) is None
+
+        def new_ids():
+            bill = Invoice(number="ARC-000011", customer_id=customer.id)
+            db.session.add(bill)
+            db.session.flush()
+            item = InvoiceItem(invoice_id=bill.id, qty=1, line_total_paise=0)
+            payment = Payment(invoice_id=bill.id, amount_paise=0)
+            db.session.add_all([item, payment])
+            db.session.flush()
+            ids = (bill.id, item.id, payment.id)
+            db.session.rollback()
+            return ids
+
+        assert all(new > old for new, old in zip(new_ids(), archived_ids))
+
+        # An archive made before the ids were AUTOINCREMENT: the sequences
+        # may be behind it until startup raises them
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE sqlite_sequence SET seq = 1 "
+                                 "WHERE name IN ('invoice', 'invoice_item', 'payment')")
+            year = db.session.get(ArchivedYear, "2021-22")
+            schema, = archive.attach(conn, [(year.label, year.path)])
+            archive.reserve_ids(conn, schema)
+        assert all(new > old for new, old in zip(new_ids(), archived_ids))
+
+
+def test_archiving_drops_pdf_jobs(archive_year):
+    with app.app_context():
+        customer = Customer(name="Archive Job Customer")
+        db.session.add(customer)
+        db.session.flush()
+        bill = Invoice(number="ARC-000020", customer_id=customer.id,
+                       invoice_date=date(2020, 6, 1), total_paise=10000,
+                       total_paid_paise=10000)
+        db.session.add(bill)
+        db.session.flush()
+        pdf_queue.enqueue(bill.id, 'render')
+        pdf_queue.enqueue(bill.id, 'print')
+        db.session.commit()
+        bill_id = bill.id
+        archive_year("2020-21")
+        assert db.session.get(Invoice, bill_id) is None
+        assert PdfJob.query.filter_by(invoice_id=bill_id).count() == 0
+
+
+def test_rebuilds_include_archive(archived):
+    customer_id, _, _, before = archived
+    with app.app_context():
+        CustomerStats.refresh(customer_id)
+        DailySummary.rebuild()
+        db.session.commit()
+        stats = db.session.get(CustomerStats, customer_id)
+        assert ((stats.invoice_count, stats.total_spent_paise),
+                DailySummary.for_period("2022-06-01").payments_paise) == before
+
+
+def test_open_year_is_not_archived():
+    with app.app_context(), pytest.raises(ValueError):
+        ArchivedYear.archive(financial_year(date.today()))
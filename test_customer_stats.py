@@ -0,0 +1,81 @@
+"""
+customer_stats stays equal to a fresh aggregate over invoices through the
+save, duplicate and delete paths.
+"""
+from datetime import date
+
+import pytest
+
+from app import app, db, Customer, CustomerStats, Invoice, Product
+
+
+@pytest.fixture
+def customer_and_product():
+    with app.app_context():
+        customer = Customer(name="Stats Customer")
+        product = Product(name="Stats Bulb", price=120.0)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        yield customer.id, product.id
+
+
+def expected_stats(customer_id):
+    return db.session.query(
+        db.func.count(Invoice.id),
+        db.func.coalesce(db.func.sum(Invoice.total_paise), 0),
+        db.func.min(Invoice.invoice_date),
+        db.func.max(Invoice.invoice_date)
+    ).filter(Invoice.customer_id == customer_id).one()
+
+
+def stored_stats(customer_id):
+    stats = db.session.get(CustomerStats, customer_id)
+    db.session.refresh(stats)
+    return (stats.invoice_count, stats.total_spent_paise,
+            stats.first_purchase, stats.last_purchase)
+
+
+def save_invoice(client, customer_id, product_id, invoice_date, qty):
+    return client.post("/save_invoice", data={
+        "customer_id": customer_id,
+        "invoice_date": invoice_date,
+        "product_id[]": [product_id],
+        "qty[]": [qty],
+        "discount[]": ["0"],
+        "tax[]": ["0"],
+        "rate[]": ["120"],
+        "description[]": [""],
+    })
+
+
+def test_stats_follow_invoice_writes(client, customer_and_product):
+    customer_id, product_id = customer_and_product
+    save_invoice(client, customer_id, product_id, "2025-09-10", 2)
+    save_invoice(client, customer_id, product_id, "2025-08-01", 1)
+
+    with app.app_context():
+        assert stored_stats(customer_id) == (
+            2, 36000, date(2025, 8, 1), date(2025, 9, 10))
+        first = Invoice.query.filter_by(customer_id=customer_id).order_by(
+            Invoice.invoice_date).first()
+        latest_number = Invoice.query.filter_by(customer_id=customer_id).order_by(
+            Invoice.invoice_date.desc()).first().number
+        first_number = first.number
+
+    client.post(f"/duplicate_invoice/{latest_number}")
+    with app.app_context():
+        assert stored_stats(customer_id) == tuple(expected_stats(customer_id))
+
+    client.post(f"/delete_invoice/{first_number}")
+    with app.app_context():
+        assert stored_stats(customer_id) == tuple(expected_stats(customer_id))
+        assert stored_stats(customer_id)[2] == date(2025, 9, 10)
+
+
+def test_customers_page_reads_stats(client, customer_and_product):
+    customer_id, product_id = customer_and_product
+    save_invoice(client, customer_id, product_id, "2025-09-10", 3)
+    page = client.get("/customers?search=Stats+Customer").data.decode()
+    assert "360.00" in page
+    export = client.get("/export_customers").data.decode()
+    assert "Stats Customer" in export
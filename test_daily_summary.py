@@ -0,0 +1,71 @@
+"""
+daily_summary: incremental bumps from the routes agree with a full rebuild,
+and the dashboard figures come from the summary rows.
+"""
+from datetime import date
+
+from app import app, db, Customer, DailySummary, Invoice, Product
+
+
+def snapshot():
+    db.session.expire_all()
+    rows = {
+        row.period: tuple(getattr(row, name) for name in DailySummary.COUNTERS)
+        for row in DailySummary.query.all()
+    }
+    # Days bumped back to zero are equivalent to missing days
+    return {period: values for period, values in rows.items() if any(values)}
+
+
+def test_incremental_summary_matches_rebuild(client):
+    # Other tests insert rows directly; start from a consistent summary
+    with app.app_context():
+        DailySummary.rebuild()
+        db.session.commit()
+
+    client.post("/add_customer", data={"name": "Summary Customer"})
+    with app.app_context():
+        product = Product(name="Summary Fan", price=1450.0)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+        customer_id = Customer.query.filter_by(name="Summary Customer").one().id
+
+    client.post("/save_invoice", data={
+        "customer_id": customer_id,
+        "invoice_date": "2025-10-03",
+        "invoice_discount": "50",
+        "product_id[]": [product_id], "qty[]": ["2"], "discount[]": ["0"],
+        "tax[]": ["0"], "rate[]": ["1450"], "description[]": [""],
+        "initial_payment_amount": "1000",
+        "initial_payment_method": "upi",
+        "initial_payment_date": "2025-10-03",
+    })
+    with app.app_context():
+        invoice = Invoice.query.filter_by(customer_id=customer_id).one()
+        invoice_id, number = invoice.id, invoice.number
+    client.post(f"/invoice/{invoice_id}/add-payment",
+                data={"amount": "500", "payment_date": "2025-10-04",
+                      "payment_method": "cash"})
+    client.post(f"/duplicate_invoice/{number}")
+
+    with app.app_context():
+        day = DailySummary.for_period(date(2025, 10, 3))
+        assert (day.bill_count, day.revenue_paise, day.discount_paise) == (
+            1, 285000, 5000)
+        assert (day.payments_paise, day.upi_paise) == (100000, 100000)
+        assert DailySummary.for_period("2025-10-04").cash_paise == 50000
+
+        incremental = snapshot()
+        DailySummary.rebuild()
+        db.session.commit()
+        assert snapshot() == incremental
+
+
+def test_dashboard_reads_summary(client):
+    with app.app_context():
+        totals = DailySummary.for_period(DailySummary.ALL)
+        expected = (totals.bill_count, totals.revenue)
+    stats = client.get("/api/dashboard_stats").get_json()["stats"]
+    assert (stats["invoices_count"], stats["total_revenue"]) == expected
+    assert client.get("/").status_code == 200
@@ -0,0 +1,46 @@
+"""
+Connection profile: every pooled connection gets the configured PRAGMAs,
+and saving the Database settings tab applies to new connections.
+"""
+import pytest
+
+import db_profile
+from app import app, db, AppSetting
+
+
+@pytest.fixture
+def admin_client(admin_client):
+    # Put the default profile back for the other tests
+    yield admin_client
+    with app.app_context():
+        for name in db_profile.PRAGMA_ORDER:
+            AppSetting.query.filter_by(key=db_profile.setting_key(name)).delete()
+        db.session.commit()
+        db.engine.dispose()
+
+
+def test_default_profile_applied():
+    with app.app_context():
+        active = db_profile.current_pragmas(db.engine)
+    assert active["journal_mode"].upper() == "WAL"
+    assert active["busy_timeout"] == 5000
+    assert active["synchronous"] == 1  # NORMAL
+    assert active["cache_size"] == -65536
+
+
+def test_settings_page_saves_profile(admin_client):
+    assert admin_client.get("/settings").status_code == 200
+    form = dict(db_profile.DEFAULT_PROFILE, busy_timeout="9000", synchronous="FULL")
+    resp = admin_client.post("/settings/update_db_profile", data=form)
+    assert resp.status_code == 302
+    with app.app_context():
+        active = db_profile.current_pragmas(db.engine)
+    assert active["busy_timeout"] == 9000
+    assert active["synchronous"] == 2  # FULL
+
+
+def test_invalid_profile_rejected(admin_client):
+    form = dict(db_profile.DEFAULT_PROFILE, journal_mode="OFF")
+    admin_client.post("/settings/update_db_profile", data=form)
+    with app.app_context():
+        assert AppSetting.get("SQLITE_JOURNAL_MODE") is None
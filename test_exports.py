@@ -0,0 +1,68 @@
+"""
+CSV exports stream: the header is the first chunk, rows follow in batches,
+and memory stays flat however many rows the table has.
+"""
+import csv
+import io
+import tracemalloc
+from datetime import date
+
+import pytest
+
+from app import app, db, CustomerStats, Customer, Invoice, Product
+
+CATALOG_SIZE = 50_000
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    with app.app_context():
+        db.session.execute(Product.__table__.insert(), [
+            {"name": f"Export Item {n}", "barcode": f"EXP{n:06d}",
+             "company": "Export Co", "price": 25.0, "tax": 12.0}
+            for n in range(CATALOG_SIZE)])
+        db.session.commit()
+    yield
+    with app.app_context():
+        db.session.execute(Product.__table__.delete().where(
+            Product.company == "Export Co"))
+        db.session.commit()
+
+
+def test_products_export_streams_in_flat_memory(client, catalog):
+    resp = client.get("/export_products")
+    assert resp.is_streamed
+    chunks = iter(resp.response)
+    assert next(chunks) == b"Barcode,Name,Description,Company,Price,Tax\r\n"
+
+    tracemalloc.start()
+    size = rows = 0
+    for number, chunk in enumerate(chunks, 1):
+        size += len(chunk)
+        rows += chunk.count(b"\n")
+        if number == 5:
+            _, early_peak = tracemalloc.get_traced_memory()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    resp.close()
+    assert rows >= CATALOG_SIZE
+    # Memory after 50k rows is what it was after the first few batches
+    assert peak < early_peak * 1.5
+    assert peak < size / 2
+
+
+def test_customers_export_has_totals(client):
+    with app.app_context():
+        customer = Customer(name="Export Customer", phone="9111100001")
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(Invoice(number="EXP-000001", customer_id=customer.id,
+                               invoice_date=date(2025, 9, 1), total_paise=123450))
+        db.session.commit()
+        CustomerStats.refresh(customer.id)
+        db.session.commit()
+    text = client.get("/export_customers").get_data(as_text=True)
+    rows = {row["Name"]: row for row in csv.DictReader(io.StringIO(text))}
+    assert rows["Export Customer"]["Phone"] == "9111100001"
+    assert rows["Export Customer"]["Total Spent"] == "1234.5"
+    assert rows["Export Customer"]["Total Orders"] == "1"
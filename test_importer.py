@@ -0,0 +1,137 @@
+"""
+Bulk import: CSV rows upsert by barcode/phone in batches, bad rows are
+reported by line without stopping the file, and the export files import
+back as they are.
+"""
+import io
+import json
+
+from app import (app, db, product_names, Customer, DailySummary, Product)
+
+
+def upload(client, kind, text, filename="upload.csv"):
+    resp = client.post(f"/import/{kind}", data={
+        "file": (io.BytesIO(text.encode()), filename)})
+    if resp.mimetype != "application/x-ndjson":
+        return resp, None
+    return resp, [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+def test_products_upsert_by_barcode(admin_client):
+    _, progress = upload(admin_client, "products",
+                         "Barcode,Name,Company,Price,Tax\n"
+                         "IMP-001,Import Ceiling Fan,Orient,1850,18\n"
+                         "IMP-002,Import Wall Fan,Orient,1450,\n"
+                         "IMP-003,Import Bad Price,Orient,abc,18\n"
+                         ",Import Loose Wire,,12.5,5\n"
+                         "IMP-004,,Orient,99,18\n")
+    done = progress[-1]
+    assert done["done"]
+    assert (done["rows"], done["created"], done["failed"]) == (5, 3, 2)
+    errors = [error for step in progress for error in step["errors"]]
+    assert errors == [[4, "price 'abc' is not a number"], [6, "name is missing"]]
+
+    _, progress = upload(admin_client, "products",
+                         "Barcode,Name,Company,Price,Tax\n"
+                         "IMP-001,Import Ceiling Fan,Orient,\"1,950\",18\n"
+                         "IMP-005,Import Table Fan,Orient,1250,18\n")
+    assert (progress[-1]["created"], progress[-1]["updated"]) == (1, 1)
+    with app.app_context():
+        fan = Product.query.filter_by(barcode="IMP-001").one()
+        assert fan.price == 1950.0
+        assert Product.query.filter_by(barcode="IMP-002").one().tax == 0.0
+        assert Product.query.filter(Product.name.like("Import %")).count() == 4
+        # Chotu's fuzzy index sees the imported names
+        assert product_names.best("import table fan").name == "Import Table Fan"
+
+
+def test_blank_cells_keep_stored_values(admin_client):
+    upload(admin_client, "products",
+           "Barcode,Name,Description,Price,Tax\n"
+           "IMP-101,Import LED Panel,Slim 2x2 ft,950,18\n"
+           "IMP-102,Import LED Strip,5 m roll,450,12\n")
+    # A distributor list with the columns but nothing in some cells
+    _, progress = upload(admin_client, "products",
+                         "Barcode,Name,Description,Price,Tax\n"
+                         "IMP-101,Import LED Panel,,990,\n"
+                         "IMP-102,Import LED Strip,10 m roll,480,\n"
+                         "IMP-103,Import LED Batten,,300,\n")
+    assert (progress[-1]["created"], progress[-1]["updated"]) == (1, 2)
+    with app.app_context():
+        panel, strip, batten = (Product.query.filter_by(barcode=barcode).one()
+                                for barcode in ("IMP-101", "IMP-102", "IMP-103"))
+        assert (panel.description, panel.price, panel.tax) == \
+            ("Slim 2x2 ft", 990.0, 18.0)
+        assert (strip.description, strip.price, strip.tax) == \
+            ("10 m roll", 480.0, 12.0)
+        # New rows still get the usual defaults for blank cells
+        assert (batten.description, batten.tax) == (None, 0.0)
+
+    upload(admin_client, "customers",
+           "Name,Mobile,Email,Address\n"
+           "Import Mehta,9000000101,mehta@example.com,Station Road\n")
+    upload(admin_client, "customers",
+           "Name,Mobile,Email,Address\n"
+           "Import Mehta Bros,9000000101,,\n")
+    with app.app_context():
+        customer = Customer.query.filter_by(phone="9000000101").one()
+        assert (customer.name, customer.email, customer.address) == \
+            ("Import Mehta Bros", "mehta@example.com", "Station Road")
+
+
+def test_customers_report_duplicate_email_per_row(admin_client):
+    with app.app_context():
+        db.session.add(Customer(name="Email Owner", phone="9000000001",
+                                email="taken@example.com"))
+        db.session.commit()
+        before = DailySummary.for_period(DailySummary.ALL).new_customers
+    _, progress = upload(admin_client, "customers",
+                         "Name,Mobile,Email\n"
+                         "Import Shah,9000000002,shah@example.com\n"
+                         "Import Clash,9000000003,taken@example.com\n"
+                         "Email Owner Renamed,9000000001,taken@example.com\n")
+    done = progress[-1]
+    assert (done["created"], done["updated"], done["failed"]) == (1, 1, 1)
+    errors = [error for step in progress for error in step["errors"]]
+    assert [line for line, _ in errors] == [3]
+    assert "customer.email" in errors[0][1]
+    with app.app_context():
+        assert Customer.query.filter_by(phone="9000000001").one().name == \
+            "Email Owner Renamed"
+        assert Customer.query.filter_by(phone="9000000003").first() is None
+        after = DailySummary.for_period(DailySummary.ALL).new_customers
+        assert after == before + 1
+
+
+def test_export_imports_back(admin_client):
+    with app.app_context():
+        db.session.add(Product(barcode="RT-1", name="Round Trip Switch",
+                               price=45.0, tax=18.0))
+        db.session.commit()
+        count = Product.query.count()
+        # Rows without a barcode have nothing to match and come in again
+        loose = Product.query.filter(Product.barcode.is_(None)).count()
+    exported = admin_client.get("/export_products").get_data(as_text=True)
+    _, progress = upload(admin_client, "products", exported)
+    assert progress[-1]["failed"] == 0
+    assert progress[-1]["updated"] == count - loose
+    with app.app_context():
+        assert Product.query.count() == count + loose
+
+
+def test_bad_uploads_are_refused(admin_client):
+    resp, _ = upload(admin_client, "products", "Barcode,Name\nX-1,No Price\n")
+    assert resp.status_code == 400
+    assert "price" in resp.get_json()["error"]
+    resp, _ = upload(app.test_client(), "products", "Name,Price\nA,1\n")
+    assert resp.status_code == 403
+
+
+def test_import_command(tmp_path):
+    path = tmp_path / "customers.csv"
+    path.write_text("Name,Phone\nCli Customer,9000000099\n")
+    result = app.test_cli_runner().invoke(args=["import", "customers", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "1 new" in result.output
+    with app.app_context():
+        assert Customer.query.filter_by(phone="9000000099").one().name == "Cli Customer"
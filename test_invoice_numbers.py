@@ -0,0 +1,99 @@
+"""
+Invoice numbers: the sequence row is seeded from the highest number
+already issued, the financial-year series restarts every April, and
+concurrent saves never share a number.
+"""
+import threading
+from datetime import date
+
+import pytest
+
+from app import (app, db, generate_next_invoice_number, AppSetting, Customer,
+                 Invoice, Product)
+
+
+@pytest.fixture
+def fy_prefix():
+    with app.app_context():
+        AppSetting.set('INVOICE_FY_PREFIX', 'true')
+    yield
+    with app.app_context():
+        AppSetting.set('INVOICE_FY_PREFIX', 'false')
+
+
+def reserve(on_date):
+    with app.app_context():
+        number = generate_next_invoice_number(on_date)
+        db.session.commit()
+        return number
+
+
+def test_series_is_seeded_from_highest_number(fy_prefix):
+    with app.app_context():
+        customer = Customer(name="Sequence Customer")
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add_all([
+            Invoice(number=number, customer_id=customer.id)
+            for number in ("INV-2031-32-000007", "INV-2031-32-000041",
+                           # Not part of the series: suffix not all digits
+                           "INV-2031-32-00009X", "INV-2031-32-9999-A")])
+        db.session.commit()
+    assert reserve(date(2031, 5, 1)) == "INV-2031-32-000042"
+    assert reserve(date(2032, 3, 31)) == "INV-2031-32-000043"
+
+
+def test_financial_year_series_restarts_in_april(fy_prefix):
+    assert reserve(date(2033, 3, 31)) == "INV-2032-33-000001"
+    assert reserve(date(2033, 3, 31)) == "INV-2032-33-000002"
+    assert reserve(date(2033, 4, 1)) == "INV-2033-34-000001"
+    # The old year's series carries on where it stopped
+    assert reserve(date(2033, 1, 15)) == "INV-2032-33-000003"
+
+
+def test_rolled_back_save_releases_its_number(fy_prefix):
+    with app.app_context():
+        first = generate_next_invoice_number(date(2034, 6, 1))
+        db.session.rollback()
+    assert reserve(date(2034, 6, 1)) == first
+
+
+def test_concurrent_saves_get_distinct_numbers():
+    with app.app_context():
+        customer = Customer(name="Concurrent Sequence Customer")
+        product = Product(name="Concurrent Sequence Bulb", price=80.0)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        customer_id, product_id = customer.id, product.id
+
+    threads, saves = 4, 5
+    start = threading.Barrier(threads)
+    errors = []
+
+    def worker():
+        client = app.test_client()
+        start.wait()
+        for _ in range(saves):
+            resp = client.post("/save_invoice", data={
+                "customer_id": customer_id,
+                "invoice_date": "2025-11-01",
+                "product_id[]": [product_id], "qty[]": ["1"],
+                "discount[]": ["0"], "tax[]": ["0"], "rate[]": ["80"],
+                "description[]": [""],
+            })
+            # A failed save redirects back to the form instead
+            if not resp.location.endswith("/invoices"):
+                errors.append(resp.location)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    assert not errors
+    with app.app_context():
+        numbers = [number for (number,) in db.session.query(Invoice.number)
+                   .filter(Invoice.customer_id == customer_id)]
+    assert len(numbers) == threads * saves
+    assert len(set(numbers)) == len(numbers)
@@ -0,0 +1,81 @@
+"""
+Invoice PDF downloads: strong content ETag, Last-Modified, 304 on a
+matching revalidation, byte ranges for in-browser viewers, and a new ETag
+once the PDF is rendered again.
+"""
+import hashlib
+import os
+
+import pytest
+
+from app import INVOICE_DIR
+
+NUMBER = "PDF-000001"
+CONTENT = b"%PDF-1.4\n" + bytes(range(256)) * 40 + b"\n%%EOF\n"
+
+
+@pytest.fixture
+def pdf():
+    path = os.path.join(INVOICE_DIR, f"{NUMBER}.pdf")
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    yield path
+    os.unlink(path)
+
+
+def test_validators_and_cache_control(client, pdf):
+    resp = client.get(f"/invoice_pdf/{NUMBER}")
+    assert resp.status_code == 200
+    assert resp.data == CONTENT
+    etag, weak = resp.get_etag()
+    assert not weak and etag == hashlib.sha256(CONTENT).hexdigest()
+    assert resp.last_modified is not None
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert resp.cache_control.private and resp.cache_control.no_cache
+
+
+def test_conditional_requests(client, pdf):
+    first = client.get(f"/invoice_pdf/{NUMBER}")
+    etag = first.headers["ETag"]
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.data == b""
+    assert resp.headers["ETag"] == etag
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={
+        "If-Modified-Since": first.headers["Last-Modified"]})
+    assert resp.status_code == 304
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={"If-None-Match": '"stale"'})
+    assert resp.status_code == 200 and resp.data == CONTENT
+
+    # Rendering again (after a payment, say) changes the ETag
+    with open(pdf, "ab") as f:
+        f.write(b"%% paid\n")
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+def test_partial_requests(client, pdf):
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={"Range": "bytes=0-99"})
+    assert resp.status_code == 206
+    assert resp.data == CONTENT[:100]
+    assert resp.headers["Content-Range"] == f"bytes 0-99/{len(CONTENT)}"
+
+    resp = client.get(f"/invoice_pdf/{NUMBER}", headers={"Range": "bytes=-7"})
+    assert resp.status_code == 206 and resp.data == CONTENT[-7:]
+
+    # If-Range with the current ETag gets the range, a stale one the whole file
+    etag = resp.headers["ETag"]
+    resp = client.get(f"/invoice_pdf/{NUMBER}",
+                      headers={"Range": "bytes=100-199", "If-Range": etag})
+    assert resp.status_code == 206 and resp.data == CONTENT[100:200]
+    resp = client.get(f"/invoice_pdf/{NUMBER}",
+                      headers={"Range": "bytes=100-199", "If-Range": '"stale"'})
+    assert resp.status_code == 200 and resp.data == CONTENT
+
+    resp = client.get(f"/invoice_pdf/{NUMBER}",
+                      headers={"Range": f"bytes={len(CONTENT) + 10}-"})
+    assert resp.status_code == 416
+
+
+def test_missing_pdf(client):
+    assert client.get("/invoice_pdf/PDF-NOPE").status_code == 404
@@ -0,0 +1,119 @@
+"""
+Customer ledger: every money-moving route appends entries whose running
+balance matches the customer's cached outstanding balance.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from app import (app, db, Customer, DailySummary, Invoice, LedgerEntry,
+                 Payment, Product)
+
+
+@pytest.fixture
+def customer_and_product():
+    with app.app_context():
+        customer = Customer(name="Ledger Customer")
+        product = Product(name="Ledger Switch", price=250.0)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        yield customer.id, product.id
+
+
+def assert_ledger_consistent(customer_id):
+    entries = LedgerEntry.query.filter_by(customer_id=customer_id).order_by(
+        LedgerEntry.id).all()
+    running = 0
+    for entry in entries:
+        running += entry.debit_paise - entry.credit_paise
+        assert entry.balance_paise == running
+    customer = db.session.get(Customer, customer_id)
+    db.session.refresh(customer)
+    assert customer.outstanding_balance_paise == running
+    return running
+
+
+def test_money_paths_post_to_ledger(client, customer_and_product):
+    customer_id, product_id = customer_and_product
+    client.post("/save_invoice", data={
+        "customer_id": customer_id,
+        "invoice_date": "2025-10-01",
+        "product_id[]": [product_id], "qty[]": ["4"], "discount[]": ["0"],
+        "tax[]": ["0"], "rate[]": ["250"], "description[]": [""],
+        "initial_payment_amount": "100",
+        "initial_payment_method": "cash",
+        "initial_payment_date": "2025-10-01",
+    })
+    with app.app_context():
+        assert assert_ledger_consistent(customer_id) == 90000
+        invoice_id = Invoice.query.filter_by(customer_id=customer_id).one().id
+
+    client.post(f"/invoice/{invoice_id}/add-payment",
+                data={"amount": "200", "payment_date": "2025-10-05"})
+    client.post(f"/customer/{customer_id}/add-payment",
+                data={"amount": "150", "payment_date": "2025-10-06"})
+    with app.app_context():
+        assert assert_ledger_consistent(customer_id) == 55000
+        payment_id = Payment.query.filter_by(invoice_id=invoice_id).order_by(
+            Payment.id.desc()).first().id
+
+    client.post(f"/payment/{payment_id}/delete")
+    with app.app_context():
+        assert assert_ledger_consistent(customer_id) == 70000
+        invoice = db.session.get(Invoice, invoice_id)
+        db.session.refresh(invoice)
+        assert invoice.remaining_paise == 70000
+
+
+def test_khata_page_does_not_write(client, customer_and_product):
+    customer_id, _ = customer_and_product
+    with app.app_context():
+        LedgerEntry.post(customer_id, 'invoice', debit_paise=5000)
+        db.session.commit()
+        count = LedgerEntry.query.count()
+
+    assert client.get(f"/customer/{customer_id}/khata").status_code == 200
+    with app.app_context():
+        assert LedgerEntry.query.count() == count
+        assert assert_ledger_consistent(customer_id) == 5000
+
+
+def test_statement_opening_balance_from_prefix(customer_and_product):
+    customer_id, _ = customer_and_product
+    with app.app_context():
+        LedgerEntry.post(customer_id, 'invoice', debit_paise=10000)
+        LedgerEntry.post(customer_id, 'payment', credit_paise=4000)
+        db.session.commit()
+        tomorrow = date.today() + timedelta(days=1)
+        assert LedgerEntry.balance_before(customer_id, tomorrow) == 6000
+        opening, entries, closing = LedgerEntry.statement(
+            customer_id, tomorrow, None)
+        assert (opening, entries, closing) == (6000, [], 6000)
+
+
+def test_statement_goes_by_entry_date(customer_and_product):
+    # Back-dated entries written today belong to their own days: in the
+    # opening balance, the statement order and the daily summary
+    customer_id, _ = customer_and_product
+    with app.app_context():
+        LedgerEntry.post(customer_id, 'invoice', debit_paise=10000,
+                         entry_date=date(2025, 9, 10))
+        LedgerEntry.post(customer_id, 'payment', credit_paise=3000,
+                         entry_date=date(2025, 10, 5))
+        LedgerEntry.post(customer_id, 'invoice', debit_paise=2000,
+                         entry_date=date(2025, 10, 2))
+        db.session.commit()
+        before = DailySummary.for_period('2025-10-05').outstanding_change_paise
+
+        opening, lines, closing = LedgerEntry.statement(
+            customer_id, date(2025, 10, 1), date(2025, 10, 31))
+        assert opening == 10000
+        assert [(entry.entry_date, balance) for entry, balance in lines] == [
+            (date(2025, 10, 2), 12000), (date(2025, 10, 5), 9000)]
+        assert closing == 9000
+
+        LedgerEntry.post(customer_id, 'payment', credit_paise=500,
+                         entry_date=date(2025, 10, 5))
+        db.session.commit()
+        assert DailySummary.for_period(
+            '2025-10-05').outstanding_change_paise == before - 500
@@ -0,0 +1,99 @@
+"""
+Eager loading: the invoice page, the invoice lists and the PDF overlay read
+customer, items and products with a fixed number of queries however many
+lines a bill has.
+"""
+import os
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import (app, db, load_invoice_document, report_engine, Customer,
+                 Invoice, InvoiceItem, Product)
+from invoice_overlay import PDFOverlayInvoiceGenerator
+
+
+@pytest.fixture(scope="module")
+def bills():
+    """Ids of a 2-line and a 12-line bill, each line a different product;
+    a few one-line bills for other customers fill out the lists"""
+    with app.app_context():
+        products = [Product(name=f"Loading Item {n}", barcode=f"LD{n:04d}",
+                            price=10.0 + n, tax=18.0) for n in range(12)]
+        db.session.add_all(products)
+        ids = []
+        for n, lines in enumerate((2, 12, 1, 1, 1, 1)):
+            customer = Customer(name=f"Loading Customer {n}",
+                                phone=f"92222000{n:02d}")
+            db.session.add(customer)
+            db.session.flush()
+            invoice = Invoice(number=f"LD-{n:06d}", customer_id=customer.id,
+                              invoice_date=date.today(), total_paise=lines * 1000)
+            db.session.add(invoice)
+            db.session.flush()
+            db.session.add_all([
+                InvoiceItem(invoice_id=invoice.id, product_id=product.id,
+                            qty=1, price=product.price, tax=18.0,
+                            line_total=product.price)
+                for product in products[:lines]])
+            ids.append(invoice.id)
+        db.session.commit()
+        yield ids[:2]
+
+
+@contextmanager
+def counted_queries():
+    """List that collects the SELECTs run inside the block, on the main
+    and the report connections"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append(statement)
+
+    engines = (db.engine, report_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count)
+
+
+def test_invoice_page_query_count_is_fixed(client, bills):
+    counts = []
+    for invoice_id in bills:
+        with app.app_context(), counted_queries() as statements:
+            resp = client.get(f"/invoice/{invoice_id}")
+        assert resp.status_code == 200
+        assert "Loading Item 1" in resp.get_data(as_text=True)
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_pdf_overlay_query_count_is_fixed(bills):
+    counts = []
+    for invoice_id in bills:
+        with app.app_context():
+            with counted_queries() as statements:
+                invoice = load_invoice_document(invoice_id)
+                path = PDFOverlayInvoiceGenerator()._create_data_overlay(invoice)
+            os.unlink(path)
+            db.session.remove()
+        counts.append(len(statements))
+    # The invoice with its customer, then items with their products
+    assert counts == [2, 2]
+
+
+def test_invoice_lists_do_not_load_per_row(client, bills):
+    for path in ("/invoices?sort=id", "/invoice-history?search=loading&date_from=&sort=id"):
+        counts = []
+        for size in (1, 20):
+            with app.app_context(), counted_queries() as statements:
+                assert client.get(f"{path}&per_page={size}").status_code == 200
+            counts.append(len(statements))
+        # Page rows come with their customers (and items) in bulk
+        assert counts[0] == counts[1], path
@@ -0,0 +1,110 @@
+"""
+Chotu name matcher: fuzzy, phonetic and transliterated lookups, and the
+index following committed product/customer writes.
+"""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import matcher
+from app import app, db, chotu_assistant, customer_names, product_names, Customer, Product
+
+
+@pytest.fixture
+def products():
+    rows = [(1, "Samsung TV 32 inch"), (2, "LED TV"), (3, "Ceiling Fan Usha"),
+            (4, "Havells Wire 1.5mm"), (5, "Sony TV")]
+    return matcher.NameIndex(lambda: rows)
+
+
+def test_misspelling_and_phonetic(products):
+    assert products.best("samsng tv").id == 1
+    assert products.best("havels wair").id == 4
+    assert products.best("iphone") is None
+
+
+def test_hindi_and_gujarati_shop_words(products):
+    assert products.best("pankha").id == 3
+    assert products.best("पंखा").id == 3
+    assert products.best("તાર").id == 4
+
+
+def test_chabi_means_key():
+    index = matcher.NameIndex(lambda: [(1, "Anchor Switch 6A"),
+                                       (2, "Door Lock Key Set")])
+    assert index.best("chabi").id == 2
+
+
+def test_indic_script_names():
+    assert matcher.transliterate("अर्पित") == "arpit"
+    customers = matcher.NameIndex(lambda: [(1, "Ramesh Patel"), (2, "રમેશભાઈ પટેલ"),
+                                           (3, "Suresh Shah")])
+    assert [m.id for m in customers.search("रमेश पटेल", limit=2)] == [1, 2]
+    assert customers.best("ramesbhai patel").id == 2
+
+
+def test_index_follows_commits():
+    with app.app_context():
+        product_names.search("warmup")  # load the index
+        product = Product(name="Matcher Geyser 15L", price=5400.0)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+        assert product_names.best("matcher geysar").id == product_id
+
+        product.name = "Matcher Heater"
+        db.session.flush()
+        db.session.rollback()  # uncommitted rename is not indexed
+        assert product_names.best("matcher geyser").id == product_id
+
+        db.session.get(Product, product_id).name = "Matcher Heater"
+        db.session.commit()
+        assert product_names.best("matcher heatr").id == product_id
+        assert product_names.best("matcher heatr").name == "Matcher Heater"
+
+        db.session.delete(db.session.get(Product, product_id))
+        db.session.commit()
+        assert all(m.id != product_id for m in product_names.search("matcher heater"))
+
+
+def test_bulk_delete_reloads_index():
+    with app.app_context():
+        customer_names.search("warmup")
+        db.session.add(Customer(name="Bulkdelete Matcherbhai"))
+        db.session.commit()
+        assert customer_names.best("bulkdelete matcherbhai")
+        Customer.query.filter_by(name="Bulkdelete Matcherbhai").delete()
+        db.session.commit()
+        assert customer_names.best("bulkdelete matcherbhai") is None
+
+
+def test_chotu_resolves_fuzzy_product():
+    with app.app_context():
+        db.session.add(Product(name="Chotu Samsung Refrigerator", price=21000.0))
+        db.session.commit()
+        product = chotu_assistant._find_product("chotu samsng fridge refrigerater")
+        assert product.name == "Chotu Samsung Refrigerator"
+
+
+def test_changes_during_load_are_kept():
+    def loader():
+        # Committed while the rows are being read
+        index.add(3, "Anchor Switch 6A")
+        index.discard(1)
+        return [(1, "Usha Fan"), (2, "LED TV")]
+
+    index = matcher.NameIndex(loader)
+    assert index.best("anchor switch").id == 3
+    assert index.best("usha fan") is None
+    assert index.best("led tv").id == 2
+
+
+def test_track_shares_one_bulk_write_listener(monkeypatch):
+    targets = []
+    monkeypatch.setattr(event, "listen",
+                        lambda target, *args: targets.append(target))
+    monkeypatch.setattr(matcher, "_TRACKED", {})
+    index = matcher.NameIndex(lambda: [])
+    matcher.track(Product, index)
+    assert Session not in targets
+    assert matcher._TRACKED == {Product: [index]}
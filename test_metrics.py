@@ -0,0 +1,88 @@
+"""
+/metrics: a plain scrape after some traffic shows request latency and DB
+time per endpoint, PDF render time per renderer, print failures and the
+assistant's latency and tokens, in the Prometheus text format.
+"""
+import re
+from types import SimpleNamespace
+
+import metrics
+from app import app, chotu_assistant, db, Invoice
+from invoice_overlay import PDFOverlayInvoiceGenerator
+from invoice_printer import printer
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[^}]*\})? (\S+)$')
+
+
+def scrape(client):
+    """{(name, labels): value} of every sample; fails on a malformed line"""
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith("#"):
+            assert line.split()[1] in ("HELP", "TYPE"), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        samples[match.group(1), match.group(2) or ""] = float(match.group(3))
+    return samples
+
+
+def test_requests_and_db_time(client):
+    before = metrics.REQUEST_SECONDS.count(endpoint="customers", method="GET",
+                                           status=200)
+    for _ in range(3):
+        client.get("/customers")
+    samples = scrape(client)
+    key = '{endpoint="customers",method="GET",status="200"}'
+    assert samples["http_request_duration_seconds_count", key] == before + 3
+    assert samples["http_request_duration_seconds_bucket",
+                   key[:-1] + ',le="+Inf"}'] == before + 3
+    assert samples["http_request_queries_count", '{endpoint="customers"}'] >= 3
+    assert samples["http_request_db_seconds_sum", '{endpoint="customers"}'] > 0
+    # Unknown URLs are redirected to the dashboard
+    client.get("/no-such-page")
+    assert ("http_request_duration_seconds_count",
+            '{endpoint="none",method="GET",status="302"}') in scrape(client)
+
+
+def test_pdf_render_and_print_failures(client, tmp_path):
+    with app.app_context():
+        invoice = Invoice(number="MET-000001", total_paise=10000)
+        db.session.add(invoice)
+        db.session.commit()
+        ok, _ = PDFOverlayInvoiceGenerator(invoice_dir=str(tmp_path)) \
+            .generate_invoice_pdf(invoice, str(tmp_path / "met.pdf"))
+        assert ok
+        missing = PDFOverlayInvoiceGenerator(
+            template_path=str(tmp_path / "missing.pdf"), invoice_dir=str(tmp_path))
+        assert not missing.generate_invoice_pdf(invoice)[0]
+    # No PDF on disk for this number: the print job fails
+    assert not printer.print_invoice("MET-NOPE")["success"]
+
+    samples = scrape(client)
+    assert samples["pdf_render_seconds_count", '{renderer="overlay"}'] >= 2
+    assert samples["pdf_render_failures_total", '{renderer="overlay"}'] >= 1
+    assert [value for (name, _), value in samples.items()
+            if name == "print_job_failures_total"] >= [1]
+
+
+def test_assistant_latency_and_tokens(client, monkeypatch):
+    def create(**kwargs):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Ji sahab"))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=8))
+
+    fake = SimpleNamespace(chat=SimpleNamespace(
+        completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(chotu_assistant, "client", fake)
+    model = chotu_assistant.model
+    before = metrics.OPENAI_TOKENS.value(model=model, kind="prompt")
+    with app.app_context():
+        chotu_assistant._generate_openai_response_with_data("namaste", "metrics")
+    samples = scrape(client)
+    assert samples["openai_tokens_total", f'{{model="{model}",kind="prompt"}}'] \
+        == before + 120
+    assert samples["openai_request_seconds_count", f'{{model="{model}"}}'] >= 1
@@ -0,0 +1,36 @@
+"""
+Schema migrations: steps that rewrite stored values keep what they could
+not convert.
+"""
+import logging
+
+from sqlalchemy import create_engine
+
+from migrations import normalize_date_columns
+
+
+def test_unreadable_dates_are_kept(caplog):
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for sql in (
+                "CREATE TABLE invoice (id INTEGER PRIMARY KEY, "
+                "invoice_date VARCHAR(20), due_date VARCHAR(20))",
+                "CREATE TABLE payment (id INTEGER PRIMARY KEY, "
+                "payment_date VARCHAR(20))",
+                "CREATE TABLE customer (id INTEGER PRIMARY KEY, "
+                "last_payment_date VARCHAR(20), "
+                "expected_next_payment_date VARCHAR(20), "
+                "outstanding_balance_paise INTEGER)",
+                "INSERT INTO invoice VALUES (1, '17-10-2025', 'next diwali')",
+                "INSERT INTO payment VALUES (1, '2025-10-17 10:30:00')"):
+            conn.exec_driver_sql(sql)
+        with caplog.at_level(logging.WARNING, logger="migrations"):
+            normalize_date_columns(conn)
+
+        assert conn.exec_driver_sql(
+            "SELECT invoice_date, due_date FROM invoice").one() == ("2025-10-17", None)
+        assert conn.exec_driver_sql(
+            "SELECT payment_date FROM payment").scalar() == "2025-10-17"
+        assert conn.exec_driver_sql("SELECT * FROM unreadable_date").all() == [
+            ("invoice", 1, "due_date", "next diwali")]
+    assert "next diwali" in caplog.text
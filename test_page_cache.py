@@ -0,0 +1,94 @@
+"""
+Page cache: repeat views of the dashboard, khata book and unfiltered
+history are served from memory until a commit writes business data;
+filtered views and pages with flashed messages always render.
+"""
+import pytest
+
+from app import (app, db, data_version, page_cache, Customer, DATA_STAMP,
+                 Product)
+from data_version import DataVersion
+from page_cache import PageCache
+
+
+@pytest.fixture
+def client(client):
+    page_cache.clear()
+    return client
+
+
+def view(client, url):
+    resp = client.get(url)
+    assert resp.status_code == 200
+    return resp.headers.get("X-Page-Cache"), resp.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("url", ["/", "/khata-book", "/invoice-history",
+                                 "/invoice-history?sort=amount_desc&per_page=5"])
+def test_repeat_view_is_served_from_memory(client, url):
+    first, html = view(client, url)
+    assert first == "miss"
+    resp = client.get(url)
+    assert resp.headers["X-Page-Cache"] == "hit"
+    assert resp.get_data(as_text=True) == html
+    # Not a single query for the repeat
+    assert 'desc="0 queries"' in resp.headers["Server-Timing"]
+
+
+def test_write_renders_again(client):
+    with app.app_context():
+        before = Product.query.count()
+    view(client, "/")
+    assert view(client, "/")[0] == "hit"
+    with app.app_context():
+        db.session.add(Product(name="Page Cache Bulb", price=99.0, tax=12.0))
+        db.session.commit()
+    state, html = view(client, "/")
+    assert state == "miss"
+    assert str(before + 1) in html
+    assert view(client, "/")[0] == "hit"
+
+    # Bulk and rolled back writes
+    version = data_version.current()
+    with app.app_context():
+        Customer.query.filter(Customer.name == "nobody").delete()
+        db.session.rollback()
+        assert data_version.current() == version
+        Customer.query.filter(Customer.name == "nobody").delete()
+        db.session.commit()
+    assert data_version.current() > version
+
+
+def test_filtered_history_and_flashes_render(client):
+    assert view(client, "/invoice-history?search=bulb")[0] is None
+    assert view(client, "/invoice-history?search=bulb")[0] is None
+    view(client, "/khata-book")
+    with client.session_transaction() as sess:
+        sess["_flashes"] = [("success", "Payment saved")]
+    state, html = view(client, "/khata-book")
+    assert state is None and "Payment saved" in html
+    assert view(client, "/khata-book")[0] == "hit"
+
+
+def test_other_process_write_is_noticed():
+    # A second process (the CLI importer, say) keeps its own counter
+    other = DataVersion(DATA_STAMP, check_every=0)
+    seen = other.current()
+    data_version.bump()
+    assert other.current() > seen
+
+
+def test_lru_bounds():
+    version = DataVersion()
+    cache = PageCache(version, max_entries=3, max_bytes=25)
+    for n in range(4):
+        cache.put(("page", n), 0, (b"x" * 5, "text/html"))
+    assert len(cache) == 3 and cache.get(("page", 0)) is None
+    cache.get(("page", 1))
+    cache.put(("page", 4), 0, (b"x" * 5, "text/html"))
+    assert cache.get(("page", 1)) is not None and cache.get(("page", 2)) is None
+    cache.put(("big", 0), 0, (b"x" * 20, "text/html"))
+    assert cache.size <= 25
+    # Entries of an older version are dropped with the first newer one
+    cache.put(("page", 9), 1, (b"x", "text/html"))
+    assert len(cache) == 1
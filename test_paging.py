@@ -0,0 +1,147 @@
+"""
+Keyset pagination: walking the invoice listings page by page visits every
+matching bill exactly once, in order, for every sort the history page
+offers (undated and customerless bills included), while the totals cover
+all matches.
+"""
+import re
+from datetime import date
+from html import unescape
+
+import pytest
+
+import paging
+from dates import financial_year, financial_year_bounds
+from app import app, db, Customer, Invoice
+
+
+@pytest.fixture(scope="module")
+def bills():
+    with app.app_context():
+        customers = [Customer(name=f"Pager {name}") for name in "ACB"]
+        db.session.add_all(customers)
+        db.session.flush()
+        ids = []
+        for n in range(23):
+            invoice = Invoice(
+                number=f"PG-{n:06d}",
+                customer_id=customers[n % 3].id if n % 7 else None,
+                invoice_date=date(2025, 5, 1 + n % 4) if n % 5 else None,
+                total_paise=(n % 6) * 10000 if n % 4 else None,
+                notes="pager bill")
+            db.session.add(invoice)
+            db.session.flush()
+            ids.append(invoice.id)
+        db.session.commit()
+        yield ids
+
+
+def walk(client, url):
+    """Invoice numbers of every page, following the Next page links"""
+    numbers, pages = [], 0
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        numbers += re.findall(r">#?(PG-\d{6})<", html)
+        match = re.search(r'href="([^"]+)"[^>]*>(?:Next page|Older)', html)
+        url = unescape(match.group(1)) if match else None
+        pages += 1
+    return numbers, pages
+
+
+def expected(sort):
+    """All pager bills in the order the history page promises"""
+    def key(invoice, value):
+        # SQLite sorts NULL lowest; ties go by id
+        return (value is not None, value if value is not None else 0, invoice.id)
+    rows = Invoice.query.filter(Invoice.number.like("PG-%")).all()
+    field = {"date_asc": "invoice_date", "date_desc": "invoice_date",
+             "amount_asc": "total_paise", "amount_desc": "total_paise",
+             "number": "number"}.get(sort)
+    if sort == "customer":
+        rows.sort(key=lambda i: key(i, i.customer.name if i.customer else None))
+    elif field:
+        rows.sort(key=lambda i: key(i, getattr(i, field)))
+    else:
+        rows.sort(key=lambda i: i.id)
+    if sort.endswith("desc") or sort == "id":
+        rows.reverse()
+    return [invoice.number for invoice in rows]
+
+
+@pytest.mark.parametrize("sort", ["date_desc", "date_asc", "amount_desc",
+                                  "amount_asc", "customer", "number", "id"])
+def test_history_pages_cover_every_bill_once(client, bills, sort):
+    numbers, pages = walk(
+        client, f"/invoice-history?search=pager&date_from=&sort={sort}&per_page=4")
+    with app.app_context():
+        assert numbers == expected(sort)
+    assert pages == 6
+
+
+def test_history_totals_cover_all_pages(client, bills):
+    html = client.get("/invoice-history?search=pager&date_from=&per_page=5") \
+        .get_data(as_text=True)
+    assert "23 found" in html
+    with app.app_context():
+        revenue = sum(i.total_paise or 0 for i in
+                      Invoice.query.filter(Invoice.number.like("PG-%")))
+    assert f"₹{revenue / 100:.2f}" in html
+
+
+def test_invoices_list_pages_by_id(client, bills):
+    with app.app_context():
+        db.session.add(Invoice(number="PG-OTHER", invoice_date=date.today()))
+        db.session.commit()
+        start, _ = financial_year_bounds(financial_year(date.today()))
+        count = Invoice.query.filter(
+            (Invoice.invoice_date >= start) |
+            Invoice.invoice_date.is_(None)).count()
+    html = client.get("/invoices?per_page=2").get_data(as_text=True)
+    assert f"{count} Total" in html
+    assert "Older" in html
+
+
+def test_bad_cursor_starts_over(bills):
+    with app.app_context():
+        query = db.session.query(Invoice).filter(Invoice.id.in_(bills))
+        first, cursor = paging.page(query, Invoice.invoice_date, Invoice.id,
+                                    descending=True, size=5)
+        again, _ = paging.page(query, Invoice.invoice_date, Invoice.id,
+                               descending=True, cursor="not-a-cursor", size=5)
+        assert [i.id for i in again] == [i.id for i in first]
+        following, _ = paging.page(query, Invoice.invoice_date, Invoice.id,
+                                   descending=True, cursor=cursor, size=5)
+        assert not {i.id for i in following} & {i.id for i in first}
+
+
+def test_history_customer_filter_and_average(client, bills):
+    with app.app_context():
+        customer = Customer.query.filter_by(name="Pager A").one()
+        totals = [i.total_paise or 0 for i in Invoice.query.filter(
+            Invoice.number.like("PG-%"), Invoice.customer_id == customer.id)]
+        customer_id = customer.id
+    html = client.get(f"/invoice_history?search=pager&date_from=&per_page=2"
+                      f"&customer_id={customer_id}").get_data(as_text=True)
+    assert f"{len(totals)} found" in html
+    assert f"₹{sum(totals) / len(totals) / 100:.2f}" in html
+    # Only the chosen customer is rendered into the filter field
+    assert f'<option value="{customer_id}" selected>Pager A</option>' in html
+    assert "Pager B</option>" not in html
+
+
+def test_history_customer_name_link(client, bills):
+    with app.app_context():
+        customer_id = Customer.query.filter_by(name="Pager A").one().id
+    # A name matching one customer becomes that customer's id, so the
+    # filter field can clear or change it
+    resp = client.get("/invoice_history?customer=pager+a&date_from=")
+    assert resp.status_code == 302
+    assert f"customer_id={customer_id}" in resp.location
+    assert "customer=" not in resp.location.replace("customer_id=", "")
+
+    # Several matches filter by name for this view, but the form does
+    # not send the name again
+    html = client.get("/invoice_history?customer=pager&date_from=") \
+        .get_data(as_text=True)
+    assert 'name="customer"' not in html
+    assert "PG-000001" in html
@@ -0,0 +1,149 @@
+"""
+Invoice PDF render cache: an unchanged bill is served without rendering,
+a payment makes its PDF stale and the next open renders it again, and
+inputs rendered once are never rendered a second time.
+"""
+import os
+import time
+from datetime import date
+
+import pytest
+
+import metrics
+from app import (app, db, invoice_pdf_file, pdf_cache, Customer, Invoice,
+                 InvoiceItem, INVOICE_DIR, Product)
+from pdf_cache import PdfCache
+
+NUMBER = "RC-000001"
+
+
+def renders():
+    return metrics.PDF_RENDER_SECONDS.count(renderer='overlay')
+
+
+@pytest.fixture(scope="module")
+def bill():
+    with app.app_context():
+        product = Product(name="Render Cache Fan", barcode="RC0001",
+                          price=1500.0, tax=18.0)
+        customer = Customer(name="Render Cache Customer", phone="9333300001")
+        db.session.add_all([product, customer])
+        db.session.flush()
+        invoice = Invoice(number=NUMBER, customer_id=customer.id,
+                          invoice_date=date.today(), total_paise=150000)
+        db.session.add(invoice)
+        db.session.flush()
+        db.session.add(InvoiceItem(invoice_id=invoice.id, product_id=product.id,
+                                   qty=1, price=1500.0, tax=18.0,
+                                   line_total=1500.0))
+        db.session.commit()
+        yield invoice.id
+
+
+def test_unchanged_bill_is_not_rendered_again(client, bill):
+    before = renders()
+    first = client.get(f"/invoice_pdf/{NUMBER}")
+    assert first.status_code == 200 and first.data.startswith(b"%PDF")
+    assert renders() == before + 1
+    for _ in range(3):
+        resp = client.get(f"/invoice_pdf/{NUMBER}")
+        assert resp.data == first.data
+    assert renders() == before + 1
+    assert client.get(f"/invoice_pdf/{NUMBER}", headers={
+        "If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    # The published PDF is the cache entry itself
+    etag, _ = first.get_etag()
+    assert os.path.samefile(os.path.join(INVOICE_DIR, f"{NUMBER}.pdf"),
+                            pdf_cache.entry_path(etag))
+
+
+def test_payment_makes_pdf_stale(client, bill):
+    first = client.get(f"/invoice_pdf/{NUMBER}")
+    before = renders()
+    resp = client.post(f"/invoice/{bill}/add-payment",
+                       data={"amount": "500", "payment_date": "2025-06-01"})
+    assert resp.status_code in (200, 302)
+    # Nothing rendered until someone opens it
+    assert renders() == before
+
+    resp = client.get(f"/invoice_pdf/{NUMBER}",
+                      headers={"If-None-Match": first.headers["ETag"]})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != first.headers["ETag"]
+    assert renders() == before + 1
+    assert client.get(f"/invoice_pdf/{NUMBER}").headers["ETag"] == \
+        resp.headers["ETag"]
+    assert renders() == before + 1
+
+
+def test_identical_inputs_render_once(client, bill):
+    client.get(f"/invoice_pdf/{NUMBER}")
+    path = os.path.join(INVOICE_DIR, f"{NUMBER}.pdf")
+    os.remove(path)
+    before = renders()
+    # A lost file is put back from the cache
+    assert client.get(f"/invoice_pdf/{NUMBER}").status_code == 200
+    assert os.path.exists(path)
+    assert renders() == before
+
+    # Going back to inputs seen before links the earlier render
+    with app.app_context():
+        invoice = db.session.get(Invoice, bill)
+        customer = db.session.get(Customer, invoice.customer_id)
+        name = customer.name
+        customer.name = "Render Cache Renamed"
+        db.session.commit()
+        client.get(f"/invoice_pdf/{NUMBER}")
+        customer.name = name
+        db.session.commit()
+    client.get(f"/invoice_pdf/{NUMBER}")
+    assert renders() == before + 1
+
+
+def test_failed_render_keeps_last_pdf(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"))
+    path = str(tmp_path / "bill.pdf")
+
+    def render(output):
+        with open(output, "wb") as f:
+            f.write(b"%PDF one")
+        return True
+
+    assert cache.publish("a" * 64, path, render)
+    assert not cache.publish("b" * 64, path, lambda output: False)
+    assert open(path, "rb").read() == b"%PDF one"
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a" * 64 + ".pdf"]
+
+
+def test_prune_drops_unlinked_entries(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), prune_after=0)
+    path = str(tmp_path / "bill.pdf")
+
+    def render(output):
+        with open(output, "wb") as f:
+            f.write(b"%PDF " + os.path.basename(output).encode())
+        return True
+
+    cache.publish("a" * 64, path, render)
+    time.sleep(0.01)
+    cache.publish("b" * 64, path, render)
+    # The first render is no longer published anywhere
+    assert not os.path.exists(cache.entry_path("a" * 64))
+    assert cache.is_current("b" * 64, path)
+
+
+def test_fallback_render_is_not_cached(monkeypatch, bill):
+    import invoice_overlay
+
+    def missing(invoice, pdf_path=None):
+        raise ImportError("no overlay")
+
+    monkeypatch.setattr(invoice_overlay, "generate_invoice_pdf_overlay", missing)
+    with app.app_context():
+        invoice = db.session.get(Invoice, bill)
+        invoice.customer.name = "Render Cache Fallback"
+        path, key = invoice_pdf_file(invoice)
+        db.session.rollback()
+    assert path is None
+    assert not os.path.exists(pdf_cache.entry_path(key))
@@ -0,0 +1,205 @@
+"""
+Background PDF jobs: saving a bill commits and redirects without rendering,
+the job table drives rendering and auto-printing with retries, and the
+invoices list and status endpoint report progress.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+import metrics
+from app import (app, db, pdf_queue, AppSetting, Customer, Invoice,
+                 INVOICE_DIR, PdfJob, Product)
+
+
+@pytest.fixture(scope="module")
+def ids():
+    with app.app_context():
+        customer = Customer(name="Job Queue Customer", phone="9444400001")
+        product = Product(name="Job Queue Lamp", barcode="JQ0001",
+                          price=250.0, tax=0.0)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        return customer.id, product.id
+
+
+@pytest.fixture
+def auto_print():
+    with app.app_context():
+        AppSetting.set('AUTO_PRINT_AFTER_SAVE', 'true')
+    yield
+    with app.app_context():
+        AppSetting.set('AUTO_PRINT_AFTER_SAVE', 'false')
+
+
+@pytest.fixture
+def printer(monkeypatch):
+    """Printer that fails while .fail is set and records what it printed"""
+    class Printer:
+        fail = False
+        printed = []
+
+        def __call__(self, number, printer_name=None):
+            if self.fail:
+                return {"success": False, "message": "Printer offline"}
+            self.printed.append(number)
+            return {"success": True, "message": "Printed"}
+
+    fake = Printer()
+    monkeypatch.setattr(app_module, "print_invoice_directly", fake)
+    monkeypatch.setattr(pdf_queue, "retry_seconds", 0)
+    return fake
+
+
+def save(client, ids):
+    customer_id, product_id = ids
+    resp = client.post("/save_invoice", data={
+        "customer_id": customer_id,
+        "invoice_date": "2025-10-01",
+        "product_id[]": [product_id], "qty[]": ["2"], "discount[]": ["0"],
+        "tax[]": ["0"], "rate[]": ["250"], "description[]": [""],
+    })
+    assert resp.status_code == 302
+    with app.app_context():
+        invoice = Invoice.query.filter_by(customer_id=customer_id) \
+            .order_by(Invoice.id.desc()).first()
+        return invoice.id, invoice.number
+
+
+def status(client, invoice_id):
+    data = client.get(f"/pdf-jobs/status?invoice={invoice_id}").get_json()
+    return {kind: job["status"] for kind, job in data[str(invoice_id)].items()}
+
+
+def test_save_returns_before_rendering(client, ids):
+    renders = metrics.PDF_RENDER_SECONDS.count(renderer='overlay')
+    invoice_id, number = save(client, ids)
+    assert metrics.PDF_RENDER_SECONDS.count(renderer='overlay') == renders
+    assert status(client, invoice_id) == {"render": "queued"}
+    assert "PDF queued" in client.get("/invoices?fy=all").get_data(as_text=True)
+
+    assert pdf_queue.run_pending() >= 1
+    assert status(client, invoice_id) == {"render": "done"}
+    assert os.path.exists(os.path.join(INVOICE_DIR, f"{number}.pdf"))
+    assert "PDF ready" in client.get("/invoices?fy=all").get_data(as_text=True)
+
+
+def test_auto_print_retries_then_fails(client, ids, auto_print, printer):
+    printer.fail = True
+    invoice_id, number = save(client, ids)
+    assert status(client, invoice_id) == {"print": "queued"}
+    pdf_queue.run_pending()
+    with app.app_context():
+        job = PdfJob.query.filter_by(invoice_id=invoice_id).one()
+        assert job.status == "failed"
+        assert job.attempts == pdf_queue.max_attempts
+        assert job.last_error == "Printer offline"
+    html = client.get("/invoices?fy=all").get_data(as_text=True)
+    assert "Print failed" in html
+    assert f"/invoice/{invoice_id}/pdf-jobs/retry" in html
+
+    # Retry from the list once the printer is back
+    printer.fail = False
+    client.post(f"/invoice/{invoice_id}/pdf-jobs/retry")
+    assert status(client, invoice_id) == {"print": "queued"}
+    pdf_queue.run_pending()
+    assert status(client, invoice_id) == {"print": "done"}
+    assert printer.printed == [number]
+
+
+def test_failed_attempt_waits_before_retry(client, ids, auto_print, printer):
+    printer.fail = True
+    pdf_queue.retry_seconds = 60
+    invoice_id, _ = save(client, ids)
+    assert pdf_queue.run_pending() == 1
+    with app.app_context():
+        job = PdfJob.query.filter_by(invoice_id=invoice_id).one()
+        assert job.status == "queued" and job.attempts == 1
+        assert job.run_after > datetime.now() + timedelta(seconds=30)
+    # Not due yet
+    assert pdf_queue.run_pending() == 0
+
+
+def test_orphaned_job_is_taken_up_again(client, ids):
+    invoice_id, _ = save(client, ids)
+    with app.app_context():
+        job = PdfJob.query.filter_by(invoice_id=invoice_id).one()
+        # Claimed by a process that died mid-render
+        job.status = "running"
+        job.attempts = 1
+        job.started_at = datetime.now() - timedelta(
+            seconds=pdf_queue.lease_seconds + 1)
+        db.session.commit()
+    pdf_queue.run_pending()
+    assert status(client, invoice_id) == {"render": "done"}
+
+
+def test_worker_threads(client, ids):
+    pdf_queue.start(1)
+    try:
+        invoice_id, number = save(client, ids)
+        deadline = time.monotonic() + 20
+        while status(client, invoice_id)["render"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        pdf_queue.stop()
+    assert os.path.exists(os.path.join(INVOICE_DIR, f"{number}.pdf"))
+
+
+def test_deleting_invoice_drops_its_jobs(client, ids):
+    invoice_id, number = save(client, ids)
+    # Never on a GET a prefetcher or crawler might send
+    assert client.get(f"/delete_invoice/{number}").status_code == 405
+    with app.app_context():
+        assert db.session.get(Invoice, invoice_id) is not None
+    client.post(f"/delete_invoice/{number}")
+    with app.app_context():
+        assert PdfJob.query.filter_by(invoice_id=invoice_id).count() == 0
+
+
+def test_slow_job_keeps_its_lease(client, ids, monkeypatch):
+    pdf_queue.run_pending()
+    invoice_id, _ = save(client, ids)
+    perform = pdf_queue.perform
+    runs = []
+
+    def slow(job):
+        runs.append(job.id)
+        if len(runs) == 1:
+            # Well past the lease: the job is still this worker's
+            time.sleep(1)
+            with app.app_context():
+                assert pdf_queue._claim() is None
+        perform(job)
+
+    monkeypatch.setattr(pdf_queue, "lease_seconds", 0.3)
+    monkeypatch.setattr(pdf_queue, "perform", slow)
+    assert pdf_queue.run_pending() == 1
+    assert len(runs) == 1
+    assert status(client, invoice_id) == {"render": "done"}
+
+
+def test_taken_over_job_drops_its_result(client, ids, monkeypatch):
+    pdf_queue.run_pending()
+    invoice_id, _ = save(client, ids)
+    perform = pdf_queue.perform
+
+    def taken_over(job):
+        perform(job)
+        # Another worker claimed the job meanwhile and is still on it
+        with app.app_context():
+            PdfJob.query.filter_by(id=job.id).update({"attempts": 2})
+            db.session.commit()
+
+    monkeypatch.setattr(pdf_queue, "perform", taken_over)
+    pdf_queue.run_pending()
+    with app.app_context():
+        job = PdfJob.query.filter_by(invoice_id=invoice_id).one()
+        assert (job.status, job.attempts, job.finished_at) == \
+            ("running", 2, None)
+        db.session.delete(job)
+        db.session.commit()
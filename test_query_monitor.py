@@ -0,0 +1,51 @@
+"""
+Per-request query accounting: statements are counted against the request
+that ran them, repeats are folded by fingerprint and flagged as N+1, and
+the summary reaches the Server-Timing header and the admin debug page.
+"""
+import query_monitor
+from app import app, db, Customer
+
+
+def test_fingerprint_folds_literals_and_lists():
+    assert query_monitor.fingerprint(
+        "SELECT * FROM customer\n WHERE id IN (?, ?, ?) AND name = 'Shah' LIMIT 10"
+    ) == "SELECT * FROM customer WHERE id IN (...) AND name = ? LIMIT ?"
+    # Numbers inside names are left alone
+    assert query_monitor.fingerprint("SELECT anon_1.id FROM anon_1") == \
+        "SELECT anon_1.id FROM anon_1"
+
+
+def test_per_row_queries_are_flagged(caplog):
+    with app.app_context():
+        ids = [c.id for c in Customer.query.limit(3)]
+        if len(ids) < 3:
+            db.session.add_all(Customer(name=f"Monitor {n}") for n in range(3))
+            db.session.commit()
+            ids = [c.id for c in Customer.query.limit(3)]
+    with app.test_request_context("/loop"):
+        app.preprocess_request()
+        for _ in range(2):
+            for customer_id in ids:
+                db.session.expire_all()
+                db.session.get(Customer, customer_id)
+        stats = query_monitor.current()
+        assert stats.count >= 6
+        [(sql, times, _)] = stats.repeated(threshold=6)
+        assert times == 6 and "FROM customer" in sql
+        assert stats.header().endswith(", 1 repeated\"")
+        app.do_teardown_request()
+    assert any("N+1 suspect on GET /loop" in r.getMessage() for r in caplog.records)
+    assert query_monitor.recent()[0]["repeated"]
+
+
+def test_header_and_debug_page(client, admin_client):
+    resp = client.get("/customers")
+    assert resp.headers["Server-Timing"].startswith("db;dur=")
+    assert "desc=\"1 query\"" in resp.headers["Server-Timing"]
+    assert query_monitor.recent()[0]["endpoint"] == "customers"
+
+    assert client.get("/settings/queries").status_code == 302
+    html = admin_client.get("/settings/queries").get_data(as_text=True)
+    assert "/customers" in html
+    assert "N+1" in html
@@ -0,0 +1,255 @@
+"""
+EXPLAIN QUERY PLAN regression suite for the hot routes.
+Each test requests a page through the test client, captures the SELECTs
+the route actually runs (on the main and report engines) and fails if any
+of them falls back to a full table scan.
+"""
+import re
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import paging
+from app import (app, db, page_cache, report_engine, Customer, Invoice,
+                 InvoiceItem, Product)
+
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?(\w+)$")
+# Read whole on purpose: one row per archived financial year
+SMALL_TABLES = {"archived_year"}
+
+
+@pytest.fixture(scope="module")
+def ids():
+    """A customer with an outstanding balance, unpaid bills and a payment,
+    so the routes run every query they have"""
+    with app.app_context():
+        customer = Customer(name="Plan Ramesh", phone="9888800001",
+                            expected_next_payment_date=date.today())
+        product = Product(name="Plan Tube Light", barcode="QP0001",
+                          price=500.0, tax=0.0)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        customer_id, product_id = customer.id, product.id
+
+    client = app.test_client()
+    for _ in range(3):
+        client.post("/save_invoice", data={
+            "customer_id": customer_id,
+            "invoice_date": (date.today() - timedelta(days=10)).isoformat(),
+            "product_id[]": [product_id], "qty[]": ["4"], "discount[]": ["0"],
+            "tax[]": ["0"], "rate[]": ["500"], "description[]": [""],
+        })
+    with app.app_context():
+        invoice = Invoice.query.filter_by(customer_id=customer_id) \
+            .order_by(Invoice.id).first()
+        assert InvoiceItem.query.filter_by(invoice_id=invoice.id).count()
+        invoice_id = invoice.id
+    client.post(f"/invoice/{invoice_id}/add-payment", data={
+        "amount": "500", "payment_date": date.today().isoformat(),
+        "payment_method": "cash"})
+    return customer_id, invoice_id
+
+
+@contextmanager
+def captured():
+    """[(engine, statement, parameters)] of the SELECTs run in the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((conn.engine, statement, parameters))
+
+    with app.app_context():
+        engines = (db.engine, report_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+def query_plan(engine, statement, parameters):
+    """EXPLAIN QUERY PLAN rows (detail column) for a captured statement"""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[3] for row in rows]
+
+
+def route_plans(client, url, data=None):
+    """[(statement, plan)] for every SELECT the route runs"""
+    # A cached page would be served without running anything
+    page_cache.clear()
+    with captured() as statements:
+        if data is None:
+            resp = client.get(url)
+        else:
+            resp = client.post(url, data=data)
+    assert resp.status_code in (200, 302), url
+    with app.app_context():
+        return [(statement, query_plan(engine, statement, parameters))
+                for engine, statement, parameters in statements]
+
+
+def assert_no_full_scan(client, url, data=None, uses=(), lists=()):
+    """No SELECT of the route scans a whole table (other than the tables in
+    lists, which the page shows every row of), and each index in uses
+    drives at least one of them"""
+    plans = route_plans(client, url, data)
+    assert plans, f"{url} ran no queries"
+    allowed = SMALL_TABLES.union(lists)
+    for statement, plan in plans:
+        scanned = [(d, FULL_SCAN.match(d)) for d in plan]
+        # Reading a subquery's own result is expected: the materialized FTS
+        # hits of search.ranked(), or a union over archived years whose
+        # parts are searched by index
+        scans = [d for d, scan in scanned
+                 if scan and not d.endswith(("_hits", "_all_years"))
+                 and scan.group(2) not in allowed]
+        assert not scans, f"full table scan in plan of {statement}: {plan}"
+    details = [d for _, plan in plans for d in plan]
+    for index in uses:
+        assert any(index in d for d in details), \
+            f"{index} not used by {url}: {details}"
+
+
+# ---------- customers() ----------
+
+def test_customers_selected_customer_history(client, ids):
+    customer_id, _ = ids
+    assert_no_full_scan(client, f"/customers?customer_id={customer_id}",
+                        uses=["ix_invoice_customer_date_total_paise"],
+                        lists=["customer"])
+
+
+def test_customers_search_uses_fts_index(client, ids):
+    assert_no_full_scan(client, "/customers?search=ram+98",
+                        uses=["customer_fts"])
+
+
+def test_search_customers_uses_fts_index(client, ids):
+    assert_no_full_scan(client, "/search_customers?q=ramesh",
+                        uses=["customer_fts"])
+
+
+# ---------- invoice_history() ----------
+
+def test_invoice_history_date_range(client, ids):
+    assert_no_full_scan(
+        client, "/invoice_history?date_from=2025-04-01&date_to=2025-10-31",
+        uses=["ix_invoice_date_id"])
+
+
+def test_invoice_history_amount_range(client, ids):
+    assert_no_full_scan(
+        client, "/invoice_history?date_from=&date_to="
+                "&min_amount=1000&max_amount=5000&sort=amount_desc",
+        uses=["ix_invoice_total_paise", "ix_invoice_item_invoice_id"])
+
+
+def test_invoice_history_next_page(client, ids):
+    # paging.page() after a cursor: a row-value range on the date index
+    after = paging.encode_cursor([date(2025, 6, 1), 500])
+    assert_no_full_scan(
+        client, f"/invoice_history?date_from=2025-01-01&after={after}",
+        uses=["ix_invoice_date_id"])
+
+
+def test_invoice_history_customer(client, ids):
+    customer_id, _ = ids
+    assert_no_full_scan(client, f"/invoice_history?customer_id={customer_id}",
+                        uses=["ix_invoice_customer_date_total_paise"])
+
+
+def test_invoice_history_search_uses_fts_index(client, ids):
+    assert_no_full_scan(client, "/invoice_history?date_from=&search=INV",
+                        uses=["invoice_fts"])
+
+
+# ---------- khata_book() ----------
+
+def test_khata_book_outstanding_customers(client, ids):
+    assert_no_full_scan(client, "/khata-book",
+                        uses=["ix_customer_outstanding_paise",
+                              "ix_customer_expected_payment"])
+
+
+def test_khata_book_high_balance_filter(client, ids):
+    assert_no_full_scan(client, "/khata-book?balance_filter=high",
+                        uses=["ix_customer_outstanding_paise"])
+
+
+# ---------- customer_khata() / add_customer_payment() ----------
+
+def test_customer_khata(client, ids):
+    customer_id, _ = ids
+    assert_no_full_scan(client, f"/customer/{customer_id}/khata",
+                        uses=["ix_invoice_customer_date_total_paise",
+                              "ix_payment_invoice_date",
+                              "ix_ledger_customer_entry"])
+
+
+def test_customer_khata_statement_range(client, ids):
+    customer_id, _ = ids
+    assert_no_full_scan(
+        client, f"/customer/{customer_id}/khata?from=2025-10-01&to=2025-10-31",
+        uses=["ix_ledger_customer_entry"])
+
+
+def test_add_customer_payment_unpaid_invoices(client, ids):
+    customer_id, _ = ids
+    assert_no_full_scan(
+        client, f"/customer/{customer_id}/add-payment",
+        data={"amount": "100", "payment_date": date.today().isoformat(),
+              "payment_method": "cash"},
+        uses=["ix_invoice_customer_date_total_paise"])
+
+
+# ---------- invoice_details() / invoice_payments() ----------
+
+def test_invoice_details(client, ids):
+    _, invoice_id = ids
+    assert_no_full_scan(client, f"/invoice/{invoice_id}",
+                        uses=["ix_invoice_item_invoice_id",
+                              "ix_payment_invoice_date"])
+
+
+def test_invoice_payments(client, ids):
+    _, invoice_id = ids
+    assert_no_full_scan(client, f"/invoice/{invoice_id}/payments",
+                        uses=["ix_payment_invoice_date"])
+
+
+# ---------- archived years ----------
+
+@pytest.fixture(scope="module")
+def archived(ids, archive_year):
+    customer_id, _ = ids
+    with app.app_context():
+        db.session.add(Invoice(number="QP-ARCHIVED-1", customer_id=customer_id,
+                               invoice_date=date(2019, 6, 1), total_paise=200000,
+                               total_paid_paise=200000))
+        db.session.commit()
+        archive_year("2019-20")
+
+
+def test_invoice_history_search_across_archives(client, archived):
+    # Cleared dates reach every archived year; each file's bills are
+    # looked up by id from its own index
+    assert_no_full_scan(
+        client, "/invoice_history?date_from=&search=QP",
+        uses=["fy2019_20.invoice_fts",
+              "SEARCH fy2019_20.invoice USING INTEGER PRIMARY KEY",
+              "SEARCH invoice USING INTEGER PRIMARY KEY"])
+
+
+def test_invoice_history_amount_range_across_archives(client, archived):
+    assert_no_full_scan(
+        client, "/invoice_history?date_from=&date_to="
+                "&min_amount=1000&max_amount=5000",
+        uses=["SEARCH fy2019_20.invoice USING INDEX ix_invoice_total_paise",
+              "SEARCH invoice USING INDEX ix_invoice_total_paise"])
@@ -0,0 +1,77 @@
+"""
+Full-text search: the FTS5 indexes follow inserts, renames and deletes
+through their triggers, and the search endpoints rank prefix matches.
+"""
+import search as fts
+from app import app, db, Customer, Invoice, Product
+
+
+def texts(response):
+    return [row["text"] for row in response.get_json()]
+
+
+def test_match_expression_quotes_words():
+    assert fts.match_expression('INV-2025 "ram') == '"INV-2025"* """ram"*'
+    assert fts.match_expression("  -- ") is None
+
+
+def test_customer_index_follows_writes(client):
+    with app.app_context():
+        customer = Customer(name="Ramesh Searchwala", phone="9812300001")
+        db.session.add_all([customer, Customer(name="रमेश खोजवाला")])
+        db.session.commit()
+        customer_id = customer.id
+
+    assert "Ramesh Searchwala (9812300001)" in texts(
+        client.get("/search_customers?q=searchw"))
+    assert "Ramesh Searchwala (9812300001)" in texts(
+        client.get("/search_customers?q=98123"))
+    assert "रमेश खोजवाला ()" in texts(client.get("/search_customers?q=खोज"))
+
+    with app.app_context():
+        db.session.get(Customer, customer_id).name = "Suresh Searchwala"
+        db.session.commit()
+    assert not any("Ramesh" in t for t in texts(
+        client.get("/search_customers?q=ramesh searchw")))
+    assert "Suresh Searchwala (9812300001)" in texts(
+        client.get("/search_customers?q=suresh"))
+
+    client.post(f"/delete_customer/{customer_id}")
+    assert texts(client.get("/search_customers?q=suresh searchw")) == []
+
+
+def test_product_search_ranks_name_over_description(client):
+    with app.app_context():
+        db.session.add_all([
+            Product(name="Cable Tie Pack", description="for wirecraft boards",
+                    price=40.0),
+            Product(name="Wirecraft Switch", price=90.0),
+        ])
+        db.session.commit()
+    assert texts(client.get("/search_products?q=wirecr")) == [
+        "Wirecraft Switch", "Cable Tie Pack"]
+
+
+def test_invoice_search_by_customer_and_notes(client):
+    with app.app_context():
+        customer = Customer(name="Invoice Searchkumar")
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(Invoice(number="SRCH-000777", customer_id=customer.id,
+                               notes="deliver to godown"))
+        db.session.commit()
+        customer_id = customer.id
+
+    assert [r["number"] for r in client.get(
+        "/search_invoices?q=searchkum").get_json()] == ["SRCH-000777"]
+    assert [r["number"] for r in client.get(
+        "/search_invoices?q=SRCH-0007").get_json()] == ["SRCH-000777"]
+
+    with app.app_context():
+        db.session.get(Customer, customer_id).name = "Invoice Findkumar"
+        db.session.commit()
+    assert [r["number"] for r in client.get(
+        "/search_invoices?q=findkum").get_json()] == ["SRCH-000777"]
+
+    page = client.get("/invoice-history?search=godown&date_from=").data.decode()
+    assert "SRCH-000777" in page
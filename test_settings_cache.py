@@ -0,0 +1,70 @@
+"""
+AppSetting cache: reads come from memory, any committed write to the
+settings table is seen at once in this process and, through the stamp
+file, by other processes on the same database.
+"""
+import pytest
+from sqlalchemy import event
+
+from app import app, db, app_settings, AppSetting, SETTINGS_STAMP
+from settings_cache import SettingsCache
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    with app.app_context():
+        yield
+
+
+def statements_during(func):
+    seen = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    return seen
+
+
+def test_reads_come_from_memory():
+    AppSetting.set("CACHE_TEST", "one")
+    assert AppSetting.get("CACHE_TEST") == "one"
+    assert statements_during(lambda: [AppSetting.get("CACHE_TEST")
+                                      for _ in range(100)]) == []
+    assert AppSetting.get("CACHE_MISSING", "fallback") == "fallback"
+
+
+def test_writes_are_seen_at_once():
+    AppSetting.set("CACHE_TEST", "one")
+    assert AppSetting.get("CACHE_TEST") == "one"
+    version = app_settings.version
+    AppSetting.set("CACHE_TEST", "two")
+    assert app_settings.version > version
+    assert AppSetting.get("CACHE_TEST") == "two"
+
+    # Writes that bypass set() count too, rolled back ones do not
+    AppSetting.query.filter_by(key="CACHE_TEST").delete()
+    db.session.rollback()
+    assert AppSetting.get("CACHE_TEST") == "two"
+    AppSetting.query.filter_by(key="CACHE_TEST").delete()
+    db.session.commit()
+    assert AppSetting.get("CACHE_TEST") is None
+    db.session.add(AppSetting(key="CACHE_TEST", value="three"))
+    db.session.commit()
+    assert AppSetting.get("CACHE_TEST") == "three"
+
+
+def test_other_process_sees_change_through_stamp():
+    AppSetting.set("CACHE_TEST", "before")
+    # A second process on the same database keeps its own cache
+    other = SettingsCache(
+        lambda: db.session.query(AppSetting.key, AppSetting.value).all(),
+        SETTINGS_STAMP, check_every=0)
+    assert other.get("CACHE_TEST") == "before"
+    assert statements_during(lambda: other.get("CACHE_TEST")) == []
+    AppSetting.set("CACHE_TEST", "after")
+    assert other.get("CACHE_TEST") == "after"
@@ -0,0 +1,67 @@
+"""
+Slow-query log: statements over the threshold are written with their
+parameters, route and query plan, and the settings view ranks them.
+"""
+import json
+
+from sqlalchemy import text
+
+import slow_queries
+from app import app, db, AppSetting
+
+COUNT_TO = text("WITH RECURSIVE c(n) AS (SELECT 1 UNION ALL "
+                "SELECT n + 1 FROM c WHERE n < :upto) SELECT count(*) FROM c")
+
+
+def last_entry():
+    with open(slow_queries.log_path, encoding="utf-8") as f:
+        return json.loads(f.readlines()[-1])
+
+
+def test_slow_statement_is_logged_with_plan(monkeypatch):
+    monkeypatch.setattr(slow_queries, "threshold_ms", 1)
+    with app.test_request_context("/khata-book?page=2"):
+        app.preprocess_request()
+        assert db.session.execute(COUNT_TO, {"upto": 200000}).scalar() == 200000
+        entry = last_entry()
+        app.do_teardown_request()
+    assert entry["ms"] >= 1
+    assert entry["parameters"] == [200000]
+    assert entry["route"] == "GET /khata-book?page=2"
+    assert entry["plan"] and "SCAN" in " ".join(entry["plan"])
+    assert entry["fingerprint"].startswith("WITH RECURSIVE c(n) AS (SELECT ? UNION")
+
+
+def test_fast_statements_are_not_logged(monkeypatch):
+    monkeypatch.setattr(slow_queries, "threshold_ms", 60_000)
+    with app.app_context():
+        before = sum(1 for _ in slow_queries.entries())
+        db.session.execute(COUNT_TO, {"upto": 10}).scalar()
+        assert sum(1 for _ in slow_queries.entries()) == before
+
+
+def test_settings_view_ranks_by_total_time(admin_client, monkeypatch):
+    monkeypatch.setattr(slow_queries, "threshold_ms", 1)
+    with app.app_context():
+        for _ in range(2):
+            db.session.execute(COUNT_TO, {"upto": 100000}).scalar()
+        db.session.execute(COUNT_TO, {"upto": 50000}).scalar()
+    worst = slow_queries.worst()
+    assert worst == sorted(worst, key=lambda row: row["total_ms"], reverse=True)
+    top = next(row for row in worst if row["fingerprint"].startswith("WITH RECURSIVE"))
+    assert top["count"] >= 3
+
+    html = admin_client.get("/settings/slow-queries").get_data(as_text=True)
+    assert "WITH RECURSIVE" in html
+    assert app.test_client().get("/settings/slow-queries").status_code == 302
+
+
+def test_threshold_is_saved(admin_client):
+    resp = admin_client.post("/settings/slow-queries", data={"threshold": "400"})
+    assert resp.status_code == 302
+    assert slow_queries.threshold_ms == 400
+    with app.app_context():
+        assert AppSetting.get(slow_queries.SETTING_KEY) == "400"
+    admin_client.post("/settings/slow-queries", data={"threshold": "0"})
+    assert slow_queries.threshold_ms == 400
+    slow_queries.set_threshold(slow_queries.DEFAULT_THRESHOLD_MS)